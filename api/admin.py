@@ -35,8 +35,8 @@ class ClimateAdmin(admin.ModelAdmin):
 
 @admin.register(Diagnostic)
 class DiagnosticAdmin(admin.ModelAdmin):
-    list_display = ('user', 'plant_type', 'status', 'created_at')
-    list_filter = ('status', 'created_at')
+    list_display = ('user', 'plant_type', 'status', 'model_version', 'created_at')
+    list_filter = ('status', 'model_version', 'created_at')
     search_fields = ('user__username', 'plant_type__name')
     readonly_fields = ('result',)
 
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connects the Celery publish/prerun/postrun and catalog invalidation signal handlers
+        from . import metrics, scheduling, signals  # noqa: F401
+        from . import tracing
+
+        tracing.configure()
@@ -0,0 +1,152 @@
+"""
+JWT authentication without a user query per request.
+
+Access tokens carry the user's identity claims (username, role, is_staff),
+written when they are issued and re-read from the database on every refresh,
+so they are at most ACCESS_TOKEN_LIFETIME old. With JWT_TRUST_CLAIMS,
+read-only requests build request.user from those claims alone. Every other
+request reads the user from a short-lived cache entry (AUTH_USER_CACHE_SECONDS,
+dropped whenever the user is saved or deleted, see api/signals.py) before
+falling back to the database.
+
+Users built from claims or from the cache are model instances whose other
+fields (and the password) are deferred: reading one loads it from the database.
+The RS256 verifying key is parsed once per process by simplejwt's token backend.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .metrics import record_cache
+
+
+IDENTITY_CLAIMS = ('username', 'role', 'is_staff')
+# Everything cached except the password hash, which stays deferred
+CACHED_USER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'full_name', 'phone_number', 'province',
+    'role', 'is_staff', 'is_superuser', 'is_active', 'date_joined', 'last_login',
+)
+
+
+def identity_claims(user):
+    return {claim: getattr(user, claim) for claim in IDENTITY_CLAIMS}
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def _user_from_fields(values):
+    # Fields missing from `values` are deferred and load on first access
+    User = get_user_model()
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+def get_cached_user(user_id):
+    if not settings.AUTH_USER_CACHE_SECONDS:
+        return None
+    try:
+        values = cache.get(user_cache_key(user_id))
+    except Exception as e:
+        print(f"Could not read user {user_id} from the cache: {e}")
+        return None
+    record_cache('auth_user', hit=values is not None)
+    return _user_from_fields(values) if values is not None else None
+
+
+def set_cached_user(user):
+    if not settings.AUTH_USER_CACHE_SECONDS:
+        return
+    try:
+        cache.set(
+            user_cache_key(user.pk),
+            {field: getattr(user, field) for field in CACHED_USER_FIELDS},
+            timeout=settings.AUTH_USER_CACHE_SECONDS,
+        )
+    except Exception as e:
+        print(f"Could not write user {user.pk} to the cache: {e}")
+
+
+def forget_cached_user(user_id):
+    try:
+        cache.delete(user_cache_key(user_id))
+    except Exception as e:
+        print(f"Could not drop user {user_id} from the cache: {e}")
+
+
+class IdentityRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the user's current identity claims."""
+    user = None
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.user = user
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = self.user
+        if user is None:
+            user = get_user_model().objects.filter(
+                **{jwt_settings.USER_ID_FIELD: self.payload.get(jwt_settings.USER_ID_CLAIM)}
+            ).first()
+        if user is not None:
+            for claim, value in identity_claims(user).items():
+                access[claim] = value
+        return access
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication reading the user from token claims or the user cache first."""
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        if settings.JWT_TRUST_CLAIMS and request.method in SAFE_METHODS:
+            user = self.get_claims_user(validated_token)
+            if user is not None:
+                return user, validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_claims_user(self, validated_token):
+        if jwt_settings.USER_ID_CLAIM not in validated_token or any(c not in validated_token for c in IDENTITY_CLAIMS):
+            return None  # issued before identity claims existed
+        values = {jwt_settings.USER_ID_FIELD: validated_token[jwt_settings.USER_ID_CLAIM], 'is_active': True}
+        values.update({claim: validated_token[claim] for claim in IDENTITY_CLAIMS})
+        return _user_from_fields(values)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            set_cached_user(user)
+            return user
+
+        # Same checks as JWTAuthentication.get_user on the cached copy
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
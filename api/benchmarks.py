@@ -0,0 +1,244 @@
+"""
+Helpers shared by the benchmark management commands (bench_api,
+bench_inference): deterministic seed data, synthetic images and models, and
+timing of scripted load.
+"""
+import io
+import os
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image
+from .caching import bump_catalog_version
+from .inference import DEFAULT_DISEASE_LABELS
+from .model_stats import latency_summary
+from .models import Climate, Conversation, Diagnostic, Message, PlantType, SoilType
+from .serializers import DiagnosticSerializer, MessageSerializer
+
+
+BENCH_PASSWORD = 'bench-password'
+
+
+def synthetic_image(size=(640, 480), seed=0, format='JPEG'):
+    """A noisy leaf-green photo-sized image, encoded like a phone upload."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.normal((70, 130, 50), 40, size=(size[1], size[0], 3)).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=format, quality=90)
+    return buffer.getvalue()
+
+
+def synthetic_disease_model(path, architecture='tiny', input_size=(300, 300), seed=0):
+    """
+    Save an untrained Keras classifier over the disease labels. 'tiny' is a
+    single convolution, for measuring everything but the model; 'efficientnet'
+    is EfficientNetB3 (random weights), close to the production model's cost.
+    """
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    shape = (*input_size, 3)
+    classes = len(DEFAULT_DISEASE_LABELS)
+    if architecture == 'efficientnet':
+        model = tf.keras.applications.EfficientNetB3(weights=None, input_shape=shape, classes=classes)
+    elif architecture == 'tiny':
+        inputs = tf.keras.Input(shape)
+        x = tf.keras.layers.Rescaling(1 / 255)(inputs)
+        x = tf.keras.layers.Conv2D(8, 3, strides=2, activation='relu')(x)
+        x = tf.keras.layers.GlobalAveragePooling2D()(x)
+        outputs = tf.keras.layers.Dense(classes, activation='softmax')(x)
+        model = tf.keras.Model(inputs, outputs)
+    else:
+        raise ValueError(f"Unknown synthetic architecture '{architecture}'")
+    model.save(path)
+    return path
+
+
+def seed_data(users=20, conversations=3, messages=100, diagnostics=10, seed=0):
+    """
+    Create a reproducible dataset: catalog entries, users sharing one password
+    (hashed once), conversations with long histories and completed diagnostics
+    pointing at a single stored image. Returns the created users.
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+
+    plant_types = PlantType.objects.bulk_create([
+        PlantType(name=f'Plant {i}', scientific_name=f'Plantus {i}', description='Seeded plant ' * 20, emoji='🌱')
+        for i in range(10)
+    ])
+    for model, count in ((SoilType, 5), (Climate, 5)):
+        for i in range(count):
+            fields = {'name': f'{model.__name__} {i}', 'description': 'Seeded entry ' * 20}
+            if model is SoilType:
+                fields['characteristics'] = {'ph': round(rng.uniform(5, 8), 1), 'texture': 'loam'}
+            else:
+                fields.update(temperature_range='15-30', rainfall_range='800-1500', humidity_range='50-90')
+            entry = model.objects.create(**fields)
+            entry.suitable_plants.set(rng.sample(plant_types, 4))
+    bump_catalog_version()  # bulk_create sends no signals
+
+    password = make_password(BENCH_PASSWORD)
+    created = User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com', password=password,
+             full_name=f'Bench User {i}', phone_number='+25761000000', province='Bujumbura')
+        for i in range(users)
+    ])
+
+    # Through the media storage, so seeded diagnostics also work with S3
+    image_name = default_storage.save('diagnostics/bench.jpg', ContentFile(synthetic_image(seed=seed)))
+
+    for user in created:
+        user_conversations = Conversation.objects.bulk_create([
+            Conversation(user=user, title=f'Conversation {i}') for i in range(conversations)
+        ])
+        Message.objects.bulk_create([
+            Message(conversation=conversation, role='user' if i % 2 == 0 else 'assistant',
+                    content=' '.join(rng.choices(['mildiou', 'feuille', 'sol', 'engrais', 'pluie'], k=rng.randint(10, 80))))
+            for conversation in user_conversations for i in range(messages)
+        ])
+        Diagnostic.objects.bulk_create([
+            Diagnostic(user=user, plant_type=rng.choice(plant_types), image=image_name, status='completed',
+                       result={'disease_name': 'Healthy', 'confidence': 0.9, 'explanation': 'Seeded result'})
+            for _ in range(diagnostics)
+        ])
+    return created
+
+
+def synthetic_responses(messages=500, diagnostics=100, seed=0):
+    """
+    Response bodies shaped like the largest API responses (a long message
+    history, a page of diagnostics with their result blobs), produced by the
+    real serializers from unsaved instances, so no database is needed.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    labels = list(DEFAULT_DISEASE_LABELS.values())
+    words = ['mildiou', 'feuille', 'sol', 'engrais', 'pluie', 'récolte', 'maïs', 'haricot', 'arrosage']
+    message_rows = [
+        Message(id=i + 1, conversation_id=1, role='user' if i % 2 == 0 else 'assistant',
+                content=' '.join(rng.choices(words, k=rng.randint(10, 120))), created_at=now, updated_at=now)
+        for i in range(messages)
+    ]
+    diagnostic_rows = [
+        Diagnostic(id=i + 1, user_id=1, plant_type_id=1, image='diagnostics/bench.jpg', status='completed',
+                   model_version='bench', created_at=now, updated_at=now, result={
+                       'disease_name': rng.choice(labels),
+                       'confidence': rng.random(),
+                       'top_predictions': [
+                           {'label': label, 'confidence': rng.random()} for label in labels
+                       ],
+                       'explanation': ' '.join(rng.choices(words, k=200)),
+                   })
+        for i in range(diagnostics)
+    ]
+    return {
+        'messages': {'count': messages, 'results': MessageSerializer(message_rows, many=True).data},
+        'diagnostics': {'count': diagnostics, 'results': DiagnosticSerializer(diagnostic_rows, many=True).data},
+    }
+
+
+def run_load(request, requests, concurrency=1, warmup=0):
+    """
+    Call ``request(i)`` `requests` times from `concurrency` threads after
+    `warmup` untimed calls. A call fails when it raises or returns a response
+    with an error status.
+    """
+    for i in range(warmup):
+        request(i)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    response = request(i)
+                    error = getattr(response, 'status_code', 200) >= 400 and f'HTTP {response.status_code}'
+                except Exception as e:
+                    error = repr(e)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if error:
+                        errors.append(error)
+        finally:
+            connections.close_all()  # connections are per thread
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'duration_s': duration,
+        'throughput_rps': requests / duration if duration else None,
+        'latency': latency_summary(latencies),
+    }
+
+
+def environment():
+    """What a result depends on besides the code, recorded next to it."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'cpu_count': os.cpu_count(),
+        'database': connections['default'].vendor,
+        'tabular_model_runtime': settings.TABULAR_MODEL_RUNTIME,
+        'disease_model_runtime': settings.DISEASE_MODEL_RUNTIME,
+        'llm_backend': settings.LLM_BACKEND,
+        'media_storage': settings.MEDIA_STORAGE,
+        'password_hasher': get_hasher().algorithm,
+        'password_hash_iterations': getattr(get_hasher(), 'iterations', None),
+    }
+
+
+def compare(results, baseline):
+    """One line per scenario present in both runs: p50/p99 latency and throughput change."""
+    lines = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or not previous['latency'].get('count') or not current['latency'].get('count'):
+            continue
+        changes = [
+            f"{metric} {previous['latency'][metric]:.1f} -> {current['latency'][metric]:.1f} ms "
+            f"({(current['latency'][metric] / previous['latency'][metric] - 1):+.0%})"
+            for metric in ('p50_ms', 'p99_ms')
+        ]
+        changes.append(
+            f"throughput {previous['throughput_rps']:.1f} -> {current['throughput_rps']:.1f} rps "
+            f"({(current['throughput_rps'] / previous['throughput_rps'] - 1):+.0%})"
+        )
+        lines.append(f"{name}: " + ', '.join(changes))
+    return lines
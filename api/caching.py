@@ -0,0 +1,57 @@
+"""
+Versioned read cache for the reference catalogs (plant types, soil types,
+climates).
+
+Every cached response is keyed by the current catalog version, a timestamp
+(ns) kept in the shared cache. Saving or deleting a catalog entry, or
+changing a suitable_plants relation, sets a new version (see api/signals.py),
+so stale entries are never read again and simply expire. The version also
+serves as the ETag and Last-Modified of catalog responses.
+
+Bulk operations (bulk_create, QuerySet.update) send no signals: call
+bump_catalog_version() after them. Cache failures are printed and the
+request falls back to the database.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import record_cache
+
+
+CATALOG_VERSION_KEY = 'catalog-version'
+
+
+def catalog_version():
+    try:
+        version = cache.get(CATALOG_VERSION_KEY)
+        if version is None:
+            cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+            version = cache.get(CATALOG_VERSION_KEY)
+        return version
+    except Exception as e:
+        print(f"Could not read the catalog version: {e}")
+        return None
+
+
+def bump_catalog_version():
+    try:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+    except Exception as e:
+        print(f"Could not bump the catalog version: {e}")
+
+
+def get_cached(key):
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        print(f"Could not read {key} from the cache: {e}")
+        return None
+    record_cache('catalog', hit=value is not None)
+    return value
+
+
+def set_cached(key, value):
+    try:
+        cache.set(key, value, timeout=settings.CATALOG_CACHE_TTL_SECONDS)
+    except Exception as e:
+        print(f"Could not write {key} to the cache: {e}")
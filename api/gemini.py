@@ -1,10 +1,12 @@
+import asyncio
 from django.conf import settings
 import google.generativeai as genai
+from .metrics import stage
 
 
 geminiKey = settings.GEMINI_API_KEY
 
-if not geminiKey:
+if not geminiKey and settings.LLM_BACKEND != 'stub':
     raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
 
 
@@ -33,27 +35,41 @@ async def get_gemini_response(
     model_name: str = DEFAULT_MODEL_NAME,
 ) -> str:
     try:
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            system_instruction=system_message
-        )
+        with stage('llm') as span:
+            if settings.LLM_BACKEND == 'stub':
+                span.set_attribute('gen_ai.system', 'stub')
+                return await _generate_stub(user_message)
+            span.set_attributes({'gen_ai.system': 'gemini', 'gen_ai.request.model': model_name})
+            return await _generate(user_message, chat_history, model_name)
+    except Exception as e:
+        error_message = f"Erreur lors de la communication avec l'API Gemini : {e}"
+        print(error_message)
+        raise Exception(error_message)
 
-        chat = model.start_chat(history=chat_history if chat_history else [])
 
-        response_stream = await chat.send_message_async(user_message, stream=True)
+async def _generate(user_message, chat_history, model_name):
+    model = genai.GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_message
+    )
 
-        full_response_text = ""
-        async for chunk in response_stream:
-            if chunk.text:
-                full_response_text += chunk.text
+    chat = model.start_chat(history=chat_history if chat_history else [])
 
-        if not full_response_text:
-            print(f"Warning: Gemini API returned an empty response for: '{user_message}'")
-            return "Désolé, je n'ai pas pu générer de réponse pour le moment. Veuillez réessayer."
+    response_stream = await chat.send_message_async(user_message, stream=True)
 
-        return full_response_text
+    full_response_text = ""
+    async for chunk in response_stream:
+        if chunk.text:
+            full_response_text += chunk.text
 
-    except Exception as e:
-        error_message = f"Erreur lors de la communication avec l'API Gemini : {e}"
-        print(error_message)
-        raise Exception(error_message)
\ No newline at end of file
+    if not full_response_text:
+        print(f"Warning: Gemini API returned an empty response for: '{user_message}'")
+        return "Désolé, je n'ai pas pu générer de réponse pour le moment. Veuillez réessayer."
+
+    return full_response_text
+
+
+async def _generate_stub(user_message):
+    # Local stand-in for benchmarks and offline development: fixed latency, no network call
+    await asyncio.sleep(settings.LLM_STUB_LATENCY_MS / 1000)
+    return f"Réponse simulée ({len(user_message)} caractères reçus)."
@@ -0,0 +1,68 @@
+"""
+Idempotency-Key support for the POST endpoints that start analyses.
+
+A client that retries a request (timeout, flaky mobile network) sends the
+same Idempotency-Key header. The first request is processed and its
+successful response kept for IDEMPOTENCY_TTL_SECONDS; retries get that
+response back (with Idempotent-Replayed: true) instead of creating and
+analyzing a second diagnostic. A retry arriving while the first request is
+still running gets 409. Failed requests are forgotten so they can be
+retried with the same key. Keys are scoped to the user and the path.
+"""
+import functools
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+
+IN_PROGRESS = 'in-progress'
+
+
+def _forget(key):
+    try:
+        cache.delete(key)
+    except Exception as e:
+        print(f"Could not drop idempotency key {key}: {e}")
+
+
+def idempotent(view_method):
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return view_method(self, request, *args, **kwargs)
+
+        key = f'idempotency:{request.user.pk}:{request.path}:{idempotency_key}'
+        try:
+            claimed = cache.add(key, IN_PROGRESS, timeout=settings.IDEMPOTENCY_TTL_SECONDS)
+            stored = None if claimed else cache.get(key)
+        except Exception as e:
+            print(f"Could not check idempotency key {key}: {e}")
+            return view_method(self, request, *args, **kwargs)
+
+        if stored == IN_PROGRESS:
+            return Response(
+                {'detail': 'A request with this Idempotency-Key is still in progress.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if stored is not None:
+            response = Response(stored['data'], status=stored['status'])
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            _forget(key)
+            raise
+        if response.status_code >= 400:
+            _forget(key)
+            return response
+        try:
+            cache.set(key, {'status': response.status_code, 'data': response.data}, timeout=settings.IDEMPOTENCY_TTL_SECONDS)
+        except Exception as e:
+            print(f"Could not store the response for idempotency key {key}: {e}")
+        return response
+
+    return wrapper
@@ -0,0 +1,399 @@
+import gc
+import json
+import os
+import random
+import threading
+import time
+from typing import NamedTuple
+import joblib
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from . import model_registry
+from .metrics import record_cache, stage
+
+
+DISEASE_INPUT_SIZE = (300, 300)  # (width, height) when the model does not declare it
+DISEASE_INPUT_FORMATS = ('image/jpeg', 'image/png', 'image/webp')
+
+
+def preprocess_image(uploaded_image, target_size=DISEASE_INPUT_SIZE):
+    with stage('image_decode'):
+        img = Image.open(uploaded_image)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')  # Convert to RGB (drops alpha channel)
+    with stage('image_preprocess'):
+        if img.size != tuple(target_size):
+            img = img.resize(target_size)  # Resize to model input size; skipped for client-resized uploads
+        img_array = np.array(img)  # shape: (height, width, 3)
+        # Optional normalization: img_array = img_array / 255.0
+        img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
+    return img_array
+
+
+class TreeEnsembleModel:
+    """
+    Flattened NumPy evaluator for scikit-learn decision trees and forests.
+
+    Every tree of the ensemble is packed into the same contiguous node arrays,
+    so a prediction is one vectorised lookup per tree level instead of a trip
+    through the estimator's validation and joblib dispatch machinery.
+    """
+
+    ARRAY_NAMES = ('children_left', 'children_right', 'feature', 'threshold', 'value', 'roots', 'classes')
+
+    def __init__(self, children_left, children_right, feature, threshold, value, roots, classes):
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        trees = getattr(estimator, 'estimators_', [estimator])
+        if not hasattr(estimator, 'classes_') or not all(hasattr(tree, 'tree_') for tree in trees):
+            raise ValueError(f"Unsupported estimator type: {type(estimator).__name__}")
+
+        children_left, children_right, feature, threshold, value, roots = [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            t = tree.tree_
+            if t.n_outputs != 1:
+                raise ValueError("Multi-output trees are not supported")
+            is_leaf = t.children_left == -1
+            children_left.append(np.where(is_leaf, -1, t.children_left + offset))
+            children_right.append(np.where(is_leaf, -1, t.children_right + offset))
+            # Leaves carry feature -2 in sklearn; point them at a valid column
+            feature.append(np.where(is_leaf, 0, t.feature))
+            threshold.append(t.threshold)
+            # Normalise so old (counts) and new (fractions) sklearn trees agree
+            leaf_value = t.value[:, 0, :]
+            totals = leaf_value.sum(axis=1, keepdims=True)
+            value.append(leaf_value / np.where(totals == 0, 1, totals))
+            roots.append(offset)
+            offset += t.node_count
+
+        classes = np.asarray(estimator.classes_)
+        if classes.dtype == object:
+            classes = classes.astype(str)
+
+        return cls(
+            children_left=np.concatenate(children_left).astype(np.int32),
+            children_right=np.concatenate(children_right).astype(np.int32),
+            feature=np.concatenate(feature).astype(np.int32),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            value=np.concatenate(value).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=classes,
+        )
+
+    @classmethod
+    def load(cls, path):
+        # One .npy per array so they can be memory-mapped read-only: every
+        # worker process then shares the same physical pages via the page cache.
+        return cls(*(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in cls.ARRAY_NAMES))
+
+    def save(self, path):
+        arrays = (
+            self.children_left, self.children_right, self.feature,
+            self.threshold, self.value, self.roots, self.classes_,
+        )
+        os.makedirs(path, exist_ok=True)
+        for name, array in zip(self.ARRAY_NAMES, arrays):
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+
+    def predict_proba(self, X):
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.tile(self.roots, (X.shape[0], 1))
+        while True:
+            left = self.children_left[nodes]
+            active = left != -1
+            if not active.any():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(active, np.where(go_left, left, self.children_right[nodes]), nodes)
+        return self.value[nodes].mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def load_tabular_model(estimator_path, flat_path):
+    """Load a tabular model using the runtime selected by TABULAR_MODEL_RUNTIME."""
+    if settings.TABULAR_MODEL_RUNTIME == 'numpy':
+        if os.path.exists(flat_path):
+            return TreeEnsembleModel.load(flat_path)
+        print(f"Flattened model {flat_path} not found, falling back to scikit-learn")
+    # joblib also reads plain pickle files
+    return joblib.load(estimator_path)
+
+
+class TFLiteModel:
+    """
+    Runs a converted TFLite disease model behind the same ``predict`` call as
+    the Keras model, handling quantized inputs/outputs transparently.
+    """
+
+    def __init__(self, path, num_threads=None):
+        import tensorflow as tf
+
+        # Loading from a path lets TFLite mmap the flatbuffer instead of copying it
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._refresh_details()
+        # An interpreter owns its tensors, so calls must not interleave
+        self._lock = threading.Lock()
+
+    def _refresh_details(self):
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+
+    @property
+    def input_shape(self):
+        return (None, *self.input_details['shape'][1:])
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch)
+        with self._lock:
+            if tuple(self.input_details['shape']) != batch.shape:
+                self.interpreter.resize_tensor_input(self.input_details['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._refresh_details()
+
+            dtype = self.input_details['dtype']
+            scale, zero_point = self.input_details['quantization']
+            if np.issubdtype(dtype, np.integer) and scale:
+                batch = np.round(batch / scale + zero_point)
+            self.interpreter.set_tensor(self.input_details['index'], batch.astype(dtype))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_details['index'])
+
+        scale, zero_point = self.output_details['quantization']
+        if np.issubdtype(output.dtype, np.integer) and scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def configure_tensorflow_threads():
+    """Apply INFERENCE_*_THREADS; must run before TensorFlow executes anything."""
+    import tensorflow as tf
+
+    try:
+        if settings.INFERENCE_INTRA_OP_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(settings.INFERENCE_INTRA_OP_THREADS)
+        if settings.INFERENCE_INTER_OP_THREADS:
+            tf.config.threading.set_inter_op_parallelism_threads(settings.INFERENCE_INTER_OP_THREADS)
+    except RuntimeError as e:
+        print(f"Could not configure TensorFlow threads: {e}")
+
+
+def load_disease_model(keras_path, tflite_path):
+    """Load the disease model using the runtime selected by DISEASE_MODEL_RUNTIME."""
+    if settings.DISEASE_MODEL_RUNTIME == 'tflite':
+        if os.path.exists(tflite_path):
+            return TFLiteModel(tflite_path, num_threads=settings.INFERENCE_INTRA_OP_THREADS or None)
+        print(f"TFLite model {tflite_path} not found, falling back to Keras")
+
+    from tensorflow.keras.models import load_model
+
+    configure_tensorflow_threads()
+    return load_model(keras_path)
+
+
+DEFAULT_DISEASE_LABELS = {"0": "Early Blight", "1": "Late Blight", "2": "Healthy"}
+
+
+class LoadedModel(NamedTuple):
+    name: str
+    version: str
+    model: object
+    labels: dict
+
+
+def load_version(name, version):
+    paths = model_registry.artifact_paths(name, version)
+    if name == 'disease':
+        model = load_disease_model(paths['model'], paths['tflite'])
+        labels = DEFAULT_DISEASE_LABELS
+    else:
+        model = load_tabular_model(paths['model'], paths['flat'])
+        labels = {}
+
+    if paths.get('labels') and os.path.exists(paths['labels']):
+        with open(paths['labels']) as f:
+            labels = json.load(f)
+    return LoadedModel(name, version, model, labels)
+
+
+def preprocess_stored_image(image, target_size=DISEASE_INPUT_SIZE):
+    """preprocess_image on an ImageField file, read through its storage (local disk or S3)."""
+    with image.open('rb') as f:
+        return preprocess_image(f, target_size)
+
+
+def input_size(bundle):
+    """(width, height) of the images `bundle`'s model takes."""
+    try:
+        _, height, width, _ = bundle.model.input_shape
+    except (AttributeError, TypeError, ValueError):
+        return DISEASE_INPUT_SIZE
+    if not height or not width:
+        return DISEASE_INPUT_SIZE
+    return int(width), int(height)
+
+
+def input_spec(bundle):
+    """What clients should upload for `bundle`: images this size are not resized by the workers."""
+    width, height = input_size(bundle)
+    return {
+        'model': bundle.name,
+        'version': bundle.version,
+        'width': width,
+        'height': height,
+        'channels': 3,
+        'color_mode': 'RGB',
+        'resize': 'stretch',  # the whole photo is scaled to width x height, aspect ratio not kept
+        'formats': list(DISEASE_INPUT_FORMATS),
+        'max_bytes': settings.UPLOAD_MAX_BYTES,
+    }
+
+
+# TensorFlow runtimes own thread pools that do not survive fork(), so every
+# worker process builds its own instance on first use.
+FORK_UNSAFE_MODELS = {'disease'}
+
+
+class _Entry:
+    __slots__ = ('owner', 'bundle', 'checked_at')
+
+    def __init__(self, owner, bundle):
+        self.owner = owner
+        self.bundle = bundle
+        self.checked_at = time.monotonic()
+
+
+_models = {}
+_model_locks = {
+    (name, candidate): threading.Lock()
+    for name in model_registry.ARTIFACTS for candidate in (False, True)
+}
+
+
+def _registry_version(name, candidate):
+    if not candidate:
+        return model_registry.active_version(name)
+    config = model_registry.candidate(name)
+    if config is None:
+        raise RuntimeError(f"No candidate configured for model '{name}'")
+    return config['version']
+
+
+def get_model(name, candidate=False):
+    """
+    Return the LoadedModel currently active (or under trial) for `name` in this process.
+
+    The registry's pointer is re-read at most every
+    MODEL_REGISTRY_POLL_SECONDS. A new version is loaded while other threads
+    keep serving the previous one, then swapped in with a single assignment,
+    so in-flight predictions finish on the model they started with.
+    """
+    key = (name, candidate)
+    owner = os.getpid() if name in FORK_UNSAFE_MODELS else None
+    entry = _models.get(key)
+    if entry is not None and entry.owner != owner:
+        entry = None
+    if entry is not None and time.monotonic() - entry.checked_at < settings.MODEL_REGISTRY_POLL_SECONDS:
+        record_cache('model', hit=True)
+        return entry.bundle
+
+    version = _registry_version(name, candidate)
+    if entry is not None and entry.bundle.version == version:
+        entry.checked_at = time.monotonic()
+        record_cache('model', hit=True)
+        return entry.bundle
+    record_cache('model', hit=False)
+
+    lock = _model_locks[key]
+    if not lock.acquire(blocking=entry is None):
+        return entry.bundle  # another thread is loading the new version
+    try:
+        latest = _models.get(key)
+        if latest is not None and latest.owner == owner and latest.bundle.version == version:
+            return latest.bundle
+        try:
+            bundle = load_version(name, version)
+        except Exception as e:
+            if entry is None:
+                raise RuntimeError(f"Model '{name}' could not be loaded: {e}") from e
+            print(f"Error loading {name} model version {version}, still serving {entry.bundle.version}: {e}")
+            entry.checked_at = time.monotonic()
+            return entry.bundle
+        _models[key] = _Entry(owner, bundle)
+        return bundle
+    finally:
+        lock.release()
+
+
+def refresh_model(name):
+    """Re-read the ACTIVE pointer now if this process already serves `name`."""
+    entry = _models.get((name, False))
+    if entry is None:
+        return None
+    entry.checked_at = float('-inf')
+    return get_model(name)
+
+
+_candidate_configs = {}
+
+
+def candidate_config(name):
+    """The registry's candidate trial for `name`, re-read at the registry poll interval."""
+    checked_at, config = _candidate_configs.get(name, (float('-inf'), None))
+    if time.monotonic() - checked_at >= settings.MODEL_REGISTRY_POLL_SECONDS:
+        config = model_registry.candidate(name)
+        _candidate_configs[name] = (time.monotonic(), config)
+    return config
+
+
+def route_model(name):
+    """
+    Pick the model answering this call.
+
+    Returns ``(bundle, shadow_version)``. In 'ab' mode the candidate answers a
+    fraction of the calls; in 'shadow' mode the active model always answers
+    and, for a fraction of the calls, `shadow_version` tells the caller to
+    replay the input on the candidate off the critical path.
+    """
+    config = candidate_config(name)
+    if config and random.random() < config['fraction']:
+        if config['mode'] == 'shadow':
+            return get_model(name), config['version']
+        try:
+            return get_model(name, candidate=True), None
+        except RuntimeError as e:
+            print(e)
+    return get_model(name), None
+
+
+def preload_models():
+    """
+    Load fork-safe models in the parent process (gunicorn master with
+    preload_app, Celery worker before the pool starts) so forked children
+    inherit them copy-on-write instead of deserializing their own copy.
+    """
+    import tensorflow  # noqa: F401  shared library pages, safe to import before fork
+
+    for name in model_registry.ARTIFACTS:
+        if name in FORK_UNSAFE_MODELS:
+            continue
+        try:
+            get_model(name)
+        except RuntimeError as e:
+            print(e)
+    # Keep the collector from touching (and so copying) every inherited page
+    gc.freeze()
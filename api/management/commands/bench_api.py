@@ -0,0 +1,193 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from celery import current_app
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from api import benchmarks, model_registry
+from api.inference import DEFAULT_DISEASE_LABELS
+from api.models import Diagnostic
+from api.tasks import analyze_plant_image
+
+
+SCENARIOS = (
+    'login', 'plant_types', 'soil_types', 'conversations', 'messages', 'diagnostics',
+    'diagnostic_create', 'predict_disease', 'analyze_pipeline',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and run scripted load against the main endpoints and "
+        "the diagnostic pipeline (Celery eager, stub LLM), writing throughput and latency "
+        "percentiles to JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+        parser.add_argument('--output', default='bench_api.json', help='Where to write the JSON results')
+        parser.add_argument('--baseline', help='Previous results file to compare against')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads per scenario')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--conversations', type=int, default=3, help='Conversations per user')
+        parser.add_argument('--messages', type=int, default=100, help='Messages per conversation')
+        parser.add_argument('--diagnostics', type=int, default=10, help='Diagnostics per user')
+        parser.add_argument('--hash-iterations', type=int,
+                            help='PASSWORD_HASH_ITERATIONS for the seeded users and the login scenario')
+        parser.add_argument('--llm-latency-ms', type=int, default=0, help='Latency of the stub LLM')
+        parser.add_argument('--disease-model', choices=('tiny', 'efficientnet'), default='tiny',
+                            help='Synthetic disease model architecture')
+        parser.add_argument('--real-models', action='store_true',
+                            help='Serve the configured models instead of a synthetic disease model')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        workdir = tempfile.mkdtemp(prefix='bench-api-')
+        overrides = {
+            'MEDIA_ROOT': os.path.join(workdir, 'media'),
+            'LLM_BACKEND': 'stub',
+            'LLM_STUB_LATENCY_MS': options['llm_latency_ms'],
+            # Measure the endpoints, not the per-user throttles
+            'REST_FRAMEWORK': {
+                **settings.REST_FRAMEWORK,
+                'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+            },
+            'ADMISSION_QUEUE_LIMITS': {},
+        }
+        if options['hash_iterations']:
+            overrides['PASSWORD_HASH_ITERATIONS'] = options['hash_iterations']
+        if not options['real_models']:
+            overrides['MODEL_REGISTRY_PATH'] = os.path.join(workdir, 'registry')
+
+        # A file-backed test database (even for SQLite) so client threads share it
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        setup_test_environment()  # allows the test client's 'testserver' host
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        always_eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+        try:
+            with override_settings(**overrides):
+                if not options['real_models']:
+                    self.publish_synthetic_model(workdir, options)
+                results = self.run(options)
+        finally:
+            current_app.conf.task_always_eager = always_eager
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            for line in benchmarks.compare(results, baseline):
+                self.stdout.write(line)
+
+    def publish_synthetic_model(self, workdir, options):
+        model_path = benchmarks.synthetic_disease_model(
+            os.path.join(workdir, 'disease.keras'), architecture=options['disease_model'], seed=options['seed'],
+        )
+        labels_path = os.path.join(workdir, 'labels.json')
+        with open(labels_path, 'w') as f:
+            json.dump(DEFAULT_DISEASE_LABELS, f)
+        manifest = model_registry.publish('disease', {'model': model_path, 'labels': labels_path}, 'bench')
+        model_registry.activate('disease', manifest['version'])
+
+    def run(self, options):
+        users = benchmarks.seed_data(
+            users=options['users'], conversations=options['conversations'],
+            messages=options['messages'], diagnostics=options['diagnostics'], seed=options['seed'],
+        )
+        self.users = users
+        self.auth = [f'Bearer {RefreshToken.for_user(user).access_token}' for user in users]
+        self.conversations = [list(user.conversations.values_list('id', flat=True)) for user in users]
+        self.diagnostics = [list(user.diagnostics.values_list('id', flat=True)) for user in users]
+        self.plant_type_id = users[0].diagnostics.first().plant_type_id
+        self.image = benchmarks.synthetic_image(seed=options['seed'])
+        self.local = threading.local()
+
+        results = {'environment': benchmarks.environment(), 'options': options, 'scenarios': {}}
+        for name in options['scenarios'] or SCENARIOS:
+            scenario = getattr(self, f'scenario_{name}')
+            summary = benchmarks.run_load(
+                scenario, options['requests'], concurrency=options['concurrency'], warmup=options['warmup'],
+            )
+            results['scenarios'][name] = summary
+            latency = summary['latency']
+            self.stdout.write(
+                f"{name:<18} {summary['throughput_rps']:8.1f} req/s  p50 {latency.get('p50_ms', 0):8.1f} ms  "
+                f"p99 {latency.get('p99_ms', 0):8.1f} ms  errors {summary['errors']}"
+            )
+            if summary['first_error']:
+                self.stderr.write(f"  first error: {summary['first_error']}")
+        return results
+
+    @property
+    def client(self):
+        # APIClient keeps per-request state, so each load thread gets its own
+        if not hasattr(self.local, 'client'):
+            self.local.client = APIClient()
+        return self.local.client
+
+    def user_index(self, i):
+        return i % len(self.users)
+
+    def upload(self):
+        return SimpleUploadedFile('leaf.jpg', self.image, content_type='image/jpeg')
+
+    def scenario_login(self, i):
+        user = self.users[self.user_index(i)]
+        return self.client.post('/api/v1/login/', {'username': user.username, 'password': benchmarks.BENCH_PASSWORD}, format='json')
+
+    def scenario_plant_types(self, i):
+        return self.client.get('/api/v1/plant-types/', HTTP_AUTHORIZATION=self.auth[self.user_index(i)])
+
+    def scenario_soil_types(self, i):
+        return self.client.get('/api/v1/soil-types/', HTTP_AUTHORIZATION=self.auth[self.user_index(i)])
+
+    def scenario_conversations(self, i):
+        return self.client.get('/api/v1/conversations/', HTTP_AUTHORIZATION=self.auth[self.user_index(i)])
+
+    def scenario_messages(self, i):
+        u = self.user_index(i)
+        conversation_id = self.conversations[u][i % len(self.conversations[u])]
+        return self.client.get(f'/api/v1/conversations/{conversation_id}/messages/', HTTP_AUTHORIZATION=self.auth[u])
+
+    def scenario_diagnostics(self, i):
+        return self.client.get('/api/v1/diagnostics/', HTTP_AUTHORIZATION=self.auth[self.user_index(i)])
+
+    def scenario_diagnostic_create(self, i):
+        # Upload plus the whole analysis, which runs eagerly inside the request
+        return self.client.post(
+            '/api/v1/diagnostics/', {'plant_type': self.plant_type_id, 'image': self.upload()},
+            format='multipart', HTTP_AUTHORIZATION=self.auth[self.user_index(i)],
+        )
+
+    def scenario_predict_disease(self, i):
+        return self.client.post(
+            '/api/v1/ml/predict_disease/', {'image': self.upload()},
+            format='multipart', HTTP_AUTHORIZATION=self.auth[self.user_index(i)],
+        )
+
+    def scenario_analyze_pipeline(self, i):
+        u = self.user_index(i)
+        diagnostic_id = self.diagnostics[u][i % len(self.diagnostics[u])]
+        Diagnostic.objects.filter(pk=diagnostic_id).update(status='pending')  # queued, as after POST analyze
+        analyze_plant_image.apply(args=(diagnostic_id,), throw=True)
@@ -0,0 +1,185 @@
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from api import benchmarks, model_registry
+from api.inference import load_disease_model, preprocess_image
+from api.management.commands.export_disease_model import convert_to_tflite
+from api.model_stats import latency_summary
+
+
+RUNTIMES = ('keras', 'tflite')
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def resolution_list(value):
+    try:
+        return [tuple(int(v) for v in size.split('x')) for size in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected sizes like 640x480,1280x960")
+
+
+def time_calls(call, iterations, warmup=2):
+    for _ in range(warmup):
+        call()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+class Command(BaseCommand):
+    help = (
+        "Sweep image resolutions, batch sizes, thread counts and runtimes for the disease "
+        "model and report images/sec and per-image latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runtimes', default=','.join(RUNTIMES), help='Comma separated: keras,tflite')
+        parser.add_argument('--batch-sizes', type=int_list, default=[1, 2, 4, 8, 16])
+        parser.add_argument('--threads', type=int_list, default=[1, 2, 4], help='Intra-op threads per inference call')
+        parser.add_argument('--resolutions', type=resolution_list, default=[(300, 300), (640, 480), (1280, 960), (4032, 3024)],
+                            help='Upload sizes decoded and resized by preprocess_image (300x300 is not resized)')
+        parser.add_argument('--iterations', type=int, default=10, help='Timed calls per configuration')
+        parser.add_argument('--quantize', choices=['none', 'float16', 'dynamic'], default='float16',
+                            help='Quantization of the TFLite model converted when no export exists')
+        parser.add_argument('--synthetic', choices=['efficientnet', 'tiny'], default='efficientnet',
+                            help='Architecture used when no real disease model is available')
+        parser.add_argument('--output', default='bench_inference.json')
+        parser.add_argument('--seed', type=int, default=0)
+        # Internal: one (runtime, threads) measurement in a fresh process, since
+        # TensorFlow's thread pools cannot be resized once created
+        parser.add_argument('--child', nargs=3, metavar=('RUNTIME', 'THREADS', 'MODEL_PATH'), help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['child']:
+            runtime, threads, model_path = options['child']
+            self.stdout.write(json.dumps(self.measure(runtime, int(threads), model_path, options)))
+            return
+
+        runtimes = options['runtimes'].split(',')
+        unknown = set(runtimes) - set(RUNTIMES)
+        if unknown:
+            raise CommandError(f"Unknown runtimes: {', '.join(sorted(unknown))}")
+
+        results = {
+            'environment': benchmarks.environment(),
+            'options': {k: v for k, v in options.items() if k != 'child'},
+            'preprocess': self.bench_preprocess(options),
+            'inference': [],
+        }
+        with tempfile.TemporaryDirectory() as workdir:
+            model_paths, results['model'] = self.model_paths(runtimes, workdir, options)
+            for runtime in [r for r in runtimes if r in model_paths]:
+                for threads in options['threads']:
+                    rows = self.run_child(runtime, threads, model_paths[runtime], options)
+                    results['inference'].extend(rows)
+                    for row in rows:
+                        self.stdout.write(
+                            f"{runtime:<7} threads {threads:>2}  batch {row['batch_size']:>3}  "
+                            f"{row['images_per_s']:8.1f} img/s  {row['ms_per_image']:8.2f} ms/img  "
+                            f"p99 batch {row['batch_latency']['p99_ms']:8.1f} ms"
+                        )
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def bench_preprocess(self, options):
+        rows = []
+        for width, height in options['resolutions']:
+            upload = benchmarks.synthetic_image((width, height), seed=options['seed'])
+            durations = time_calls(lambda: preprocess_image(io.BytesIO(upload)), options['iterations'])
+            summary = latency_summary(durations)
+            rows.append({'resolution': f'{width}x{height}', 'jpeg_bytes': len(upload), 'latency': summary})
+            self.stdout.write(f"preprocess {width}x{height:<6} p50 {summary['p50_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms")
+        return rows
+
+    def model_paths(self, runtimes, workdir, options):
+        """Model path per runtime to benchmark: the active disease model, or a synthetic one when it is missing.
+
+        A missing TFLite export is converted from the Keras model for this run; the
+        tflite runtime is skipped when that conversion fails.
+        """
+        version = model_registry.active_version('disease')
+        paths = model_registry.artifact_paths('disease', version)
+        if os.path.exists(paths['model']):
+            model_paths, model = {'keras': paths['model']}, {'source': version}
+            if 'tflite' in runtimes and os.path.exists(paths['tflite']):
+                model_paths['tflite'] = paths['tflite']
+            elif 'tflite' in runtimes:
+                self.stdout.write(f"No TFLite export for disease model {version}, converting {paths['model']} ({options['quantize']})")
+                try:
+                    model_paths['tflite'] = self.convert(paths['model'], workdir, options)
+                    model['quantize'] = options['quantize']
+                except Exception as e:
+                    self.stdout.write(self.style.WARNING(f"Skipping tflite, converting {paths['model']} failed: {e}"))
+            return model_paths, model
+
+        self.stdout.write(f"No disease model artifacts found, using a synthetic {options['synthetic']} model")
+        keras_path = benchmarks.synthetic_disease_model(
+            os.path.join(workdir, 'disease.keras'), architecture=options['synthetic'], seed=options['seed'],
+        )
+        model_paths = {'keras': keras_path}
+        if 'tflite' in runtimes:
+            model_paths['tflite'] = self.convert(keras_path, workdir, options)
+        return model_paths, {'source': f"synthetic-{options['synthetic']}", 'quantize': options['quantize']}
+
+    def convert(self, keras_path, workdir, options):
+        from tensorflow.keras.models import load_model
+
+        tflite_path = os.path.join(workdir, 'disease.tflite')
+        with open(tflite_path, 'wb') as f:
+            f.write(convert_to_tflite(load_model(keras_path), options['quantize'], sample=None))
+        return tflite_path
+
+    def run_child(self, runtime, threads, model_path, options):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_inference',
+            '--child', runtime, str(threads), model_path,
+            '--batch-sizes', ','.join(map(str, options['batch_sizes'])),
+            '--iterations', str(options['iterations']),
+            '--seed', str(options['seed']),
+        ]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise CommandError(f"{runtime} with {threads} threads failed:\n{completed.stderr}")
+        # The measurement is the last line; TensorFlow may log before it
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def measure(self, runtime, threads, model_path, options):
+        with override_settings(
+            DISEASE_MODEL_RUNTIME=runtime,
+            INFERENCE_INTRA_OP_THREADS=threads,
+        ):
+            model = load_disease_model(model_path, model_path)
+        height, width = model.input_shape[1:3]
+        rng = np.random.default_rng(options['seed'])
+
+        rows = []
+        for batch_size in options['batch_sizes']:
+            batch = rng.integers(0, 256, size=(batch_size, height, width, 3)).astype(np.uint8)
+            durations = time_calls(lambda: model.predict(batch, verbose=0), options['iterations'])
+            total = sum(durations)
+            rows.append({
+                'runtime': runtime,
+                'threads': threads,
+                'batch_size': batch_size,
+                'images_per_s': batch_size * len(durations) / total,
+                'ms_per_image': total / (batch_size * len(durations)) * 1000,
+                'batch_latency': latency_summary(durations),
+            })
+        return rows
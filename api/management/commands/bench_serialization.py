@@ -0,0 +1,80 @@
+import io
+import json
+import time
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from api import benchmarks
+from api.parsers import ORJSONParser
+from api.renderers import MessagePackRenderer, ORJSONRenderer
+
+
+RENDERERS = {
+    'json': JSONRenderer,
+    'orjson': ORJSONRenderer,
+    'msgpack': MessagePackRenderer,
+}
+PARSERS = {
+    'json': JSONParser,
+    'orjson': ORJSONParser,
+}
+
+
+def throughput(call, size, iterations, warmup=3):
+    for _ in range(warmup):
+        call()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call()
+    duration = time.perf_counter() - start
+    return {
+        'ops_per_s': iterations / duration,
+        'mean_ms': duration / iterations * 1000,
+        'mb_per_s': size * iterations / duration / 1e6,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering and parsing throughput of the JSON (stdlib and orjson) and "
+        "MessagePack encoders on the largest API responses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='bench_serialization.json', help='Where to write the JSON results')
+        parser.add_argument('--messages', type=int, default=500, help='Messages in the conversation history body')
+        parser.add_argument('--diagnostics', type=int, default=100, help='Diagnostics in the list body')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed calls per encoder and body')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        payloads = benchmarks.synthetic_responses(
+            messages=options['messages'], diagnostics=options['diagnostics'], seed=options['seed'],
+        )
+        results = {'environment': benchmarks.environment(), 'options': options, 'render': {}, 'parse': {}}
+
+        for payload_name, data in payloads.items():
+            for name, renderer_class in RENDERERS.items():
+                renderer = renderer_class()
+                body = renderer.render(data)
+                summary = throughput(lambda: renderer.render(data), len(body), options['iterations'])
+                summary['bytes'] = len(body)
+                results['render'][f'{payload_name}/{name}'] = summary
+                self.stdout.write(
+                    f"render {payload_name:<12} {name:<8} {summary['ops_per_s']:9.1f} ops/s  "
+                    f"{summary['mb_per_s']:8.1f} MB/s  {len(body):>9} bytes"
+                )
+
+            body = JSONRenderer().render(data)
+            for name, parser_class in PARSERS.items():
+                parser = parser_class()
+                summary = throughput(lambda: parser.parse(io.BytesIO(body)), len(body), options['iterations'])
+                results['parse'][f'{payload_name}/{name}'] = summary
+                self.stdout.write(
+                    f"parse  {payload_name:<12} {name:<8} {summary['ops_per_s']:9.1f} ops/s  "
+                    f"{summary['mb_per_s']:8.1f} MB/s"
+                )
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
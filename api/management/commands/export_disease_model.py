@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.inference import TFLiteModel, configure_tensorflow_threads, preprocess_image
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def load_sample(images_dir, target_size, count, seed):
+    """Preprocessed sample images, or random pixels when no directory is given."""
+    if images_dir:
+        paths = sorted(
+            os.path.join(images_dir, name) for name in os.listdir(images_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )[:count]
+        if not paths:
+            raise CommandError(f"No images found in {images_dir}")
+        return np.concatenate([preprocess_image(path, target_size) for path in paths])
+
+    rng = np.random.default_rng(seed)
+    width, height = target_size
+    return rng.integers(0, 256, size=(count, height, width, 3)).astype(np.uint8)
+
+
+def convert_to_tflite(keras_model, quantize, sample):
+    """TFLite flatbuffer for `keras_model`; int8 calibrates on `sample`."""
+    import tensorflow as tf
+
+    # from_keras_model() trips over Keras 3 models on TF 2.16, go through a SavedModel export instead
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        keras_model.export(saved_model_dir, verbose=False)
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        if quantize != 'none':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantize == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantize == 'int8':
+            converter.representative_dataset = lambda: ([image[None, ...].astype(np.float32)] for image in sample)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        return converter.convert()
+
+
+def per_image_latency(predict, sample):
+    predict(sample[:1])  # warm-up
+    start = time.perf_counter()
+    for image in sample:
+        predict(image[None, ...])
+    return (time.perf_counter() - start) / len(sample) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert best_model.keras to a (quantized) TFLite model for CPU inference "
+        "and report prediction parity against the Keras model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantize', choices=['none', 'float16', 'dynamic', 'int8'], default='float16',
+                            help='float16 weights, dynamic-range int8 weights, or full int8 (calibrated on the sample)')
+        parser.add_argument('--images', help='Directory of real plant images used for calibration and parity')
+        parser.add_argument('--samples', type=int, default=32, help='Number of images used for the parity check')
+        parser.add_argument('--min-agreement', type=float, default=0.95, help='Minimum top-1 agreement required to write the model')
+        parser.add_argument('--output', default=settings.DISEASE_TFLITE_MODEL_PATH)
+        parser.add_argument('--report', help='Write the parity report to this JSON file')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        from tensorflow.keras.models import load_model
+
+        configure_tensorflow_threads()
+        keras_model = load_model(settings.DISEASE_MODEL_PATH)
+        # (width, height), the order preprocess_image and inference.input_size() use
+        height, width = keras_model.input_shape[1:3]
+        target_size = (width, height)
+        sample = load_sample(options['images'], target_size, options['samples'], options['seed'])
+
+        tflite_bytes = convert_to_tflite(keras_model, options['quantize'], sample)
+
+        tmp_path = f"{options['output']}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(tflite_bytes)
+            tflite_model = TFLiteModel(tmp_path, num_threads=settings.INFERENCE_INTRA_OP_THREADS or None)
+
+            keras_preds = keras_model.predict(sample, verbose=0)
+            tflite_preds = tflite_model.predict(sample)
+            report = {
+                'quantize': options['quantize'],
+                'samples': len(sample),
+                'synthetic_sample': not options['images'],
+                'top1_agreement': float(np.mean(keras_preds.argmax(axis=1) == tflite_preds.argmax(axis=1))),
+                'max_abs_diff': float(np.max(np.abs(keras_preds - tflite_preds))),
+                'keras_ms_per_image': per_image_latency(lambda batch: keras_model.predict(batch, verbose=0), sample),
+                'tflite_ms_per_image': per_image_latency(tflite_model.predict, sample),
+                'keras_size_bytes': os.path.getsize(settings.DISEASE_MODEL_PATH),
+                'tflite_size_bytes': len(tflite_bytes),
+            }
+
+            self.stdout.write(json.dumps(report, indent=2))
+            if options['report']:
+                with open(options['report'], 'w') as f:
+                    json.dump(report, f, indent=2)
+
+            if report['top1_agreement'] < options['min_agreement']:
+                raise CommandError("Parity check failed, TFLite model not written")
+
+            os.replace(tmp_path, options['output'])
+        finally:
+            # Left behind by a failed parity check, or by an interpreter that could not load it
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
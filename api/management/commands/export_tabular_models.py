@@ -0,0 +1,89 @@
+import time
+import joblib
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.inference import TreeEnsembleModel
+
+
+TABULAR_MODELS = {
+    'crop': ('CROP_MODEL_PATH', 'CROP_MODEL_FLAT_PATH'),
+    'fertilizer': ('FERTILIZER_MODEL_PATH', 'FERTILIZER_MODEL_FLAT_PATH'),
+}
+
+
+def synthetic_sample(model, n_features, n_samples, rng):
+    """Draw rows spanning the split thresholds the trees actually use."""
+    sample = rng.uniform(0, 1, size=(n_samples, n_features))
+    is_split = model.children_left != -1
+    for column in range(n_features):
+        thresholds = model.threshold[is_split & (model.feature == column)]
+        if thresholds.size:
+            low, high = thresholds.min(), thresholds.max()
+            margin = max(high - low, 1.0) * 0.1
+            sample[:, column] = rng.uniform(low - margin, high + margin, size=n_samples)
+    return sample
+
+
+def single_row_latency(predict, rows, repeat=200):
+    start = time.perf_counter()
+    for i in range(repeat):
+        predict(rows[i % len(rows)][None, :])
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the scikit-learn crop/fertilizer models to flattened NumPy tree "
+        "ensembles and verify prediction parity before writing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help=f"Models to export: {', '.join(sorted(TABULAR_MODELS))} (default: all)")
+        parser.add_argument('--samples', type=int, default=2000, help='Number of synthetic rows used for the parity check')
+        parser.add_argument('--sample-file', help='CSV of held-out feature rows to use instead of synthetic rows')
+        parser.add_argument('--tolerance', type=float, default=1e-6, help='Maximum allowed probability difference')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        unknown = set(options['models']) - set(TABULAR_MODELS)
+        if unknown:
+            raise CommandError(f"Unknown models: {', '.join(sorted(unknown))}")
+
+        failures = []
+        for name in options['models'] or sorted(TABULAR_MODELS):
+            source_setting, target_setting = TABULAR_MODELS[name]
+            try:
+                self.export(name, getattr(settings, source_setting), getattr(settings, target_setting), options)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"[{name}] {e}"))
+                failures.append(name)
+
+        if failures:
+            raise CommandError(f"Export failed for: {', '.join(failures)}")
+
+    def export(self, name, source_path, target_path, options):
+        estimator = joblib.load(source_path)
+        flat = TreeEnsembleModel.from_estimator(estimator)
+
+        if options['sample_file']:
+            sample = np.loadtxt(options['sample_file'], delimiter=',', ndmin=2)
+        else:
+            rng = np.random.default_rng(options['seed'])
+            sample = synthetic_sample(flat, estimator.n_features_in_, options['samples'], rng)
+
+        agreement = float(np.mean(estimator.predict(sample) == flat.predict(sample)))
+        proba_diff = float(np.max(np.abs(estimator.predict_proba(sample) - flat.predict_proba(sample))))
+        sklearn_ms = single_row_latency(estimator.predict, sample)
+        flat_ms = single_row_latency(flat.predict, sample)
+
+        self.stdout.write(
+            f"[{name}] rows={len(sample)} agreement={agreement:.4%} max_proba_diff={proba_diff:.2e} "
+            f"single-row latency: sklearn={sklearn_ms:.3f}ms numpy={flat_ms:.3f}ms"
+        )
+
+        if agreement < 1.0 or proba_diff > options['tolerance']:
+            raise CommandError("Parity check failed, flattened model not written")
+
+        flat.save(target_path)
+        self.stdout.write(self.style.SUCCESS(f"[{name}] Wrote {target_path}"))
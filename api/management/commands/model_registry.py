@@ -0,0 +1,100 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from api import model_registry
+from api.model_registry import ARTIFACTS, CANDIDATE_MODES, LEGACY_VERSION, RegistryError
+from api.model_stats import model_stats
+
+
+class Command(BaseCommand):
+    help = "List, publish, verify, activate and trial versions of the ML models."
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        subparsers.add_parser('list', help='Show versions and the active one for every model')
+
+        publish = subparsers.add_parser('publish', help='Copy artifacts into a new version directory')
+        publish.add_argument('name', choices=sorted(ARTIFACTS))
+        publish.add_argument('--version', help='Version id (default: UTC timestamp)')
+        publish.add_argument('--model', help='Estimator (.joblib/.pkl) or Keras (.keras) file')
+        publish.add_argument('--flat', help='Flattened tree ensemble directory (crop/fertilizer)')
+        publish.add_argument('--tflite', help='TFLite model (disease)')
+        publish.add_argument('--labels', help='Label mapping JSON')
+        publish.add_argument('--from-settings', action='store_true',
+                             help='Publish the artifacts found at the legacy settings paths')
+        publish.add_argument('--activate', action='store_true', help='Activate the new version once published')
+
+        verify = subparsers.add_parser('verify', help='Check a version against its manifest checksums')
+        verify.add_argument('name', choices=sorted(ARTIFACTS))
+        verify.add_argument('version')
+
+        activate = subparsers.add_parser('activate', help=f"Serve a version ('{LEGACY_VERSION}' for the settings paths)")
+        activate.add_argument('name', choices=sorted(ARTIFACTS))
+        activate.add_argument('version')
+
+        candidate = subparsers.add_parser('candidate', help='Trial a version in shadow or A/B mode next to the active one')
+        candidate.add_argument('name', choices=sorted(ARTIFACTS))
+        candidate.add_argument('version')
+        candidate.add_argument('--mode', choices=CANDIDATE_MODES, default='shadow')
+        candidate.add_argument('--fraction', type=float, default=1.0,
+                               help='Share of requests answered (ab) or replayed (shadow) by the candidate')
+
+        clear_candidate = subparsers.add_parser('clear-candidate', help='Stop trialling the candidate')
+        clear_candidate.add_argument('name', choices=sorted(ARTIFACTS))
+
+        stats = subparsers.add_parser('stats', help='Latency percentiles and shadow agreement per version')
+        stats.add_argument('name', choices=sorted(ARTIFACTS))
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, f"handle_{options['action'].replace('-', '_')}")(options)
+        except RegistryError as e:
+            raise CommandError(str(e))
+
+    def handle_list(self, options):
+        for name in sorted(ARTIFACTS):
+            active = model_registry.active_version(name)
+            candidate = model_registry.candidate(name)
+            trial = f", candidate: {candidate['version']} {candidate['mode']} {candidate['fraction']:.0%}" if candidate else ''
+            self.stdout.write(f"{name} (active: {active}{trial})")
+            for version in model_registry.list_versions(name):
+                marker = '*' if version == active else ' '
+                self.stdout.write(f"  {marker} {version}")
+
+    def handle_publish(self, options):
+        name = options['name']
+        if options['from_settings']:
+            sources = {
+                kind: path for kind, path in model_registry.artifact_paths(name, LEGACY_VERSION).items()
+                if os.path.exists(path)
+            }
+        else:
+            sources = {kind: options[kind] for kind in ARTIFACTS[name] if options.get(kind)}
+
+        manifest = model_registry.publish(name, sources, options['version'])
+        self.stdout.write(json.dumps(manifest, indent=2))
+        if options['activate']:
+            model_registry.activate(name, manifest['version'])
+            self.stdout.write(self.style.SUCCESS(f"Activated {name} {manifest['version']}"))
+
+    def handle_verify(self, options):
+        model_registry.verify(options['name'], options['version'])
+        self.stdout.write(self.style.SUCCESS(f"{options['name']} {options['version']}: checksums OK"))
+
+    def handle_activate(self, options):
+        model_registry.activate(options['name'], options['version'])
+        self.stdout.write(self.style.SUCCESS(f"Activated {options['name']} {options['version']}"))
+
+    def handle_candidate(self, options):
+        model_registry.set_candidate(options['name'], options['version'], options['mode'], options['fraction'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Trialling {options['name']} {options['version']} in {options['mode']} mode on {options['fraction']:.0%} of requests"
+        ))
+
+    def handle_clear_candidate(self, options):
+        model_registry.clear_candidate(options['name'])
+        self.stdout.write(self.style.SUCCESS(f"Cleared candidate for {options['name']}"))
+
+    def handle_stats(self, options):
+        self.stdout.write(json.dumps(model_stats(options['name']), indent=2))
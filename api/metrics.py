@@ -0,0 +1,90 @@
+"""
+Prometheus metrics for the web and Celery processes.
+
+Both gunicorn and the Celery prefork pool run several processes; set
+PROMETHEUS_MULTIPROC_DIR (an empty, writable directory) so their samples are
+aggregated by whichever process serves the scrape.
+"""
+import os
+import time
+from contextlib import contextmanager
+from celery.signals import before_task_publish, task_prerun
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess, start_http_server
+from .tracing import tracer
+
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    'pipeline_stage_seconds',
+    'Time spent in each stage of the inference pipeline',
+    ['stage', 'model_version'],
+    buckets=STAGE_BUCKETS,
+)
+
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    'celery_task_queue_wait_seconds',
+    'Time between a task being published and a worker starting it',
+    ['task', 'queue'],
+    buckets=STAGE_BUCKETS,
+)
+
+CACHE_REQUESTS_TOTAL = Counter(
+    'cache_requests_total',
+    'Cache lookups by cache and result (hit/miss)',
+    ['cache', 'result'],
+)
+
+THROTTLED_REQUESTS_TOTAL = Counter(
+    'throttled_requests_total',
+    'Requests rejected by throttling, by scope and reason (rate or queue)',
+    ['scope', 'reason'],
+)
+
+
+@contextmanager
+def stage(name, model_version=''):
+    """Time a pipeline stage into the histogram and trace it as a span, which is yielded."""
+    attributes = {'model.version': model_version} if model_version else None
+    start = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            PIPELINE_STAGE_SECONDS.labels(name, model_version).observe(time.perf_counter() - start)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS_TOTAL.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def metrics_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics():
+    return generate_latest(metrics_registry())
+
+
+def start_exporter(port):
+    """Serve /metrics from a Celery worker, aggregating its pool processes."""
+    start_http_server(port, registry=metrics_registry())
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def observe_queue_wait(task=None, **kwargs):
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at is None:
+        return
+    queue = (task.request.delivery_info or {}).get('routing_key') or 'unknown'
+    TASK_QUEUE_WAIT_SECONDS.labels(task.name, queue).observe(max(time.time() - published_at, 0))
@@ -0,0 +1,85 @@
+import cProfile
+import time
+from django.conf import settings
+from django.db import connection
+from opentelemetry import propagate
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedJWTAuthentication
+from .permissions import is_admin
+from .profiling import QueryLog, store_profile
+from .tracing import tracer
+
+
+class TracingMiddleware:
+    """Opens the server span of each request, continuing an incoming traceparent."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        parent = propagate.extract(request.headers)
+        with tracer.start_as_current_span(
+            f'{request.method} {request.path}',
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={'http.request.method': request.method, 'url.path': request.path},
+        ) as span:
+            response = self.get_response(request)
+            if request.resolver_match is not None:
+                # Name after the route pattern so spans of /diagnostics/<pk>/ group together
+                route = request.resolver_match.route
+                span.update_name(f'{request.method} {route}')
+                span.set_attribute('http.route', route)
+            span.set_attribute('http.response.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.set_status(Status(StatusCode.ERROR))
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles one request when an admin sends the PROFILING_HEADER header:
+    the cProfile statistics and SQL query log are stored (see api/profiling.py)
+    and the response carries their id in X-Profile-Id. Other requests only
+    pay for a header lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.meta_key = 'HTTP_' + settings.PROFILING_HEADER.upper().replace('-', '_')
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED or not request.META.get(self.meta_key):
+            return self.get_response(request)
+        user = self.admin_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        request.profiling_user = user
+        profiler = cProfile.Profile()
+        queries = QueryLog()
+        with connection.execute_wrapper(queries):
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - start
+
+        response['X-Profile-Id'] = store_profile(request, response, profiler, queries.queries, duration)
+        return response
+
+    def admin_user(self, request):
+        # DRF authenticates later, in the view; check the JWT (or admin session) here
+        user = getattr(request, 'user', None)
+        if is_admin(user):
+            return user
+        try:
+            authenticated = CachedJWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        if authenticated is not None and is_admin(authenticated[0]):
+            return authenticated[0]
+        return None
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_croprecommendation_fertilizerrecommendation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="croprecommendation",
+            name="model_version",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name="diagnostic",
+            name="model_version",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name="fertilizerrecommendation",
+            name="model_version",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
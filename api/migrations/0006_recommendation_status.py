@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:52
+
+from django.db import migrations, models
+
+
+def mark_existing_completed(apps, schema_editor):
+    # Rows created before the status field were generated synchronously; those whose
+    # generation failed carry the error as explanation and a zero confidence
+    for name in ("CropRecommendation", "FertilizerRecommendation"):
+        rows = apps.get_model("api", name).objects
+        rows.filter(
+            explanation__startswith="Erreur lors de la génération", confidence_score=0
+        ).update(status="failed")
+        rows.filter(explanation__isnull=False, status="pending").update(
+            status="completed"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_message_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="croprecommendation",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("processing", "Processing"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="fertilizerrecommendation",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("processing", "Processing"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+        migrations.RunPython(mark_existing_completed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_recommendation_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=40)),
+                ("object_id", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["user", "updated_at"], name="api_convers_user_id_1e1a78_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="croprecommendation",
+            index=models.Index(
+                fields=["user", "updated_at"], name="api_croprec_user_id_e8b03f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="diagnostic",
+            index=models.Index(
+                fields=["user", "updated_at"], name="api_diagnos_user_id_b7412d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fertilizerrecommendation",
+            index=models.Index(
+                fields=["user", "updated_at"], name="api_fertili_user_id_8c4fec_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation", "updated_at"],
+                name="api_message_convers_8b82f1_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="tombstone",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tombstones",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tombstone",
+            index=models.Index(
+                fields=["user", "deleted_at"], name="api_tombsto_user_id_1881b6_idx"
+            ),
+        ),
+    ]
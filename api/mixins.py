@@ -0,0 +1,84 @@
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .caching import catalog_version, get_cached, set_cached
+
+
+class CachedCatalogMixin:
+    """
+    Serves list/retrieve from the versioned catalog cache (api/caching.py),
+    with the catalog version as ETag/Last-Modified so unchanged catalogs
+    are answered with 304 Not Modified.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedCatalogMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedCatalogMixin, self).retrieve(request, *args, **kwargs))
+
+    def cached_response(self, request, build):
+        version = catalog_version()
+        if version is None:
+            return build()
+
+        etag = f'W/"catalog-{version}"'
+        last_modified = version // 10**9
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            patch_vary_headers(not_modified, ('Accept',))
+            return not_modified
+
+        # Pagination, search and ordering live in the query string
+        key = f'catalog:{version}:{request.get_full_path()}'
+        data = get_cached(key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = build()
+            if response.status_code != 200:
+                return response
+            set_cached(key, response.data)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept',))  # same ETag for the JSON and MessagePack encodings
+        return response
+
+
+class ConditionalResponseMixin:
+    """
+    ETag/Last-Modified on list and retrieve, derived from `last_modified_field`,
+    answering If-None-Match/If-Modified-Since with 304 before anything is
+    serialized. A list costs one aggregate query (latest change and row
+    count, so deletions change the ETag too).
+    """
+    last_modified_field = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stats = queryset.order_by().aggregate(last_modified=Max(self.last_modified_field), count=Count('pk'))
+        if stats['last_modified'] is None:
+            return super().list(request, *args, **kwargs)
+
+        etag = f'W/"{stats["count"]}-{stats["last_modified"].timestamp():.6f}"'
+        return self.conditional(request, etag, stats['last_modified'], lambda: super(ConditionalResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        last_modified = getattr(instance, self.last_modified_field)
+        etag = f'W/"{instance.pk}-{last_modified.timestamp():.6f}"'
+        return self.conditional(request, etag, last_modified, lambda: Response(self.get_serializer(instance).data))
+
+    def conditional(self, request, etag, last_modified, build):
+        last_modified = int(last_modified.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            patch_vary_headers(not_modified, ('Accept',))
+            return not_modified
+        response = build()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept',))
+        return response
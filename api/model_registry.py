@@ -0,0 +1,213 @@
+"""
+Versioned on-disk registry for the ML models.
+
+Layout under MODEL_REGISTRY_PATH::
+
+    <name>/<version>/manifest.json   name, version, created_at, sha256 of every file
+    <name>/<version>/model.joblib ... artifacts, see ARTIFACTS
+    <name>/ACTIVE                    version currently served, replaced atomically
+    <name>/CANDIDATE                 optional {"version", "mode", "fraction"} under trial
+
+Models without an ACTIVE pointer are served from the fixed settings paths
+under the pseudo-version ``legacy``.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from django.conf import settings
+
+
+LEGACY_VERSION = 'legacy'
+
+# Canonical artifact file names inside a version directory
+ARTIFACTS = {
+    'crop': {'model': 'model.joblib', 'flat': 'model.flat', 'labels': 'labels.json'},
+    'fertilizer': {'model': 'model.joblib', 'flat': 'model.flat', 'labels': 'labels.json'},
+    'disease': {'model': 'model.keras', 'tflite': 'model.tflite', 'labels': 'labels.json'},
+}
+
+# Where each artifact lives for the legacy (unversioned) deployment
+LEGACY_SETTINGS = {
+    'crop': {'model': 'CROP_MODEL_PATH', 'flat': 'CROP_MODEL_FLAT_PATH', 'labels': 'CROP_LABELS_PATH'},
+    'fertilizer': {'model': 'FERTILIZER_MODEL_PATH', 'flat': 'FERTILIZER_MODEL_FLAT_PATH', 'labels': 'FERTILIZER_LABELS_PATH'},
+    'disease': {'model': 'DISEASE_MODEL_PATH', 'tflite': 'DISEASE_TFLITE_MODEL_PATH'},
+}
+
+
+class RegistryError(Exception):
+    pass
+
+
+def _check_name(name):
+    if name not in ARTIFACTS:
+        raise RegistryError(f"Unknown model '{name}'")
+
+
+def model_root(name):
+    _check_name(name)
+    return os.path.join(settings.MODEL_REGISTRY_PATH, name)
+
+
+def version_dir(name, version):
+    if not version or os.sep in version or version.startswith('.'):
+        raise RegistryError(f"Invalid version '{version}'")
+    return os.path.join(model_root(name), version)
+
+
+def active_version(name):
+    try:
+        with open(os.path.join(model_root(name), 'ACTIVE')) as f:
+            return f.read().strip() or LEGACY_VERSION
+    except FileNotFoundError:
+        return LEGACY_VERSION
+
+
+def list_versions(name):
+    root = model_root(name)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        entry for entry in os.listdir(root)
+        if not entry.startswith('.') and os.path.isfile(os.path.join(root, entry, 'manifest.json'))
+    )
+
+
+def read_manifest(name, version):
+    try:
+        with open(os.path.join(version_dir(name, version), 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise RegistryError(f"Version '{version}' of model '{name}' does not exist")
+
+
+def artifact_paths(name, version):
+    """Map of artifact kind -> path for `version`; artifacts may not all exist."""
+    _check_name(name)
+    if version == LEGACY_VERSION:
+        return {kind: getattr(settings, setting) for kind, setting in LEGACY_SETTINGS[name].items()}
+    base = version_dir(name, version)
+    return {kind: os.path.join(base, filename) for kind, filename in ARTIFACTS[name].items()}
+
+
+def _file_checksums(base):
+    checksums = {}
+    for dirpath, _, filenames in os.walk(base):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, base)
+            if relpath == 'manifest.json':
+                continue
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            checksums[relpath] = digest.hexdigest()
+    return checksums
+
+
+def verify(name, version):
+    """Raise RegistryError unless every file matches the manifest checksums."""
+    manifest = read_manifest(name, version)
+    actual = _file_checksums(version_dir(name, version))
+    if actual != manifest['files']:
+        mismatched = sorted(set(actual.items()) ^ set(manifest['files'].items()))
+        raise RegistryError(f"Checksum mismatch for {name}/{version}: {', '.join(sorted({path for path, _ in mismatched}))}")
+    return manifest
+
+
+def publish(name, sources, version=None):
+    """
+    Copy artifacts (kind -> source path) into a new version directory and
+    write its manifest. The directory only appears once complete.
+    """
+    _check_name(name)
+    unknown = set(sources) - set(ARTIFACTS[name])
+    if unknown:
+        raise RegistryError(f"Unknown artifacts for '{name}': {', '.join(sorted(unknown))}")
+    if not sources:
+        raise RegistryError("Nothing to publish")
+
+    version = version or datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+    if version == LEGACY_VERSION:
+        raise RegistryError(f"'{LEGACY_VERSION}' is reserved for the settings paths")
+    target = version_dir(name, version)
+    if os.path.exists(target):
+        raise RegistryError(f"Version '{version}' of model '{name}' already exists")
+
+    os.makedirs(model_root(name), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=model_root(name))
+    try:
+        for kind, source in sources.items():
+            destination = os.path.join(staging, ARTIFACTS[name][kind])
+            if os.path.isdir(source):
+                shutil.copytree(source, destination)
+            else:
+                shutil.copy2(source, destination)
+
+        manifest = {
+            'name': name,
+            'version': version,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'files': _file_checksums(staging),
+        }
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(staging, 0o755)  # mkdtemp() creates it private to this user
+        os.rename(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def _write_pointer(name, filename, content):
+    root = model_root(name)
+    os.makedirs(root, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix=f'.{filename}-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(root, filename))
+
+
+def activate(name, version):
+    """Point ACTIVE at `version`; running processes pick it up on their next poll."""
+    if version != LEGACY_VERSION:
+        verify(name, version)
+    _write_pointer(name, 'ACTIVE', version)
+
+
+CANDIDATE_MODES = ('shadow', 'ab')
+
+
+def candidate(name):
+    """The candidate under trial for `name`, or None."""
+    try:
+        with open(os.path.join(model_root(name), 'CANDIDATE')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def set_candidate(name, version, mode, fraction):
+    """
+    Trial `version` next to the active model: in 'ab' mode it answers
+    `fraction` of the requests, in 'shadow' mode it re-runs `fraction` of
+    them off the critical path and its answers are only compared.
+    """
+    if mode not in CANDIDATE_MODES:
+        raise RegistryError(f"Unknown candidate mode '{mode}'")
+    if not 0 <= fraction <= 1:
+        raise RegistryError("Candidate fraction must be between 0 and 1")
+    verify(name, version)
+    _write_pointer(name, 'CANDIDATE', json.dumps({'version': version, 'mode': mode, 'fraction': fraction}))
+
+
+def clear_candidate(name):
+    try:
+        os.remove(os.path.join(model_root(name), 'CANDIDATE'))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,61 @@
+"""
+Per model version latency samples and shadow agreement counters, kept in the
+Redis cache so every web and Celery process contributes to the same numbers.
+Recording never raises: statistics must not fail a prediction.
+"""
+import numpy as np
+from django_redis import get_redis_connection
+
+
+LATENCY_SAMPLES = 1000  # most recent predictions kept per model version
+
+
+def _key(kind, name, version=None):
+    return f"model-stats:{kind}:{name}" + (f":{version}" if version else '')
+
+
+def record_latency(name, version, seconds):
+    try:
+        redis = get_redis_connection('default')
+        key = _key('latency', name, version)
+        pipe = redis.pipeline()
+        pipe.lpush(key, seconds)
+        pipe.ltrim(key, 0, LATENCY_SAMPLES - 1)
+        pipe.sadd(_key('versions', name), version)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not record latency for {name} {version}: {e}")
+
+
+def record_agreement(name, version, agreed):
+    try:
+        redis = get_redis_connection('default')
+        key = _key('agreement', name, version)
+        pipe = redis.pipeline()
+        pipe.hincrby(key, 'total', 1)
+        pipe.hincrby(key, 'agreed', int(agreed))
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not record agreement for {name} {version}: {e}")
+
+
+def latency_summary(samples):
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples, dtype=float) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'count': len(values), 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'mean_ms': values.mean()}
+
+
+def model_stats(name):
+    """Latency percentiles and shadow agreement rate for every recorded version of `name`."""
+    redis = get_redis_connection('default')
+    stats = {}
+    for version in sorted(v.decode() for v in redis.smembers(_key('versions', name))):
+        samples = [float(v) for v in redis.lrange(_key('latency', name, version), 0, -1)]
+        counts = {k.decode(): int(v) for k, v in redis.hgetall(_key('agreement', name, version)).items()}
+        stats[version] = {'latency': latency_summary(samples)}
+        if counts.get('total'):
+            stats[version]['shadow_comparisons'] = counts['total']
+            stats[version]['agreement_rate'] = counts.get('agreed', 0) / counts['total']
+    return stats
@@ -1,4 +1,6 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 
@@ -82,11 +84,13 @@ class Diagnostic(models.Model):
     image = models.ImageField(upload_to='diagnostics/')
     result = models.JSONField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    model_version = models.CharField(max_length=100, null=True, blank=True)  # registry version used
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'updated_at'])]  # GET /sync/
 
 class Conversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
@@ -96,6 +100,7 @@ class Conversation(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
 class Message(models.Model):
     ROLE_CHOICES = [
@@ -108,9 +113,11 @@ class Message(models.Model):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [models.Index(fields=['conversation', 'updated_at'])]
 
 class Recommendation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
@@ -142,15 +149,18 @@ class CropRecommendation(models.Model):
     predicted_label = models.IntegerField(null=True, blank=True)  # index like "0"
     predicted_crop = models.CharField(max_length=50, null=True, blank=True)  # e.g. "maize"
     confidence_score = models.FloatField(null=True, blank=True)
+    model_version = models.CharField(max_length=100, null=True, blank=True)  # registry version used
 
     # Explanation or LLM response
     explanation = models.TextField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Diagnostic.STATUS_CHOICES, default='pending')
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
 
 class FertilizerRecommendation(models.Model):
@@ -169,11 +179,56 @@ class FertilizerRecommendation(models.Model):
     predicted_label = models.IntegerField(null=True, blank=True)
     predicted_fertilizer = models.CharField(max_length=50, null=True, blank=True)
     confidence_score = models.FloatField(null=True, blank=True)
+    model_version = models.CharField(max_length=100, null=True, blank=True)  # registry version used
 
     explanation = models.TextField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Diagnostic.STATUS_CHOICES, default='pending')
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'updated_at'])]
+
+
+class UploadSession(models.Model):
+    """A resumable image upload; its bytes so far are in a partial file (see api/uploads.py)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    plant_type = models.ForeignKey(PlantType, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    length = models.PositiveIntegerField()  # declared size in bytes
+    offset = models.PositiveIntegerField(default=0)  # bytes received
+    diagnostic = models.OneToOneField(
+        Diagnostic, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class Tombstone(models.Model):
+    """A deleted record, reported to mobile clients by GET /sync/ (see api/sync.py)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones')
+    kind = models.CharField(max_length=40)  # key of api.sync.SYNCED
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'deleted_at'])]
+
+
+def transition_status(model, pk, from_statuses, to_status, updated_before=None, **fields):
+    """
+    Move row `pk` to `to_status` (saving `fields` with it) only if its status is
+    still one of `from_statuses`, and it was last updated before
+    `updated_before` if given, in a single conditional UPDATE. Returns False
+    when another request or worker changed it first.
+    """
+    rows = model.objects.filter(pk=pk, status__in=from_statuses)
+    if updated_before is not None:
+        rows = rows.filter(updated_at__lt=updated_before)
+    updated = rows.update(
+        status=to_status, updated_at=timezone.now(), **fields
+    )
+    return updated == 1
@@ -0,0 +1,12 @@
+from rest_framework.permissions import BasePermission
+
+
+def is_admin(user):
+    return bool(user and user.is_authenticated and (user.is_staff or getattr(user, 'role', None) == 'admin'))
+
+
+class IsAdminRole(BasePermission):
+    """Allows access to users with the 'admin' role or Django staff status."""
+
+    def has_permission(self, request, view):
+        return is_admin(request.user)
@@ -0,0 +1,59 @@
+"""
+On-demand profiles of single requests (see ProfilingMiddleware). A profile
+holds the cProfile statistics and the SQL query log of one request and is
+kept in the shared cache for PROFILING_TTL_SECONDS, so any web worker can
+serve it back.
+"""
+import io
+import marshal
+import pstats
+import time
+import uuid
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _key(profile_id):
+    return f'profile:{profile_id}'
+
+
+class QueryLog:
+    """Wrapper for connection.execute_wrapper() recording the SQL and duration of each query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({'sql': sql, 'ms': (time.perf_counter() - start) * 1000})
+
+
+def store_profile(request, response, profiler, queries, duration):
+    profile_id = uuid.uuid4().hex
+    profiler.create_stats()
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(settings.PROFILING_SUMMARY_LINES)
+    cache.set(_key(profile_id), {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.profiling_user.username,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'status_code': response.status_code,
+        'duration_ms': duration * 1000,
+        'query_count': len(queries),
+        'query_ms': sum(q['ms'] for q in queries),
+        'queries': queries,
+        'summary': summary.getvalue(),
+        # Same format as cProfile's dump_stats(): loadable by pstats, snakeviz, ...
+        'pstats': marshal.dumps(profiler.stats),
+    }, timeout=settings.PROFILING_TTL_SECONDS)
+    return profile_id
+
+
+def get_profile(profile_id):
+    return cache.get(_key(profile_id))
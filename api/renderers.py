@@ -0,0 +1,49 @@
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+LINE_SEPARATOR = '\u2028'.encode()
+PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Binary MessagePack encoding of the same data the JSON renderer emits,
+    selected with `Accept: application/msgpack` or `?format=msgpack`.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Dates, decimals, UUIDs and lazy strings are encoded as the JSON renderer would
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON through orjson, several times faster than the stdlib encoder on large
+    lists and result blobs. Output matches JSONRenderer, U+2028/U+2029 escapes
+    included, except that:
+    - indented output (browsable API, `; indent=` in Accept) always uses two spaces;
+    - NaN and infinite floats are written as null, where JSONRenderer (STRICT_JSON)
+      raises and the request fails with 500. Checking every float would cost
+      the speed this renderer is for.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=option)
+        # Valid JSON but line terminators in JavaScript: escaped like JSONRenderer does
+        if LINE_SEPARATOR in ret or PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+        return ret
@@ -0,0 +1,90 @@
+"""
+Scheduling of diagnostic analyses across the Celery queues.
+
+Every analysis is counted as pending for its user from submission until the
+task finishes. The count decides where it goes:
+
+- up to SCHEDULING_BULK_THRESHOLD pending analyses per user go to the
+  'interactive' queue, which workers always drain first;
+- beyond that (a cooperative uploading a campaign) they go to the 'bulk'
+  queue;
+- each further SCHEDULING_FAIR_SHARE_STEP pending analyses lowers the
+  priority of the user's next ones by one step (Redis: 0 runs first, 9 last).
+  A user with a few jobs overtakes one with hundreds, which approximates a
+  round-robin across users.
+
+Queue wait per queue is exported as celery_task_queue_wait_seconds (see
+api/metrics.py). Counter failures are printed and the analysis is sent as
+interactive.
+"""
+from celery import current_app
+from celery.signals import task_postrun
+from django.conf import settings
+from django.core.cache import cache
+
+
+INTERACTIVE_QUEUE = 'interactive'
+BULK_QUEUE = 'bulk'
+MAX_PRIORITY = 9
+USER_HEADER = 'scheduling_user'
+
+
+def pending_key(user_id):
+    return f'scheduling:pending:{user_id}'
+
+
+def queue_keys(queue):
+    """The Redis lists holding `queue`, one per priority step (see CELERY broker_transport_options)."""
+    options = current_app.conf.broker_transport_options or {}
+    sep = options.get('sep', '\x06\x16')
+    return [f'{queue}{sep}{step}' if step else queue for step in options.get('priority_steps', [0])]
+
+
+def classify(pending):
+    """(queue, priority) for a user's analysis when `pending` of theirs, itself included, are pending."""
+    if pending is None:
+        return INTERACTIVE_QUEUE, 0
+    queue = BULK_QUEUE if pending > settings.SCHEDULING_BULK_THRESHOLD else INTERACTIVE_QUEUE
+    return queue, min(MAX_PRIORITY, (pending - 1) // settings.SCHEDULING_FAIR_SHARE_STEP)
+
+
+def next_queue(user_id):
+    """Queue the next analysis of `user_id` would be sent to, without counting it."""
+    try:
+        pending = cache.get(pending_key(user_id), 0) + 1
+    except Exception as e:
+        print(f"Could not read pending analyses of user {user_id}: {e}")
+        pending = None
+    return classify(pending)[0]
+
+
+def _add_pending(user_id, delta):
+    key = pending_key(user_id)
+    try:
+        # The TTL bounds the damage of a count left high by a lost task
+        cache.add(key, 0, timeout=settings.SCHEDULING_PENDING_TTL_SECONDS)
+        pending = cache.incr(key, delta)
+        if pending < 0:
+            cache.set(key, 0, timeout=settings.SCHEDULING_PENDING_TTL_SECONDS)
+            pending = 0
+        return pending
+    except Exception as e:
+        print(f"Could not update pending analyses of user {user_id}: {e}")
+        return None
+
+
+def submit_analysis(diagnostic):
+    """Queue analyze_plant_image for `diagnostic` according to its user's backlog."""
+    from .tasks import analyze_plant_image
+
+    queue, priority = classify(_add_pending(diagnostic.user_id, 1))
+    return analyze_plant_image.apply_async(
+        (diagnostic.id,), queue=queue, priority=priority, headers={USER_HEADER: diagnostic.user_id},
+    )
+
+
+@task_postrun.connect
+def release_pending(task=None, **kwargs):
+    user_id = getattr(task.request, USER_HEADER, None)
+    if user_id is not None:
+        _add_pending(user_id, -1)
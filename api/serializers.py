@@ -1,8 +1,82 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .authentication import IdentityRefreshToken
 from .models import PlantType, SoilType, Climate, Diagnostic, Conversation, Message, CropRecommendation, FertilizerRecommendation, Recommendation
 
-class UserSerializer(serializers.ModelSerializer):
+
+FIELDSET_PARAM = 'fields'
+
+
+def requested_fieldset(request):
+    """
+    Parse ``?fields=id,status,result.disease_name`` into a tree
+    ({'id': {}, 'status': {}, 'result': {'disease_name': {}}}); an empty node
+    selects the whole field. None when no fieldset applies: the parameter is
+    absent or the request writes (writes validate the full serializer).
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    value = request.query_params.get(FIELDSET_PARAM)
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree or None
+
+
+def _prune(value, tree):
+    # Sub-selection inside a JSON value such as a diagnostic's result
+    if isinstance(value, dict):
+        return {key: _prune(value[key], tree[key]) if tree[key] else value[key] for key in tree if key in value}
+    if isinstance(value, list):
+        return [_prune(item, tree) for item in value]
+    return value
+
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets for read requests: fields left out of ?fields= are
+    removed from the serializer, so their values (and nested serializers) are
+    never computed. Dotted paths select inside nested serializers and JSON
+    fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fieldset = None
+        fieldset = requested_fieldset(self.context.get('request'))
+        if fieldset is not None:
+            self.apply_fieldset(fieldset)
+
+    def apply_fieldset(self, fieldset):
+        unknown = set(fieldset) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({FIELDSET_PARAM: f"Unknown field(s): {', '.join(sorted(unknown))}"})
+        for name in list(self.fields):
+            if name not in fieldset:
+                self.fields.pop(name)
+        self.fieldset = fieldset
+        for name, subset in fieldset.items():
+            child = getattr(self.fields[name], 'child', self.fields[name])
+            if subset and isinstance(child, SparseFieldsetMixin):
+                child.apply_fieldset(subset)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.fieldset:
+            for name, subset in self.fieldset.items():
+                child = getattr(self.fields[name], 'child', self.fields[name])
+                if subset and not isinstance(child, SparseFieldsetMixin):
+                    data[name] = _prune(data[name], subset)
+        return data
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
 
     class Meta:
@@ -38,26 +112,26 @@ class UserSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class PlantTypeSerializer(serializers.ModelSerializer):
+class PlantTypeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = PlantType
         fields = '__all__'
 
-class SoilTypeSerializer(serializers.ModelSerializer):
+class SoilTypeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     suitable_plants = PlantTypeSerializer(many=True, read_only=True)
 
     class Meta:
         model = SoilType
         fields = '__all__'
 
-class ClimateSerializer(serializers.ModelSerializer):
+class ClimateSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     suitable_plants = PlantTypeSerializer(many=True, read_only=True)
 
     class Meta:
         model = Climate
         fields = '__all__'
 
-class DiagnosticSerializer(serializers.ModelSerializer):
+class DiagnosticSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     plant_type = PlantTypeSerializer(read_only=True)
     plant_type_id = serializers.PrimaryKeyRelatedField(
@@ -68,7 +142,7 @@ class DiagnosticSerializer(serializers.ModelSerializer):
     class Meta:
         model = Diagnostic
         fields = '__all__'
-        read_only_fields = ('status', 'result')
+        read_only_fields = ('status', 'result', 'model_version')
 
     def validate_image(self, value):
         max_size = 10 * 1024 * 1024  # 10MB
@@ -84,14 +158,14 @@ class DiagnosticSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = '__all__'
         read_only_fields = ('role', 'created_at')
 
 
-class ConversationSerializer(serializers.ModelSerializer):
+class ConversationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     messages = MessageSerializer(many=True, read_only=True)
     user = UserSerializer(read_only=True)
 
@@ -107,6 +181,14 @@ class ConversationSerializer(serializers.ModelSerializer):
 
 
 
+class IdentityTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = IdentityRefreshToken
+
+
+class IdentityTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = IdentityRefreshToken
+
+
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
@@ -118,18 +200,18 @@ class DetectDiseaseSerializer(serializers.Serializer):
 
 
 
-class DiagnosticSerializer(serializers.ModelSerializer):
+class DiagnosticSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Diagnostic
         fields = '__all__'
-        read_only_fields = ('user', 'status', 'result')
+        read_only_fields = ('user', 'status', 'result', 'model_version')
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class CropRecommendationSerializer(serializers.ModelSerializer):
+class CropRecommendationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CropRecommendation
         fields = '__all__'
@@ -138,14 +220,16 @@ class CropRecommendationSerializer(serializers.ModelSerializer):
             'predicted_label',
             'predicted_crop',
             'confidence_score',
-            'explanation'
+            'model_version',
+            'explanation',
+            'status'
         )
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class FertilizerRecommendationSerializer(serializers.ModelSerializer):
+class FertilizerRecommendationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = FertilizerRecommendation
         fields = '__all__'
@@ -154,7 +238,9 @@ class FertilizerRecommendationSerializer(serializers.ModelSerializer):
             'predicted_label',
             'predicted_fertilizer',
             'confidence_score',
-            'explanation'
+            'model_version',
+            'explanation',
+            'status'
         )
 
     def create(self, validated_data):
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.contrib.auth import get_user_model
+from django.dispatch import receiver
+from django.utils import timezone
+from .authentication import forget_cached_user
+from .caching import bump_catalog_version
+from .models import Climate, Conversation, CropRecommendation, Diagnostic, FertilizerRecommendation, Message, PlantType, SoilType
+from .status_mirror import forget_status
+from .sync import record_deletion
+
+
+@receiver(post_save, sender=PlantType)
+@receiver(post_save, sender=SoilType)
+@receiver(post_save, sender=Climate)
+@receiver(post_delete, sender=PlantType)
+@receiver(post_delete, sender=SoilType)
+@receiver(post_delete, sender=Climate)
+def invalidate_catalog(sender, **kwargs):
+    # Soil types and climates embed their plant types, so any change invalidates every catalog.
+    # Bumped once committed: a reader in between would cache the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(m2m_changed, sender=SoilType.suitable_plants.through)
+@receiver(m2m_changed, sender=Climate.suitable_plants.through)
+def invalidate_catalog_relations(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def touch_conversation(sender, instance, **kwargs):
+    # Conversations embed their messages: keep their ETag and recent-first ordering current
+    Conversation.objects.filter(pk=instance.conversation_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    forget_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Diagnostic)
+@receiver(post_save, sender=CropRecommendation)
+@receiver(post_save, sender=FertilizerRecommendation)
+@receiver(post_delete, sender=Diagnostic)
+@receiver(post_delete, sender=CropRecommendation)
+@receiver(post_delete, sender=FertilizerRecommendation)
+def invalidate_mirrored_status(sender, instance, **kwargs):
+    # Saves outside the tasks (admin, API updates); the next poll reloads the row
+    forget_status(sender, instance.pk)
+
+
+@receiver(post_delete, sender=Conversation)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Diagnostic)
+@receiver(post_delete, sender=CropRecommendation)
+@receiver(post_delete, sender=FertilizerRecommendation)
+def record_sync_tombstone(sender, instance, origin=None, **kwargs):
+    # Deleting an account removes its tombstones too, and clients drop a
+    # conversation's messages with it
+    if isinstance(origin, (get_user_model(), Conversation)) and origin is not instance:
+        return
+    if sender is Message:
+        user_id = Conversation.objects.filter(pk=instance.conversation_id).values_list('user_id', flat=True).first()
+    else:
+        user_id = instance.user_id
+    if user_id is not None:
+        record_deletion(instance, user_id)
@@ -0,0 +1,120 @@
+"""
+Status mirror for polling many diagnostics and recommendations at once.
+
+The tasks publish a short entry (id, status, short result) per job to the
+cache whenever its status or prediction changes, as does analyze when it
+re-queues a diagnostic. GET /status/ reads all requested entries with one
+cache round trip and falls back to one query per model for the missing
+ones, which are then written back unless a task published them meanwhile.
+Entries carry their owner and expire after STATUS_MIRROR_TTL_SECONDS;
+deleted rows are dropped (api/signals.py).
+Cache errors are printed and the database is read instead.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import record_cache
+from .models import CropRecommendation, Diagnostic, FertilizerRecommendation
+
+
+def diagnostic_summary(row):
+    result = row['result'] or {}
+    return {key: result[key] for key in ('disease_name', 'confidence', 'disease_detected', 'error') if key in result}
+
+
+def crop_summary(row):
+    return {'predicted_crop': row['predicted_crop'], 'confidence_score': row['confidence_score']}
+
+
+def fertilizer_summary(row):
+    return {'predicted_fertilizer': row['predicted_fertilizer'], 'confidence_score': row['confidence_score']}
+
+
+# Kind (query parameter of GET /status/) -> model, columns read, short result
+MIRRORED = {
+    'diagnostics': (Diagnostic, ('result',), diagnostic_summary),
+    'crop_recommendations': (CropRecommendation, ('predicted_crop', 'confidence_score'), crop_summary),
+    'fertilizer_recommendations': (FertilizerRecommendation, ('predicted_fertilizer', 'confidence_score'), fertilizer_summary),
+}
+KIND_OF_MODEL = {model: kind for kind, (model, _, _) in MIRRORED.items()}
+
+
+def status_key(kind, pk):
+    return f'status:{kind}:{pk}'
+
+
+def _load(kind, ids, user_id=None):
+    # One query for all `ids` of a kind; entries keyed by id
+    model, columns, summarize = MIRRORED[kind]
+    rows = model.objects.filter(pk__in=ids).order_by()
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    return {
+        row['id']: {
+            'id': row['id'], 'user_id': row['user_id'], 'status': row['status'],
+            'result': summarize(row), 'updated_at': row['updated_at'].isoformat(),
+        }
+        for row in rows.values('id', 'user_id', 'status', 'updated_at', *columns)
+    }
+
+
+def publish_status(model, pk):
+    """Mirror the current status of row `pk` of `model`."""
+    kind = KIND_OF_MODEL[model]
+    entry = _load(kind, [pk]).get(pk)
+    try:
+        if entry is None:
+            cache.delete(status_key(kind, pk))
+        else:
+            cache.set(status_key(kind, pk), entry, timeout=settings.STATUS_MIRROR_TTL_SECONDS)
+    except Exception as e:
+        print(f"Could not mirror the status of {kind} {pk}: {e}")
+
+
+def forget_status(model, pk):
+    try:
+        cache.delete(status_key(KIND_OF_MODEL[model], pk))
+    except Exception as e:
+        print(f"Could not drop the mirrored status of {model.__name__} {pk}: {e}")
+
+
+def get_statuses(user_id, requested):
+    """
+    {kind: [entry, ...]} for the {kind: [id, ...]} in `requested`, in the
+    requested order. Ids that do not exist or belong to another user are left out.
+    """
+    keys = {status_key(kind, pk): (kind, pk) for kind, ids in requested.items() for pk in ids}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception as e:
+        print(f"Could not read mirrored statuses: {e}")
+        cached = {}
+
+    found = {kind: {} for kind in requested}
+    missing = {}
+    for key, (kind, pk) in keys.items():
+        entry = cached.get(key)
+        record_cache('status', hit=entry is not None)
+        if entry is None:
+            missing.setdefault(kind, []).append(pk)
+        elif entry['user_id'] == user_id:
+            found[kind][pk] = entry
+
+    loaded = {}
+    for kind, ids in missing.items():
+        entries = _load(kind, ids, user_id=user_id)
+        found[kind].update(entries)
+        loaded.update({status_key(kind, pk): entry for pk, entry in entries.items()})
+    try:
+        for key, entry in loaded.items():
+            # Set only if absent: a task may have published a newer status since the rows were read
+            cache.add(key, entry, timeout=settings.STATUS_MIRROR_TTL_SECONDS)
+    except Exception as e:
+        print(f"Could not mirror statuses: {e}")
+
+    return {
+        kind: [
+            {field: value for field, value in found[kind][pk].items() if field != 'user_id'}
+            for pk in ids if pk in found[kind]
+        ]
+        for kind, ids in requested.items()
+    }
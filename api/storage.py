@@ -0,0 +1,101 @@
+"""
+Media storage: the local filesystem, or an S3-compatible object store.
+
+MEDIA_STORAGE selects the backend of Django's default storage (see
+settings.STORAGES). With 'filesystem', images live under MEDIA_ROOT, which
+web and worker containers must share. With 's3' (AWS S3, MinIO, ...) they
+live in MEDIA_S3_BUCKET and workers need no shared disk. Code reads and
+writes images through the storage API only (open, save), never through
+local paths.
+
+Resumable (tus) uploads still stage their chunks in UPLOAD_SESSION_DIR on
+the web node that received them: with several web nodes, route each upload
+to one node (sticky sessions) or put that directory on a shared volume. S3
+multipart uploads cannot hold them instead, as every part but the last must
+be at least 5 MB and tus clients send chunks of any size.
+
+With S3, clients can also upload an image straight to the bucket: they get
+a presigned POST limited to one key, one content type and UPLOAD_MAX_BYTES,
+then confirm the upload with the signed token they were given, which
+creates the diagnostic. The image bytes never pass through the web app.
+"""
+import os
+import uuid
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.utils.functional import cached_property
+from storages.backends.s3 import S3Storage
+from storages.utils import clean_name
+
+
+DIRECT_UPLOAD_SALT = 'api.storage.direct-upload'
+DIRECT_UPLOAD_PREFIX = 'diagnostics/direct/'
+
+
+class S3MediaStorage(S3Storage):
+    """
+    S3Storage whose signed URLs use `public_endpoint_url` when set, e.g. a
+    MinIO reachable as http://minio:9000 by the containers but as
+    http://localhost:9000 by clients.
+    """
+
+    def __init__(self, public_endpoint_url=None, **settings):
+        self.public_endpoint_url = public_endpoint_url
+        super().__init__(**settings)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('public_client', None)
+        return state
+
+    @cached_property
+    def public_client(self):
+        # boto3 clients are thread-safe, unlike the per-thread resource behind `connection`
+        return self._create_session().client(
+            's3',
+            endpoint_url=self.public_endpoint_url,
+            region_name=self.region_name,
+            use_ssl=self.use_ssl,
+            verify=self.verify,
+            config=self.client_config,
+        )
+
+    @property
+    def signing_client(self):
+        return self.public_client if self.public_endpoint_url else self.connection.meta.client
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if not self.public_endpoint_url:
+            return super().url(name, parameters, expire, http_method)
+        params = dict(parameters or {}, Bucket=self.bucket_name, Key=self._normalize_name(clean_name(name)))
+        return self.signing_client.generate_presigned_url(
+            'get_object', Params=params, ExpiresIn=expire or self.querystring_expire, HttpMethod=http_method,
+        )
+
+    def presigned_post(self, name, content_type, max_bytes, expires):
+        """Form fields and URL letting a client POST one object of at most `max_bytes` to `name`."""
+        return self.signing_client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=self._normalize_name(clean_name(name)),
+            Fields={'Content-Type': content_type},
+            Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_bytes]],
+            ExpiresIn=expires,
+        )
+
+
+def supports_direct_uploads():
+    return isinstance(default_storage, S3MediaStorage)
+
+
+def direct_upload_name(user_id, filename):
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f'{DIRECT_UPLOAD_PREFIX}{user_id}/{uuid.uuid4().hex}{extension}'
+
+
+def sign_direct_upload(user_id, name, plant_type_id):
+    return signing.dumps({'user': user_id, 'name': name, 'plant_type': plant_type_id}, salt=DIRECT_UPLOAD_SALT)
+
+
+def read_direct_upload(token, max_age):
+    """The {'user', 'name', 'plant_type'} signed into `token`; signing.BadSignature if forged or expired."""
+    return signing.loads(token, salt=DIRECT_UPLOAD_SALT, max_age=max_age)
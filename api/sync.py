@@ -0,0 +1,173 @@
+"""
+Delta synchronisation for mobile clients (GET /sync/).
+
+A client keeps the `watermark` of its last sync and sends it back as
+`?since=`. The response holds every conversation, message, diagnostic and
+recommendation of the user updated since then, found with (owner,
+updated_at) index scans, and the ids of those deleted since then
+(Tombstone rows written by api/signals.py). Rows are encoded compactly: the
+column names once per kind, then one array of values per row; ids stand in
+for related objects and image fields are URLs from the media storage
+(presigned and expiring with S3, so clients download them right away).
+
+Each kind returns at most SYNC_PAGE_SIZE rows, in (updated_at, id) order.
+When one is cut short, `has_more` is set and the watermark carries a keyset
+cursor per kind, the (updated_at, id) of the last row sent, so paging moves
+on even when many rows share one updated_at (e.g. rows back-filled by a
+migration). Such watermarks are opaque base64; once every kind has caught
+up the watermark is a plain UTC timestamp again. It is held back by
+SYNC_WATERMARK_OVERLAP_SECONDS (writes committed while the page was read),
+so rows may be sent twice: clients upsert by id. A watermark older than the
+tombstone retention, or none, gives a full sync with `reset` set.
+"""
+import base64
+import json
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import FileField, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Conversation, CropRecommendation, Diagnostic, FertilizerRecommendation, Message, Tombstone
+
+
+# Kind -> model, lookup of its owner
+SYNCED = {
+    'conversations': (Conversation, 'user'),
+    'messages': (Message, 'conversation__user'),
+    'diagnostics': (Diagnostic, 'user'),
+    'crop_recommendations': (CropRecommendation, 'user'),
+    'fertilizer_recommendations': (FertilizerRecommendation, 'user'),
+}
+KIND_OF_MODEL = {model: kind for kind, (model, _) in SYNCED.items()}
+
+
+def synced_fields(model):
+    # Every column but the owner, which is the requesting user
+    return [field.attname for field in model._meta.concrete_fields if field.attname != 'user_id']
+
+
+def file_columns(model, fields):
+    return [fields.index(field.attname) for field in model._meta.concrete_fields if isinstance(field, FileField)]
+
+
+def with_file_urls(rows, columns):
+    """`rows` with the stored names in `columns` replaced by their URLs."""
+    if not columns:
+        return rows
+    rows = [list(row) for row in rows]
+    for row in rows:
+        for column in columns:
+            row[column] = default_storage.url(row[column]) if row[column] else None
+    return rows
+
+
+# Keyset cursors of a watermark: one per kind, plus the tombstones
+CURSORS = (*SYNCED, 'tombstones')
+
+
+def _parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return moment
+
+
+def _format_moment(moment):
+    # UTC with a 'Z' suffix: no '+' to escape in the next request's query string
+    return moment.astimezone(dt_timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def parse_watermark(value):
+    """
+    {cursor: (updated_at, id or None)} of a `since` parameter, None if
+    absent; ValueError if malformed. An id of None means every row from
+    updated_at on, an id the rows after (updated_at, id).
+    """
+    if not value:
+        return None
+    try:
+        return dict.fromkeys(CURSORS, (_parse_moment(value), None))
+    except ValueError:
+        pass
+    try:
+        cursors = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        parsed = {name: (_parse_moment(cursors[name][0]), cursors[name][1]) for name in CURSORS}
+    except (TypeError, KeyError, IndexError) as e:
+        raise ValueError(value) from e
+    if not all(pk is None or type(pk) is int for _, pk in parsed.values()):
+        raise ValueError(value)
+    return parsed
+
+
+def format_watermark(cursors):
+    moments = {moment for moment, _ in cursors.values()}
+    if len(moments) == 1 and all(pk is None for _, pk in cursors.values()):
+        return _format_moment(moments.pop())
+    encoded = json.dumps({name: [_format_moment(moment), pk] for name, (moment, pk) in cursors.items()})
+    return base64.urlsafe_b64encode(encoded.encode()).decode().rstrip('=')
+
+
+def after(cursor, column):
+    """Rows past `cursor` in (column, id) order."""
+    moment, pk = cursor
+    if pk is None:
+        return Q(**{f'{column}__gte': moment})
+    return Q(**{f'{column}__gt': moment}) | Q(**{column: moment, 'id__gt': pk})
+
+
+def tombstone_cutoff():
+    return timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+
+
+def changes(user, since=None, limit=None):
+    limit = limit or settings.SYNC_PAGE_SIZE
+    caught_up = (timezone.now() - timedelta(seconds=settings.SYNC_WATERMARK_OVERLAP_SECONDS), None)
+    if since is not None and min(moment for moment, _ in since.values()) < tombstone_cutoff():
+        since = None  # deletions since then are no longer known
+    cursors = dict.fromkeys(CURSORS, caught_up)
+    has_more = False
+
+    changed = {}
+    for kind, (model, owner) in SYNCED.items():
+        fields = synced_fields(model)
+        rows = model.objects.filter(**{owner: user})
+        if since is not None:
+            rows = rows.filter(after(since[kind], 'updated_at'))
+        rows = list(rows.order_by('updated_at', 'id').values_list(*fields)[:limit + 1])
+        if len(rows) > limit:
+            has_more = True
+            rows = rows[:limit]
+            cursors[kind] = (rows[-1][fields.index('updated_at')], rows[-1][fields.index('id')])
+        changed[kind] = {'fields': fields, 'rows': with_file_urls(rows, file_columns(model, fields))}
+
+    deleted = {kind: [] for kind in SYNCED}
+    if since is not None:
+        tombstones = Tombstone.objects.filter(after(since['tombstones'], 'deleted_at'), user=user)
+        tombstones = tombstones.order_by('deleted_at', 'id').values_list('kind', 'object_id', 'deleted_at', 'id')
+        tombstones = list(tombstones[:limit + 1])
+        if len(tombstones) > limit:
+            has_more = True
+            tombstones = tombstones[:limit]
+            cursors['tombstones'] = tombstones[-1][2:]
+        for kind, object_id, _, _ in tombstones:
+            deleted[kind].append(object_id)
+
+    return {
+        'watermark': format_watermark(cursors),
+        'reset': since is None,
+        'has_more': has_more,
+        'changes': changed,
+        'deleted': deleted,
+    }
+
+
+def record_deletion(instance, user_id):
+    Tombstone.objects.create(user_id=user_id, kind=KIND_OF_MODEL[type(instance)], object_id=instance.pk)
+
+
+def prune_tombstones():
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=tombstone_cutoff()).delete()
+    return deleted
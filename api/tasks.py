@@ -1,150 +1,274 @@
 import os
-from celery import shared_task
+from celery import current_task, shared_task
+from celery.utils.time import get_exponential_backoff_interval
 from django.conf import settings
-from .models import Diagnostic, Message, Recommendation, FertilizerRecommendation, CropRecommendation
-import pickle
-import joblib
+from django.utils import timezone
+from .models import Diagnostic, Message, Recommendation, FertilizerRecommendation, CropRecommendation, transition_status
 import json
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
-from PIL import Image
 import numpy as np
 from .gemini import get_gemini_response
+from .inference import get_model, input_size, preprocess_stored_image, route_model
+from .metrics import PIPELINE_STAGE_SECONDS, stage
+from .model_stats import record_agreement, record_latency
+from .status_mirror import publish_status
+from . import sync, uploads
+from .tracing import tracer
 import asyncio
-# Label mappings (add more if needed)
+import time
+# Crop index encoding used as a fertilizer model feature; prediction labels
+# themselves come with each model version (see api/model_registry.py)
 with open(settings.CROP_LABELS_PATH, 'r') as f:
     CROP_LABELS = json.load(f)
 
 CROP_NAME_TO_IDX = {v.lower(): int(k) for k, v in CROP_LABELS.items()}
 
-
-with open(settings.FERTILIZER_LABELS_PATH, 'r') as f:
-    FERTILIZER_LABELS = json.load(f)
-
 SOIL_TYPE_MAPPING = {
     "sandy": 0, "loamy": 1, "black": 2, "red": 3, "clayey": 4
     # Update to match training data
 }
 
 
-#CROP MODEL IN .joblib format
-# Load crop prediction model (joblib)
-try:
-    CROP_MODEL = joblib.load(settings.CROP_MODEL_PATH)
-except Exception as e:
-    CROP_MODEL = None
-    print(f"Error loading crop model: {e}")
-
-# Load fertilizer prediction model (pickle)
-try:
-    with open(settings.FERTILIZER_MODEL_PATH, 'rb') as f:
-        FERTILIZER_MODEL = pickle.load(f)
-except Exception as e:
-    FERTILIZER_MODEL = None
-    print(f"Error loading fertilizer model: {e}")
-
-# Load disease model (keras)
-try:
-    DISEASE_MODEL = load_model(settings.DISEASE_MODEL_PATH)
-except Exception as e:
-    DISEASE_MODEL = None
-    print(f"Error loading disease model: {e}")
-
-def preprocess_image(uploaded_image, target_size=(300, 300)):
-    img = Image.open(uploaded_image).convert('RGB')  # Convert to RGB (drops alpha channel)
-    img = img.resize(target_size)  # Resize to model input size
-    img_array = np.array(img)  # shape: (300, 300, 3)
-    # Optional normalization: img_array = img_array / 255.0
-    img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
-    return img_array
+# Models are loaded lazily through api.inference.get_model(), which also hot-swaps
+# them when a new version is activated in the registry. Tabular models are
+# preloaded in the Celery parent before the pool forks (see gardien_eveille/celery.py),
+# the TensorFlow disease model is built once per worker process on first use.
 
 import asyncio  # 👈 To run async code in sync task
 
+
+def timed_predict(bundle, inputs):
+    # Latency per model version, used to compare candidates (see api/model_stats.py)
+    attributes = {'model.name': bundle.name, 'model.version': bundle.version}
+    with tracer.start_as_current_span(f'{bundle.name}_predict', attributes=attributes):
+        start = time.perf_counter()
+        preds = bundle.model.predict(inputs)
+        elapsed = time.perf_counter() - start
+    PIPELINE_STAGE_SECONDS.labels(f'{bundle.name}_predict', bundle.version).observe(elapsed)
+    record_latency(bundle.name, bundle.version, elapsed)
+    return preds
+
+
+def decode_prediction(preds):
+    if preds.ndim == 2:
+        predicted_label = int(np.argmax(preds, axis=1)[0])
+        confidence = float(preds[0][predicted_label])
+    else:
+        predicted_label = int(preds[0])
+        confidence = 1.0
+    return predicted_label, confidence
+
+
+@shared_task(ignore_result=True)
+def shadow_predict(name, version, primary_label, features=None, diagnostic_id=None):
+    # Replays a production input on the candidate model; its answer is only compared
+    candidate = get_model(name, candidate=True)
+    if candidate.version != version:
+        return  # candidate replaced since the task was queued
+
+    if diagnostic_id is not None:
+        inputs = preprocess_stored_image(Diagnostic.objects.get(id=diagnostic_id).image, input_size(candidate))
+    else:
+        inputs = np.array(features)
+
+    predicted_label, _ = decode_prediction(timed_predict(candidate, inputs))
+    record_agreement(name, version, predicted_label == primary_label)
+
+
+def explanation_delay(retries):
+    # Exponential backoff with full jitter: 0..min(max, base * 2**retries) seconds
+    return get_exponential_backoff_interval(
+        settings.LLM_RETRY_BACKOFF_SECONDS, retries, settings.LLM_RETRY_BACKOFF_MAX_SECONDS, full_jitter=True,
+    )
+
+
+def diagnostic_prompt(diagnostic):
+    result = diagnostic.result
+    prompt = (
+        f"Une plante a été analysée via une image. Le modèle a détecté la maladie '{result['disease_name']}' "
+        f"avec une confiance de {round(result['confidence'] * 100, 2)}%. "
+    )
+    if result['disease_detected']:
+        prompt += (
+            "Donne une explication brève sur cette maladie, ses symptômes, et recommande des traitements appropriés. "
+            "Formule la réponse en français clair et simple."
+        )
+    else:
+        prompt += (
+            "La plante semble saine. Fournis un conseil pour maintenir sa santé. "
+            "Formule la réponse en français."
+        )
+    return prompt
+
+
+def fertilizer_prompt(fertilizer):
+    return (
+        f"L'utilisateur cultive {fertilizer.crop.name} sur un sol de type {fertilizer.soil_type.name}. "
+        f"Les conditions sont les suivantes : température = {fertilizer.temperature}°C, humidité = {fertilizer.humidity}%, "
+        f"humidité du sol = {fertilizer.moisture}%, azote (N) = {fertilizer.nitrogen}, phosphore (P) = {fertilizer.phosphorus}, "
+        f"potassium (K) = {fertilizer.potassium}. Le modèle a recommandé le fertilisant '{fertilizer.predicted_fertilizer}'. "
+        f"Explique pourquoi ce choix est adapté aux conditions données, en français simple."
+    )
+
+
+def crop_prompt(crop_rec):
+    return (
+        f"L'utilisateur a fourni les données suivantes concernant les conditions du sol et du climat : "
+        f"Azote (N) = {crop_rec.nitrogen}, Phosphore (P) = {crop_rec.phosphorus}, Potassium (K) = {crop_rec.potassium}, "
+        f"Température = {crop_rec.temperature}°C, Humidité = {crop_rec.humidity}%, pH = {crop_rec.ph}, Pluviométrie = {crop_rec.rainfall} mm. "
+        f"Sur cette base, le modèle a prédit que la culture la plus adaptée est : '{crop_rec.predicted_crop}'. "
+        f"Expliquez pourquoi cette culture est un bon choix pour ces conditions, en français simple."
+    )
+
+
+def explanation_fields(kind, instance, explanation=None, error=None):
+    if kind == 'diagnostic':
+        result = {**instance.result, 'explanation': explanation}
+        if error is not None:
+            result['explanation_error'] = error
+        return {'result': result}
+    if error is not None:
+        explanation = f"Erreur lors de la génération : {error}"
+    return {'explanation': explanation}
+
+
+# The LLM stage of each pipeline: model and prompt built from the saved predictions
+EXPLAINED = {
+    'diagnostic': (Diagnostic, diagnostic_prompt),
+    'fertilizer': (FertilizerRecommendation, fertilizer_prompt),
+    'crop': (CropRecommendation, crop_prompt),
+}
+
+
+def generate_explanation(kind, instance):
+    _, build_prompt = EXPLAINED[kind]
+    return asyncio.run(get_gemini_response(
+        user_message=build_prompt(instance),
+        chat_history=None,
+        model_name="gemini-2.5-flash"
+    ))
+
+
+def complete_explanation(kind, instance, explanation=None, error=None):
+    model, _ = EXPLAINED[kind]
+    with stage('db_save', instance.model_version or ''):
+        transition_status(model, instance.pk, ['processing'], 'completed', **explanation_fields(kind, instance, explanation, error))
+    publish_status(model, instance.pk)
+
+
+def explain(kind, instance):
+    """
+    LLM stage of a pipeline whose predictions are saved. If it fails, only this
+    stage is retried later (explain_result), on the queue of the current task.
+    """
+    try:
+        explanation = generate_explanation(kind, instance)
+    except Exception as e:
+        print(f"Explication reportée pour {kind} {instance.pk} : {e}")
+        queue = (current_task.request.delivery_info or {}).get('routing_key') if current_task else None
+        explain_result.apply_async((kind, instance.pk), countdown=explanation_delay(0), queue=queue)
+        return
+    complete_explanation(kind, instance, explanation)
+
+
+@shared_task(bind=True, max_retries=None, ignore_result=True)
+def explain_result(self, kind, object_id):
+    # Retries the LLM stage alone, with exponential backoff, up to LLM_MAX_RETRIES times
+    model, _ = EXPLAINED[kind]
+    instance = model.objects.filter(pk=object_id, status='processing').first()
+    if instance is None:
+        return  # completed by another attempt, or re-submitted since
+
+    try:
+        explanation = generate_explanation(kind, instance)
+    except Exception as e:
+        if self.request.retries >= settings.LLM_MAX_RETRIES:
+            # Keep the predictions: complete without an explanation
+            complete_explanation(kind, instance, error=str(e))
+            return
+        raise self.retry(exc=e, countdown=explanation_delay(self.request.retries + 1))
+    complete_explanation(kind, instance, explanation)
+
+
+@shared_task(ignore_result=True)
+def prune_tombstones():
+    # Scheduled daily by Celery beat; clients older than the retention get a full sync
+    sync.prune_tombstones()
+
+
+@shared_task(ignore_result=True)
+def prune_upload_sessions():
+    # Scheduled hourly by Celery beat: abandoned resumable uploads and their partial files
+    uploads.prune_sessions()
+
+
 @shared_task
 def analyze_plant_image(diagnostic_id):
-    diagnostic = None
+    # Claim the queued diagnostic; duplicate or stale deliveries find it already taken
+    if not transition_status(Diagnostic, diagnostic_id, ['pending'], 'processing'):
+        print(f"Diagnostic {diagnostic_id} n'est plus en attente, analyse ignorée.")
+        return
+    publish_status(Diagnostic, diagnostic_id)
+
     try:
         diagnostic = Diagnostic.objects.get(id=diagnostic_id)
-        diagnostic.status = 'processing'
-        diagnostic.save()
 
-        if DISEASE_MODEL is None:
-            raise Exception("Le modèle de détection des maladies n'est pas chargé.")
+        try:
+            disease, shadow_version = route_model('disease')
+        except RuntimeError as e:
+            raise Exception(f"Le modèle de détection des maladies n'est pas chargé. {e}")
 
         # Step 1: Preprocess image
-        image_array = preprocess_image(diagnostic.image.path)
+        image_array = preprocess_stored_image(diagnostic.image, input_size(disease))
 
         # Step 2: Predict disease
-        preds = DISEASE_MODEL.predict(image_array)
-        predicted_label = int(np.argmax(preds, axis=1)[0])
-        confidence = float(preds[0][predicted_label])
+        preds = timed_predict(disease, image_array)
+        predicted_label, confidence = decode_prediction(preds)
+        if shadow_version:
+            shadow_predict.delay('disease', shadow_version, predicted_label, diagnostic_id=diagnostic.id)
 
         # Step 3: Map prediction to disease name
-        DISEASE_LABELS = {
-            0: "Early Blight",
-            1: "Late Blight",
-            2: "Healthy"
-        }
-        disease_name = DISEASE_LABELS.get(predicted_label, "Inconnu")
+        disease_name = disease.labels.get(str(predicted_label), "Inconnu")
 
-        # Step 4: Create Gemini prompt (in French)
-        prompt = (
-            f"Une plante a été analysée via une image. Le modèle a détecté la maladie '{disease_name}' "
-            f"avec une confiance de {round(confidence * 100, 2)}%. "
-        )
-
-        if disease_name != "Healthy":
-            prompt += (
-                "Donne une explication brève sur cette maladie, ses symptômes, et recommande des traitements appropriés. "
-                "Formule la réponse en français clair et simple."
-            )
-        else:
-            prompt += (
-                "La plante semble saine. Fournis un conseil pour maintenir sa santé. "
-                "Formule la réponse en français."
-            )
-
-        # Step 5: Call Gemini async function inside sync task
-        gemini_response = asyncio.run(get_gemini_response(
-            user_message=prompt,
-            chat_history=None,
-            model_name="gemini-2.5-flash"
-        ))
-
-        # Step 6: Build result
-        result = {
+        # Step 4: Save the prediction; the explanation is added by the LLM stage
+        diagnostic.result = {
             'disease_detected': disease_name != "Healthy",
             'disease_name': disease_name,
             'confidence': confidence,
             'recommendations': [],
-            'explanation': gemini_response
+            'explanation': None
         }
-
-        diagnostic.result = result
-        diagnostic.status = 'completed'
-        diagnostic.save()
+        diagnostic.model_version = disease.version
+        # update() skips auto_now: bump updated_at so ETags and /sync/ see the prediction
+        Diagnostic.objects.filter(pk=diagnostic.pk).update(
+            result=diagnostic.result, model_version=disease.version, updated_at=timezone.now()
+        )
+        publish_status(Diagnostic, diagnostic.pk)
 
     except Exception as e:
-        if diagnostic:
-            diagnostic.status = 'failed'
-            diagnostic.result = {'error': str(e)}
-            diagnostic.save()
+        transition_status(Diagnostic, diagnostic_id, ['processing'], 'failed', result={'error': str(e)})
+        publish_status(Diagnostic, diagnostic_id)
         raise
 
+    # Step 5: Explanation in French by Gemini
+    explain('diagnostic', diagnostic)
+
 
 @shared_task
 def generate_fertilizer_recommendation(fertilizer_id):
-    fertilizer = None
+    if not transition_status(FertilizerRecommendation, fertilizer_id, ['pending'], 'processing'):
+        print(f"Recommandation de fertilisant {fertilizer_id} n'est plus en attente, ignorée.")
+        return
+    publish_status(FertilizerRecommendation, fertilizer_id)
 
     try:
         # Step 1: Retrieve the record
-        fertilizer = FertilizerRecommendation.objects.get(id=fertilizer_id)
-        fertilizer.status = 'processing'
-        fertilizer.save()
+        fertilizer = FertilizerRecommendation.objects.select_related('crop', 'soil_type').get(id=fertilizer_id)
 
         # Step 2: Ensure model is loaded
-        if FERTILIZER_MODEL is None:
-            raise Exception("Le modèle de fertilisant n'est pas chargé.")
+        try:
+            fertilizer_model, shadow_version = route_model('fertilizer')
+        except RuntimeError as e:
+            raise Exception(f"Le modèle de fertilisant n'est pas chargé. {e}")
 
         # Step 3: Encode categorical fields
         soil_index = SOIL_TYPE_MAPPING.get(fertilizer.soil_type.name.lower(), 0)
@@ -163,57 +287,44 @@ def generate_fertilizer_recommendation(fertilizer_id):
         ]])
 
         # Step 5: Predict
-        preds = FERTILIZER_MODEL.predict(features)
-
-        if preds.ndim == 2:
-            predicted_label = int(np.argmax(preds, axis=1)[0])
-            confidence = float(preds[0][predicted_label])
-        else:
-            predicted_label = int(preds[0])
-            confidence = 1.0
-
-        predicted_fertilizer = FERTILIZER_LABELS.get(str(predicted_label), "Inconnu")
-
-        # Step 6: Generate French explanation using Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-pro")
-
-        french_prompt = (
-            f"L'utilisateur cultive {fertilizer.crop.name} sur un sol de type {fertilizer.soil_type.name}. "
-            f"Les conditions sont les suivantes : température = {fertilizer.temperature}°C, humidité = {fertilizer.humidity}%, "
-            f"humidité du sol = {fertilizer.moisture}%, azote (N) = {fertilizer.nitrogen}, phosphore (P) = {fertilizer.phosphorus}, "
-            f"potassium (K) = {fertilizer.potassium}. Le modèle a recommandé le fertilisant '{predicted_fertilizer}'. "
-            f"Explique pourquoi ce choix est adapté aux conditions données, en français simple."
-        )
+        preds = timed_predict(fertilizer_model, features)
+        predicted_label, confidence = decode_prediction(preds)
+        if shadow_version:
+            shadow_predict.delay('fertilizer', shadow_version, predicted_label, features=features.tolist())
 
-        gemini_response = model.generate_content(french_prompt)
-
-        # Step 7: Save results
+        # Step 6: Save the prediction
         fertilizer.predicted_label = predicted_label
-        fertilizer.predicted_fertilizer = predicted_fertilizer
+        fertilizer.predicted_fertilizer = fertilizer_model.labels.get(str(predicted_label), "Inconnu")
         fertilizer.confidence_score = confidence
-        fertilizer.explanation = gemini_response.text
-        fertilizer.status = 'completed'
-        fertilizer.save()
+        fertilizer.model_version = fertilizer_model.version
+        fertilizer.save(update_fields=['predicted_label', 'predicted_fertilizer', 'confidence_score', 'model_version', 'updated_at'])
+        publish_status(FertilizerRecommendation, fertilizer_id)
 
     except Exception as e:
-        if fertilizer:
-            fertilizer.status = 'failed'
-            fertilizer.explanation = f"Erreur lors de la génération : {str(e)}"
-            fertilizer.confidence_score = 0
-            fertilizer.save()
+        transition_status(
+            FertilizerRecommendation, fertilizer_id, ['processing'], 'failed',
+            explanation=f"Erreur lors de la génération : {str(e)}", confidence_score=0,
+        )
+        publish_status(FertilizerRecommendation, fertilizer_id)
         raise
 
+    # Step 7: Generate French explanation using Gemini
+    explain('fertilizer', fertilizer)
+
 @shared_task
 def generate_crop_recommendation(crop_id):
-    crop_rec = None
+    if not transition_status(CropRecommendation, crop_id, ['pending'], 'processing'):
+        print(f"Recommandation de culture {crop_id} n'est plus en attente, ignorée.")
+        return
+    publish_status(CropRecommendation, crop_id)
+
     try:
         crop_rec = CropRecommendation.objects.get(id=crop_id)
-        crop_rec.status = 'processing'
-        crop_rec.save()
 
-        if CROP_MODEL is None:
-            raise Exception("Crop model not loaded")
+        try:
+            crop_model, shadow_version = route_model('crop')
+        except RuntimeError as e:
+            raise Exception(f"Crop model not loaded: {e}")
 
         features = np.array([[
             crop_rec.nitrogen,
@@ -225,45 +336,29 @@ def generate_crop_recommendation(crop_id):
             crop_rec.rainfall
         ]])
 
-        preds = CROP_MODEL.predict(features)
-
-        if preds.ndim == 2:
-            predicted_label = int(np.argmax(preds, axis=1)[0])
-            confidence = float(preds[0][predicted_label])
-        else:
-            predicted_label = int(preds[0])
-            confidence = 1.0
-
-        predicted_crop = CROP_LABELS.get(str(predicted_label), "Inconnu")
-
-        # 🇫🇷 Prompt Gemini in French
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-pro")
-        french_prompt = (
-            f"L'utilisateur a fourni les données suivantes concernant les conditions du sol et du climat : "
-            f"Azote (N) = {crop_rec.nitrogen}, Phosphore (P) = {crop_rec.phosphorus}, Potassium (K) = {crop_rec.potassium}, "
-            f"Température = {crop_rec.temperature}°C, Humidité = {crop_rec.humidity}%, pH = {crop_rec.ph}, Pluviométrie = {crop_rec.rainfall} mm. "
-            f"Sur cette base, le modèle a prédit que la culture la plus adaptée est : '{predicted_crop}'. "
-            f"Expliquez pourquoi cette culture est un bon choix pour ces conditions, en français simple."
-        )
-
-        gemini_response = model.generate_content(french_prompt)
+        preds = timed_predict(crop_model, features)
+        predicted_label, confidence = decode_prediction(preds)
+        if shadow_version:
+            shadow_predict.delay('crop', shadow_version, predicted_label, features=features.tolist())
 
         crop_rec.predicted_label = predicted_label
-        crop_rec.predicted_crop = predicted_crop
+        crop_rec.predicted_crop = crop_model.labels.get(str(predicted_label), "Inconnu")
         crop_rec.confidence_score = confidence
-        crop_rec.explanation = gemini_response.text
-        crop_rec.status = 'completed'
-        crop_rec.save()
+        crop_rec.model_version = crop_model.version
+        crop_rec.save(update_fields=['predicted_label', 'predicted_crop', 'confidence_score', 'model_version', 'updated_at'])
+        publish_status(CropRecommendation, crop_id)
 
     except Exception as e:
-        if crop_rec:
-            crop_rec.status = 'failed'
-            crop_rec.explanation = f"Erreur lors de la génération : {str(e)}"
-            crop_rec.confidence_score = 0
-            crop_rec.save()
+        transition_status(
+            CropRecommendation, crop_id, ['processing'], 'failed',
+            explanation=f"Erreur lors de la génération : {str(e)}", confidence_score=0,
+        )
+        publish_status(CropRecommendation, crop_id)
         raise
 
+    # 🇫🇷 Explanation by Gemini in French
+    explain('crop', crop_rec)
+
 @shared_task
 def generate_ai_response(message_id, conversation_id):
     try:
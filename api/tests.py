@@ -1,9 +1,46 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
-from .models import PlantType, SoilType, Climate, Diagnostic, Conversation, Message, Recommendation
+from .models import PlantType, SoilType, Climate, Diagnostic, Conversation, Message, Recommendation, CropRecommendation, UploadSession, transition_status
+from django.test import override_settings
+from .inference import TreeEnsembleModel
+from . import inference, model_registry
+from .metrics import stage
+from . import scheduling, status_mirror, tasks, throttling, tracing, uploads
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from types import SimpleNamespace
+from . import benchmarks
+from .renderers import ORJSONRenderer
+from rest_framework.renderers import JSONRenderer
+from .gemini import get_gemini_response
+import asyncio
+from unittest import mock
+from django.conf import settings
+import statistics
+import time
+from django.db import connection
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+import numpy as np
+import joblib
+import msgpack
+import base64
+import io
+import json
+import tempfile
+from PIL import Image
+import os
+from datetime import timedelta
+from django.utils import timezone
+import boto3
+import requests
+from moto import mock_aws
 
 User = get_user_model()
 
@@ -131,3 +168,1021 @@ class AuthenticationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('access', response.data)
         self.assertIn('refresh', response.data)
+
+class TreeEnsembleModelTests(TestCase):
+    def setUp(self):
+        from sklearn.ensemble import RandomForestClassifier
+
+        rng = np.random.default_rng(0)
+        self.X = rng.uniform(0, 100, size=(300, 7))
+        y = (self.X[:, 0] + self.X[:, 3] > 100).astype(int) + (self.X[:, 5] > 50).astype(int)
+        self.estimator = RandomForestClassifier(n_estimators=10, random_state=0).fit(self.X, y)
+
+    def test_predictions_match_sklearn(self):
+        flat = TreeEnsembleModel.from_estimator(self.estimator)
+        np.testing.assert_array_equal(flat.predict(self.X), self.estimator.predict(self.X))
+        np.testing.assert_allclose(flat.predict_proba(self.X), self.estimator.predict_proba(self.X))
+
+    def test_save_and_load_roundtrip(self):
+        flat = TreeEnsembleModel.from_estimator(self.estimator)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.flat')
+            flat.save(path)
+            loaded = TreeEnsembleModel.load(path)
+            self.assertIsInstance(loaded.threshold, np.memmap)
+            np.testing.assert_array_equal(loaded.predict(self.X[:1]), self.estimator.predict(self.X[:1]))
+
+
+class DiseaseModelRuntimeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import keras
+        from .management.commands.export_disease_model import convert_to_tflite
+
+        cls.tmp = tempfile.mkdtemp()
+        cls.keras_path = os.path.join(cls.tmp, 'tiny.keras')
+        cls.tflite_path = os.path.join(cls.tmp, 'tiny.tflite')
+        keras.utils.set_random_seed(0)
+        model = keras.Sequential([
+            keras.Input((8, 8, 3)),
+            keras.layers.Conv2D(4, 3, activation='relu'),
+            keras.layers.GlobalAveragePooling2D(),
+            keras.layers.Dense(3, activation='softmax'),
+        ])
+        model.save(cls.keras_path)
+        with open(cls.tflite_path, 'wb') as f:
+            f.write(convert_to_tflite(model, 'none', None))
+
+    @classmethod
+    def tearDownClass(cls):
+        import shutil
+
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_runtime_follows_setting(self):
+        with override_settings(DISEASE_MODEL_RUNTIME='tflite'):
+            self.assertIsInstance(inference.load_disease_model(self.keras_path, self.tflite_path), inference.TFLiteModel)
+            # Not converted yet: the Keras model still serves
+            missing = os.path.join(self.tmp, 'missing.tflite')
+            self.assertNotIsInstance(inference.load_disease_model(self.keras_path, missing), inference.TFLiteModel)
+        with override_settings(DISEASE_MODEL_RUNTIME='keras'):
+            self.assertNotIsInstance(inference.load_disease_model(self.keras_path, self.tflite_path), inference.TFLiteModel)
+
+    def test_tflite_predict_matches_keras_shape(self):
+        batch = np.random.default_rng(0).uniform(0, 255, size=(2, 8, 8, 3)).astype(np.float32)
+        tflite = inference.TFLiteModel(self.tflite_path)
+        self.assertEqual(tflite.input_shape, (None, 8, 8, 3))
+        keras_model = inference.load_disease_model(self.keras_path, self.tflite_path)
+        np.testing.assert_allclose(tflite.predict(batch), keras_model.predict(batch, verbose=0), atol=1e-4)
+        # Other batch sizes resize the interpreter's input
+        self.assertEqual(tflite.predict(batch[:1]).shape, (1, 3))
+
+    def test_export_refuses_a_model_below_min_agreement(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        output = os.path.join(self.tmp, 'exported.tflite')
+        options = {'quantize': 'none', 'samples': 4, 'output': output, 'stdout': io.StringIO()}
+        with override_settings(DISEASE_MODEL_PATH=self.keras_path):
+            with self.assertRaisesMessage(CommandError, 'Parity check failed'):
+                call_command('export_disease_model', min_agreement=1.01, **options)
+            self.assertFalse(os.path.exists(output) or os.path.exists(f'{output}.tmp'))
+
+            # An interpreter failure does not leave the temporary file behind either
+            command = 'api.management.commands.export_disease_model.TFLiteModel'
+            with mock.patch(command, side_effect=ValueError('bad flatbuffer')), self.assertRaises(ValueError):
+                call_command('export_disease_model', **options)
+            self.assertFalse(os.path.exists(f'{output}.tmp'))
+
+            call_command('export_disease_model', min_agreement=0.5, **options)
+            self.assertTrue(os.path.exists(output))
+
+    def test_export_resizes_sample_images_to_a_non_square_input(self):
+        import keras
+        from django.core.management import call_command
+        from PIL import Image
+
+        keras_path = os.path.join(self.tmp, 'wide.keras')
+        keras.Sequential([
+            keras.Input((6, 10, 3)),
+            keras.layers.Conv2D(2, (6, 10)),  # a full-image kernel rejects transposed images
+            keras.layers.Flatten(),
+            keras.layers.Dense(3, activation='softmax'),
+        ]).save(keras_path)
+        images = os.path.join(self.tmp, 'images')
+        os.makedirs(images, exist_ok=True)
+        Image.new('RGB', (40, 30), 'green').save(os.path.join(images, 'leaf.jpg'))
+
+        output = os.path.join(self.tmp, 'wide.tflite')
+        stdout = io.StringIO()
+        with override_settings(DISEASE_MODEL_PATH=keras_path):
+            call_command('export_disease_model', quantize='none', images=images, output=output, stdout=stdout)
+        self.assertTrue(os.path.exists(output))
+        self.assertEqual(inference.TFLiteModel(output).input_shape, (None, 6, 10, 3))
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        from sklearn.tree import DecisionTreeClassifier
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(
+            MODEL_REGISTRY_PATH=os.path.join(self.tmp.name, 'registry'),
+            MODEL_REGISTRY_POLL_SECONDS=0,
+            TABULAR_MODEL_RUNTIME='sklearn',
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        inference._models.clear()
+        self.addCleanup(inference._models.clear)
+        inference._candidate_configs.clear()
+        self.addCleanup(inference._candidate_configs.clear)
+
+        X = np.arange(20, dtype=float).reshape(10, 2)
+        self.sources = {}
+        for version, y in (('v1', [0] * 10), ('v2', [1] * 10)):
+            model_path = os.path.join(self.tmp.name, f'{version}.joblib')
+            labels_path = os.path.join(self.tmp.name, f'{version}.json')
+            joblib.dump(DecisionTreeClassifier().fit(X, y), model_path)
+            with open(labels_path, 'w') as f:
+                json.dump({str(y[0]): f'crop-{version}'}, f)
+            self.sources[version] = {'model': model_path, 'labels': labels_path}
+
+    def test_publish_writes_manifest_with_checksums(self):
+        manifest = model_registry.publish('crop', self.sources['v1'], 'v1')
+        self.assertEqual(set(manifest['files']), {'model.joblib', 'labels.json'})
+        self.assertEqual(model_registry.verify('crop', 'v1'), manifest)
+        self.assertEqual(model_registry.active_version('crop'), model_registry.LEGACY_VERSION)
+
+    def test_activate_rejects_tampered_version(self):
+        model_registry.publish('crop', self.sources['v1'], 'v1')
+        with open(os.path.join(model_registry.version_dir('crop', 'v1'), 'labels.json'), 'w') as f:
+            f.write('{}')
+        with self.assertRaises(model_registry.RegistryError):
+            model_registry.activate('crop', 'v1')
+
+    def test_activate_endpoint_rejects_non_string_version(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='admin', password='adminpass123', role='admin'))
+        for version in (3, ['v1'], None):
+            response = client.post('/api/v1/ml/activate_model/', {'name': 'crop', 'version': version}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_model_hot_swaps_active_version(self):
+        for version in ('v1', 'v2'):
+            model_registry.publish('crop', self.sources[version], version)
+
+        model_registry.activate('crop', 'v1')
+        crop = inference.get_model('crop')
+        self.assertEqual(crop.version, 'v1')
+        self.assertEqual(crop.labels['0'], 'crop-v1')
+
+        model_registry.activate('crop', 'v2')
+        crop = inference.get_model('crop')
+        self.assertEqual(crop.version, 'v2')
+        self.assertEqual(int(crop.model.predict([[0, 0]])[0]), 1)
+
+    def test_route_model_serves_ab_candidate_and_flags_shadow(self):
+        for version in ('v1', 'v2'):
+            model_registry.publish('crop', self.sources[version], version)
+        model_registry.activate('crop', 'v1')
+
+        model_registry.set_candidate('crop', 'v2', 'ab', 1.0)
+        bundle, shadow_version = inference.route_model('crop')
+        self.assertEqual((bundle.version, shadow_version), ('v2', None))
+
+        model_registry.set_candidate('crop', 'v2', 'shadow', 1.0)
+        bundle, shadow_version = inference.route_model('crop')
+        self.assertEqual((bundle.version, shadow_version), ('v1', 'v2'))
+
+        model_registry.clear_candidate('crop')
+        bundle, shadow_version = inference.route_model('crop')
+        self.assertEqual((bundle.version, shadow_version), ('v1', None))
+
+    def test_predict_endpoint_routes_and_times_the_disease_model(self):
+        model = mock.Mock()
+        model.predict.return_value = np.array([[0.2, 0.8]])
+        bundle = inference.LoadedModel('disease', 'v2', model, {})
+        image = np.zeros((1, 8, 8, 3), dtype=np.uint8)
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='farmer', password='farmerpass123'))
+
+        with mock.patch('api.views.route_model', return_value=(bundle, 'v3')), \
+                mock.patch('api.views.preprocess_image', return_value=image), \
+                mock.patch('api.views.input_size'), \
+                mock.patch.object(tasks, 'record_latency') as record_latency, \
+                mock.patch.object(tasks.shadow_predict, 'delay') as shadow:
+            upload = SimpleUploadedFile('leaf.jpg', b'jpeg', content_type='image/jpeg')
+            response = client.post('/api/v1/ml/predict_disease/', {'image': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['predicted_class'], response.data['model_version']), (1, 'v2'))
+        record_latency.assert_called_once_with('disease', 'v2', mock.ANY)
+        shadow.assert_called_once_with('disease', 'v3', 1, features=image.tolist())
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTests(TestCase):
+    def test_metrics_endpoint_exposes_stage_histogram(self):
+        with stage('image_decode'):
+            pass
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'pipeline_stage_seconds_bucket{le="0.001",model_version="",stage="image_decode"}', response.content)
+
+    def test_metrics_need_the_scrape_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer guess').status_code, 403)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        # A local provider swapped in where spans are started: the global provider can only be
+        # set once per process, so setting it here would leak into every later test
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        tracer = provider.get_tracer('gardien_eveille')
+        for module in ('api.tracing', 'api.metrics', 'api.middleware', 'api.tasks'):
+            patcher = mock.patch(f'{module}.tracer', tracer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_request_span_continues_incoming_traceparent(self):
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        self.client.get('/metrics/', HTTP_TRACEPARENT=f'00-{trace_id}-00f067aa0ba902b7-01')
+        span = next(s for s in self.exporter.get_finished_spans() if s.kind == trace.SpanKind.SERVER)
+        self.assertEqual(span.name, 'GET metrics/')
+        self.assertEqual(format(span.context.trace_id, '032x'), trace_id)
+
+    def test_task_span_joins_publisher_trace_through_headers(self):
+        headers = {}
+        with tracing.tracer.start_as_current_span('publish') as publisher:
+            tracing.inject_trace_context(headers=headers)
+        request = SimpleNamespace(delivery_info={'routing_key': 'celery'}, **headers)
+        task = SimpleNamespace(name='api.tasks.analyze_plant_image', request=request)
+        tracing.start_task_span(task_id='t1', task=task)
+        with stage('image_decode'):
+            pass
+        tracing.end_task_span(task_id='t1', state='SUCCESS')
+
+        spans = {s.name: s for s in self.exporter.get_finished_spans()}
+        task_span = spans['api.tasks.analyze_plant_image']
+        self.assertEqual(task_span.context.trace_id, publisher.get_span_context().trace_id)
+        self.assertEqual(task_span.parent.span_id, publisher.get_span_context().span_id)
+        self.assertEqual(spans['image_decode'].parent.span_id, task_span.context.span_id)
+
+
+class BenchmarkHelpersTests(TestCase):
+    def test_run_load_counts_error_responses(self):
+        responses = [SimpleNamespace(status_code=200), SimpleNamespace(status_code=500)]
+        summary = benchmarks.run_load(lambda i: responses[i % 2], 10)
+        self.assertEqual(summary['errors'], 5)
+        self.assertEqual(summary['first_error'], 'HTTP 500')
+        self.assertEqual(summary['latency']['count'], 10)
+
+    @override_settings(LLM_BACKEND='stub', LLM_STUB_LATENCY_MS=0)
+    def test_stub_llm_backend_answers_locally(self):
+        response = asyncio.run(get_gemini_response('Bonjour'))
+        self.assertIn('simulée', response)
+
+
+PERF_BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'perf_budgets.json')
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(MEDIA_ROOT=os.path.join(tempfile.gettempdir(), 'gardien-eveille-test-media'), CACHES=LOCMEM_CACHES)
+class PerformanceBudgetTests(APITestCase):
+    """
+    Query count and wall time of the main GET endpoints on a seeded dataset,
+    checked against api/perf_budgets.json. Query counts are always checked;
+    wall time only when PERF_BUDGET_TIME_FACTOR is set (1 on a dedicated
+    machine, more on slower ones), as shared CI runners are too noisy for it.
+    UPDATE_PERF_BUDGETS=1 rewrites the file with the measured values
+    (queries exact, time x3 headroom, at least 25 ms).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        users = benchmarks.seed_data(users=2, conversations=5, messages=20, diagnostics=15)
+        cls.user = users[0]
+        cls.conversation = cls.user.conversations.first()
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def measure(self, path, runs=3):
+        queries, durations = 0, []
+        for _ in range(runs):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self.client.get(path)
+                durations.append((time.perf_counter() - start) * 1000)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, path)
+            queries = max(queries, len(captured))
+        return queries, statistics.median(durations), captured
+
+    def test_endpoints_within_budget(self):
+        with open(PERF_BUDGETS_PATH) as f:
+            budgets = json.load(f)
+        time_factor = os.getenv('PERF_BUDGET_TIME_FACTOR')
+        measured = {}
+        for route, budget in budgets.items():
+            with self.subTest(route=route):
+                queries, ms, captured = self.measure(route.format(conversation=self.conversation.id))
+                measured[route] = {'queries': queries, 'ms': max(round(ms * 3), 25)}
+                self.assertLessEqual(
+                    queries, budget['queries'],
+                    f"{route} ran {queries} queries (budget {budget['queries']}):\n"
+                    + '\n'.join(q['sql'] for q in captured.captured_queries),
+                )
+                if time_factor:
+                    self.assertLessEqual(ms, budget['ms'] * float(time_factor), f"{route} took {ms:.1f} ms (budget {budget['ms']} ms)")
+
+        if os.getenv('UPDATE_PERF_BUDGETS'):
+            with open(PERF_BUDGETS_PATH, 'w') as f:
+                json.dump(measured, f, indent=2)
+                f.write('\n')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='adminpass123', role='admin')
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+
+    def authorize(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def test_admin_request_is_profiled_and_downloadable(self):
+        self.authorize(self.admin)
+        response = self.client.get('/api/v1/plant-types/', HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+
+        profile = self.client.get(f'/api/v1/profiles/{profile_id}/').json()
+        self.assertEqual(profile['path'], '/api/v1/plant-types/')
+        self.assertEqual(profile['query_count'], len(profile['queries']))
+        # The catalog may come from the cache; the diagnostics list always reads its table
+        response = self.client.get('/api/v1/diagnostics/', HTTP_X_PROFILE='1')
+        profile = self.client.get(f"/api/v1/profiles/{response['X-Profile-Id']}/").json()
+        self.assertTrue(any('api_diagnostic' in query['sql'] for query in profile['queries']))
+        self.assertIn('cumulative', profile['summary'])
+        download = self.client.get(f'/api/v1/profiles/{profile_id}/download/')
+        self.assertEqual(download['Content-Type'], 'application/octet-stream')
+
+    def test_header_is_ignored_for_other_users(self):
+        self.authorize(self.user)
+        response = self.client.get('/api/v1/plant-types/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=User.objects.create_user(username='farmer', password='farmerpass123'))
+        self.plant_type = PlantType.objects.create(name='Maize', scientific_name='Zea mays', description='Cereal', emoji='🌽')
+        self.soil_type = SoilType.objects.create(name='Loam', description='Balanced', characteristics={})
+        self.soil_type.suitable_plants.add(self.plant_type)
+
+    def test_list_is_served_from_cache_until_catalog_changes(self):
+        self.client.get('/api/v1/soil-types/')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/v1/soil-types/')
+        self.assertEqual(cached.data['results'][0]['suitable_plants'][0]['name'], 'Maize')
+
+        self.plant_type.name = 'Corn'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plant_type.save()
+            # Not before the commit, or a concurrent reader would cache the old name under the new version
+            self.assertEqual(self.client.get('/api/v1/soil-types/').data, cached.data)
+        response = self.client.get('/api/v1/soil-types/')
+        self.assertEqual(response.data['results'][0]['suitable_plants'][0]['name'], 'Corn')
+
+    def test_unchanged_catalog_returns_not_modified(self):
+        etag = self.client.get('/api/v1/plant-types/')['ETag']
+        response = self.client.get('/api/v1/plant-types/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soil_type.suitable_plants.clear()
+        response = self.client.get('/api/v1/plant-types/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ConditionalResponseTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        self.conversation = Conversation.objects.create(user=self.user, title='Mildiou')
+
+    def test_detail_not_modified_until_a_message_is_added(self):
+        url = f'/api/v1/conversations/{self.conversation.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Message.objects.create(conversation=self.conversation, role='user', content='Bonjour')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['messages']), 1)
+
+    def test_list_etag_changes_on_delete(self):
+        other = Conversation.objects.create(user=self.user, title='Engrais')
+        etag = self.client.get('/api/v1/conversations/')['ETag']
+        self.assertEqual(self.client.get('/api/v1/conversations/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        other.delete()
+        self.assertEqual(self.client.get('/api/v1/conversations/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_large_json_is_gzipped(self):
+        for i in range(30):
+            Conversation.objects.create(user=self.user, title=f'Conversation {i}')
+        response = self.client.get('/api/v1/conversations/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        self.conversation = Conversation.objects.create(user=self.user, title='Mildiou')
+        Message.objects.create(conversation=self.conversation, role='user', content='Bonjour')
+
+    def test_only_requested_fields_are_returned(self):
+        response = self.client.get('/api/v1/conversations/?fields=id,title')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+    def test_dotted_paths_select_nested_fields(self):
+        response = self.client.get(f'/api/v1/conversations/{self.conversation.id}/?fields=id,messages.content,user.username')
+        self.assertEqual(response.data['messages'], [{'content': 'Bonjour'}])
+        self.assertEqual(response.data['user'], {'username': 'farmer'})
+
+    def test_unrequested_nested_objects_are_not_queried(self):
+        with CaptureQueriesContext(connection) as full:
+            self.client.get('/api/v1/conversations/')
+        with CaptureQueriesContext(connection) as sparse:
+            self.client.get('/api/v1/conversations/?fields=id,title')
+        self.assertLess(len(sparse), len(full))
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/v1/conversations/?fields=id,nope')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_messagepack_encoding(self):
+        response = self.client.get('/api/v1/conversations/?fields=id,title', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['results'], [{'id': self.conversation.id, 'title': 'Mildiou'}])
+
+
+class ORJSONTests(APITestCase):
+    def test_renderer_matches_stdlib_json(self):
+        data = benchmarks.synthetic_responses(messages=5, diagnostics=5)
+        for payload in data.values():
+            self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+    def test_line_separators_are_escaped_and_non_finite_floats_are_null(self):
+        payload = {'content': 'Ligne\u2028suivante\u2029fin'}
+        self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertIn(b'\\u2028', ORJSONRenderer().render(payload))
+
+        # Documented difference: JSONRenderer refuses NaN (STRICT_JSON), orjson writes null
+        payload = {'confidence': float('nan'), 'score': float('inf')}
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(payload)
+        self.assertEqual(json.loads(ORJSONRenderer().render(payload)), {'confidence': None, 'score': None})
+
+    def test_malformed_body_is_a_parse_error(self):
+        user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=user)
+        conversation = Conversation.objects.create(user=user)
+        url = f'/api/v1/conversations/{conversation.id}/messages/'
+        response = self.client.post(url, '{"content": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        body = json.dumps({'conversation': conversation.id, 'content': 'Maïs'}, ensure_ascii=False)
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)['content'], 'Maïs')
+
+
+class LoginTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+
+    def test_login_issues_working_tokens(self):
+        response = self.client.post('/api/v1/login/', {'username': 'farmer', 'password': 'farmerpass123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'farmer')
+        self.assertEqual(RefreshToken(response.data['refresh'])['user_id'], self.user.id)
+
+        me = self.client.get('/api/v1/users/me/', HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(me.status_code, status.HTTP_200_OK)
+
+    def test_wrong_password_and_inactive_user_are_rejected(self):
+        response = self.client.post('/api/v1/login/', {'username': 'farmer', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post('/api/v1/login/', {'username': 'farmer', 'password': 'farmerpass123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_login_rehashes_at_the_configured_cost(self):
+        self.client.post('/api/v1/login/', {'username': 'farmer', 'password': 'farmerpass123'}, format='json')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123', full_name='Jean Farmer')
+        response = self.client.post('/api/v1/login/', {'username': 'farmer', 'password': 'farmerpass123'}, format='json')
+        self.auth = f"Bearer {response.data['access']}"
+
+    def user_queries(self, method='get', url='/api/v1/diagnostics/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, HTTP_AUTHORIZATION=self.auth)
+        self.assertLess(response.status_code, 400)
+        return [q for q in queries.captured_queries if 'FROM "api_user"' in q['sql']]
+
+    def test_user_is_cached_until_saved(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/v1/diagnostics/', HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_access_token_carries_identity_claims(self):
+        claims = AccessToken(self.auth.split()[1])
+        self.assertEqual((claims['username'], claims['role'], claims['is_staff']), ('farmer', 'user', False))
+
+    @override_settings(JWT_TRUST_CLAIMS=True, AUTH_USER_CACHE_SECONDS=0)
+    def test_trusted_claims_skip_the_user_lookup_on_reads(self):
+        self.assertEqual(self.user_queries(), [])
+        conversation = Conversation.objects.create(user=self.user)
+        self.assertEqual(len(self.user_queries('delete', f'/api/v1/conversations/{conversation.id}/')), 1)
+
+        response = self.client.get('/api/v1/users/me/', HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.data['full_name'], 'Jean Farmer')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'diagnostics_analyze': '2/min'},
+})
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        plant_type = PlantType.objects.create(name='Tomate')
+        diagnostic = Diagnostic.objects.create(user=self.user, plant_type=plant_type, image='diagnostics/leaf.jpg', status='processing')
+        self.url = f'/api/v1/diagnostics/{diagnostic.id}/analyze/'
+
+    def test_token_bucket_per_user(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.url).status_code, status.HTTP_409_CONFLICT)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(0 < int(response['Retry-After']) <= 30)
+
+        # Routes without a scope are not throttled
+        self.assertEqual(self.client.get('/api/v1/diagnostics/').status_code, status.HTTP_200_OK)
+
+    @override_settings(ADMISSION_QUEUE_LIMITS={'interactive': 100, 'bulk': 100})
+    def test_backlog_rejects_new_work(self):
+        depths = {'interactive': 150, 'bulk': 0}
+        with mock.patch.object(throttling, 'queue_depth', side_effect=depths.get):
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], str(settings.ADMISSION_RETRY_AFTER_SECONDS))
+
+    @override_settings(ADMISSION_QUEUE_LIMITS={'interactive': 100, 'bulk': 100})
+    def test_full_bulk_queue_only_rejects_campaigns(self):
+        depths = {'interactive': 0, 'bulk': 5000}
+        with mock.patch.object(throttling, 'queue_depth', side_effect=depths.get):
+            # A single diagnosis would go to 'interactive': admitted (then refused as already processing)
+            self.assertEqual(self.client.post(self.url).status_code, status.HTTP_409_CONFLICT)
+            cache.set(scheduling.pending_key(self.user.id), settings.SCHEDULING_BULK_THRESHOLD)
+            self.assertEqual(self.client.post(self.url).status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SCHEDULING_BULK_THRESHOLD=2, SCHEDULING_FAIR_SHARE_STEP=2)
+class SchedulingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_backlog_moves_a_user_to_bulk_with_decreasing_priority(self):
+        placements = [scheduling.classify(scheduling._add_pending(7, 1)) for _ in range(6)]
+        self.assertEqual(placements, [
+            ('interactive', 0), ('interactive', 0), ('bulk', 1), ('bulk', 1), ('bulk', 2), ('bulk', 2),
+        ])
+        # Another user is not affected by the first one's backlog
+        self.assertEqual(scheduling.classify(scheduling._add_pending(8, 1)), ('interactive', 0))
+
+    def test_finished_tasks_release_their_slot(self):
+        for _ in range(3):
+            scheduling._add_pending(7, 1)
+        finished = SimpleNamespace(request=SimpleNamespace(scheduling_user=7))
+        for _ in range(4):
+            scheduling.release_pending(task=finished)
+        self.assertEqual(cache.get(scheduling.pending_key(7)), 0)
+
+    def test_priority_queues_are_counted_for_admission(self):
+        self.assertEqual(scheduling.queue_keys('bulk'), ['bulk'] + [f'bulk:{step}' for step in range(1, 10)])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        plant_type = PlantType.objects.create(name='Tomate')
+        self.diagnostic = Diagnostic.objects.create(
+            user=self.user, plant_type=plant_type, image='diagnostics/leaf.jpg', status='completed',
+            result={'disease_name': 'Mildiou', 'confidence': 0.9, 'disease_detected': True},
+        )
+        self.url = f'/api/v1/diagnostics/{self.diagnostic.id}/analyze/'
+
+    def test_retried_request_is_replayed(self):
+        with mock.patch('api.views.submit_analysis') as submit:
+            first = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='retry-1')
+            replay = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='retry-1')
+            # Without the key the same retry is a conflicting second analysis
+            conflict = self.client.post(self.url)
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((replay.status_code, replay.data), (first.status_code, first.data))
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        submit.assert_called_once()
+
+    def test_lost_analysis_can_be_restarted(self):
+        Diagnostic.objects.filter(pk=self.diagnostic.pk).update(status='processing', updated_at=timezone.now())
+        with mock.patch('api.views.submit_analysis') as submit:
+            self.assertEqual(self.client.post(self.url).status_code, status.HTTP_409_CONFLICT)
+            # The worker died: nothing has touched the diagnostic since
+            stuck = timezone.now() - timedelta(seconds=settings.ANALYSIS_STALE_SECONDS + 1)
+            Diagnostic.objects.filter(pk=self.diagnostic.pk).update(updated_at=stuck)
+            self.assertEqual(self.client.post(self.url).status_code, status.HTTP_202_ACCEPTED)
+        submit.assert_called_once()
+        self.assertEqual(Diagnostic.objects.get(pk=self.diagnostic.pk).status, 'pending')
+
+    def test_saved_prediction_moves_updated_at(self):
+        Diagnostic.objects.filter(pk=self.diagnostic.pk).update(status='pending')
+        bundle = inference.LoadedModel('disease', 'v7', None, {'1': 'Late Blight'})
+        claimed = timezone.now() - timedelta(minutes=1)
+
+        def predict(*args):
+            # As if the claim happened a minute before the prediction was ready
+            Diagnostic.objects.filter(pk=self.diagnostic.pk).update(updated_at=claimed)
+            return np.array([[0.1, 0.9]])
+
+        with mock.patch.object(tasks, 'route_model', return_value=(bundle, None)), \
+                mock.patch.object(tasks, 'preprocess_stored_image'), \
+                mock.patch.object(tasks, 'input_size'), \
+                mock.patch.object(tasks, 'timed_predict', side_effect=predict), \
+                mock.patch.object(tasks, 'explain'):
+            tasks.analyze_plant_image(self.diagnostic.id)
+        diagnostic = Diagnostic.objects.get(pk=self.diagnostic.pk)
+        self.assertEqual(diagnostic.result['disease_name'], 'Late Blight')
+        self.assertGreater(diagnostic.updated_at, claimed)
+
+    def test_claimed_diagnostic_is_not_analyzed_twice(self):
+        Diagnostic.objects.filter(pk=self.diagnostic.pk).update(status='processing')
+        with mock.patch.object(tasks, 'route_model') as route:
+            tasks.analyze_plant_image(self.diagnostic.id)
+        route.assert_not_called()
+
+    def test_llm_failure_keeps_the_prediction(self):
+        Diagnostic.objects.filter(pk=self.diagnostic.pk).update(status='processing')
+        diagnostic = Diagnostic.objects.get(pk=self.diagnostic.pk)
+        failure = mock.patch.object(tasks, 'generate_explanation', side_effect=RuntimeError('quota'))
+        with failure, mock.patch.object(tasks.explain_result, 'apply_async') as retry_later:
+            tasks.explain('diagnostic', diagnostic)
+        retry_later.assert_called_once()
+        self.assertEqual(retry_later.call_args.args[0], ('diagnostic', diagnostic.pk))
+        diagnostic.refresh_from_db()
+        self.assertEqual(diagnostic.status, 'processing')
+
+        # Once the retries are spent the diagnostic completes without an explanation
+        with failure:
+            tasks.explain_result.apply(args=('diagnostic', diagnostic.pk), retries=settings.LLM_MAX_RETRIES)
+        diagnostic.refresh_from_db()
+        self.assertEqual(diagnostic.status, 'completed')
+        self.assertEqual(diagnostic.result['disease_name'], 'Mildiou')
+        self.assertEqual(diagnostic.result['explanation_error'], 'quota')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StatusBatchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        other = User.objects.create_user(username='neighbour', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        plant_type = PlantType.objects.create(name='Tomate')
+        self.diagnostics = [
+            Diagnostic.objects.create(user=user, plant_type=plant_type, image='diagnostics/leaf.jpg')
+            for user in (self.user, self.user, other)
+        ]
+        self.crop = CropRecommendation.objects.create(
+            user=self.user, nitrogen=90, phosphorus=42, potassium=43, temperature=21, humidity=82, ph=6.5, rainfall=203,
+        )
+        ids = ','.join(str(d.id) for d in reversed(self.diagnostics[:2]))
+        self.url = f'/api/v1/status/?diagnostics={ids}&crop_recommendations={self.crop.id}'
+
+    def test_batch_reads_one_query_per_model_then_the_mirror(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(captured), 2)
+        self.assertEqual([d['id'] for d in response.data['diagnostics']], [self.diagnostics[1].id, self.diagnostics[0].id])
+        self.assertEqual(response.data['crop_recommendations'][0]['status'], 'pending')
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(self.url).data, response.data)
+        self.assertEqual(len(captured), 0)
+
+        # Another user's diagnostic is left out, mirrored or not
+        status_mirror.publish_status(Diagnostic, self.diagnostics[2].pk)
+        response = self.client.get(f'/api/v1/status/?diagnostics={self.diagnostics[2].id},{self.diagnostics[0].id}')
+        self.assertEqual([d['id'] for d in response.data['diagnostics']], [self.diagnostics[0].id])
+
+    def test_tasks_publish_status_changes(self):
+        self.client.get(self.url)
+        diagnostic = self.diagnostics[0]
+        transition_status(Diagnostic, diagnostic.pk, ['pending'], 'completed', result={'disease_name': 'Mildiou', 'confidence': 0.9})
+        status_mirror.publish_status(Diagnostic, diagnostic.pk)
+
+        entry = self.client.get(self.url).data['diagnostics'][1]
+        self.assertEqual((entry['status'], entry['result']), ('completed', {'disease_name': 'Mildiou', 'confidence': 0.9}))
+
+    def test_back_fill_keeps_a_status_published_meanwhile(self):
+        diagnostic = self.diagnostics[0]
+        stale = status_mirror._load('diagnostics', [diagnostic.pk])
+        transition_status(Diagnostic, diagnostic.pk, ['pending'], 'completed')
+        status_mirror.publish_status(Diagnostic, diagnostic.pk)
+        # The poller read the row before the task published its completion
+        with mock.patch.object(status_mirror, '_load', return_value=stale), \
+                mock.patch.object(status_mirror.cache, 'get_many', return_value={}):
+            status_mirror.get_statuses(self.user.id, {'diagnostics': [diagnostic.pk]})
+        self.assertEqual(cache.get(status_mirror.status_key('diagnostics', diagnostic.pk))['status'], 'completed')
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get('/api/v1/status/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/v1/status/?diagnostics=1,x').status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(STATUS_BATCH_MAX_IDS=2):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SYNC_WATERMARK_OVERLAP_SECONDS=0)
+class SyncTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        other = User.objects.create_user(username='neighbour', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        plant_type = PlantType.objects.create(name='Tomate')
+        self.diagnostics = [
+            Diagnostic.objects.create(user=user, plant_type=plant_type, image='diagnostics/leaf.jpg')
+            for user in (self.user, self.user, other)
+        ]
+        self.conversation = Conversation.objects.create(user=self.user, title='Mildiou')
+        Message.objects.create(conversation=self.conversation, role='user', content='Taches brunes ?')
+
+    def rows(self, data, kind, field='id'):
+        changes = data['changes'][kind]
+        return [row[changes['fields'].index(field)] for row in changes['rows']]
+
+    def test_full_then_delta_sync(self):
+        with CaptureQueriesContext(connection) as captured:
+            full = self.client.get('/api/v1/sync/').data
+        self.assertEqual(len(captured), 5)  # one per kind, no tombstones without a watermark
+        self.assertTrue(full['reset'])
+        self.assertEqual(self.rows(full, 'diagnostics'), [d.id for d in self.diagnostics[:2]])
+        self.assertEqual(self.rows(full, 'messages', 'content'), ['Taches brunes ?'])
+        self.assertNotIn('user_id', full['changes']['diagnostics']['fields'])
+        self.assertEqual(self.rows(full, 'diagnostics', 'image'), ['/media/diagnostics/leaf.jpg'] * 2)
+        self.assertNotIn('media_url', full)
+
+        transition_status(Diagnostic, self.diagnostics[1].pk, ['pending'], 'processing')
+        conversation_id = self.conversation.id
+        self.conversation.delete()
+        delta = self.client.get('/api/v1/sync/', {'since': full['watermark']}).data
+        self.assertFalse(delta['reset'])
+        self.assertEqual(self.rows(delta, 'diagnostics', 'status'), ['processing'])
+        self.assertEqual(self.rows(delta, 'conversations'), [])
+        self.assertEqual(delta['deleted']['conversations'], [conversation_id])
+        self.assertEqual(delta['deleted']['messages'], [])
+
+    @override_settings(SYNC_PAGE_SIZE=1)
+    def test_pages_until_caught_up(self):
+        first = self.client.get('/api/v1/sync/').data
+        self.assertTrue(first['has_more'])
+        second = self.client.get('/api/v1/sync/', {'since': first['watermark']}).data
+        self.assertFalse(second['has_more'])
+        self.assertEqual(self.rows(second, 'diagnostics'), [self.diagnostics[1].id])
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_pages_through_rows_sharing_one_timestamp(self):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role='user', content=f'Question {i}') for i in range(4)
+        ])
+        # As after the migration that back-filled updated_at with one value
+        Message.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        first = self.client.get('/api/v1/sync/').data
+        received = self.rows(first, 'messages')
+        data = first
+        for _ in range(5):
+            if not data['has_more']:
+                break
+            data = self.client.get('/api/v1/sync/', {'since': data['watermark']}).data
+            received += self.rows(data, 'messages')
+        self.assertFalse(data['has_more'])
+        self.assertEqual(sorted(received), sorted(Message.objects.values_list('id', flat=True)))
+
+    def test_rejects_bad_watermark(self):
+        for since in ('yesterday', base64.urlsafe_b64encode(b'{"messages": 1}').decode()):
+            self.assertEqual(self.client.get('/api/v1/sync/', {'since': since}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    MEDIA_ROOT=os.path.join(tempfile.gettempdir(), 'gardien-eveille-test-media'),
+    UPLOAD_SESSION_DIR=os.path.join(tempfile.gettempdir(), 'gardien-eveille-test-uploads'),
+)
+class ResumableUploadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        self.plant_type = PlantType.objects.create(name='Tomate')
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'green').save(buffer, 'JPEG')
+        self.image = buffer.getvalue()
+
+    def open_upload(self, length):
+        metadata = ','.join(
+            f'{key} {base64.b64encode(value.encode()).decode()}'
+            for key, value in {'plant_type_id': str(self.plant_type.id), 'filename': 'leaf.jpg'}.items()
+        )
+        response = self.client.post('/api/v1/uploads/', HTTP_UPLOAD_LENGTH=str(length), HTTP_UPLOAD_METADATA=metadata)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response['Location']
+
+    def send(self, url, chunk, offset):
+        return self.client.patch(url, chunk, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_upload_resumes_and_creates_the_diagnostic(self):
+        url = self.open_upload(len(self.image))
+        half = len(self.image) // 2
+        response = self.send(url, self.image[:half], 0)
+        self.assertEqual((response.status_code, response['Upload-Offset']), (status.HTTP_204_NO_CONTENT, str(half)))
+
+        # A chunk sent from a stale offset is refused; HEAD tells where to resume
+        self.assertEqual(self.send(url, self.image, 0).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], str(half))
+
+        with mock.patch('api.views.submit_analysis') as submit:
+            response = self.send(url, self.image[half:], half)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        diagnostic = Diagnostic.objects.get(pk=response.data['id'])
+        self.assertEqual((diagnostic.user, diagnostic.status), (self.user, 'pending'))
+        self.assertEqual(diagnostic.image.read(), self.image)
+        submit.assert_called_once_with(diagnostic)
+
+    def test_missing_partial_file_restarts_the_upload(self):
+        url = self.open_upload(len(self.image))
+        half = len(self.image) // 2
+        self.send(url, self.image[:half], 0)
+        session = UploadSession.objects.get()
+        os.remove(uploads.partial_path(session))  # e.g. the chunk went to another web node
+
+        response = self.send(url, self.image[half:], half)
+        self.assertEqual((response.status_code, response['Upload-Offset']), (status.HTTP_409_CONFLICT, '0'))
+        with mock.patch('api.views.submit_analysis'):
+            response = self.send(url, self.image, 0)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Diagnostic.objects.get(pk=response.data['id']).image.read(), self.image)
+
+    def test_non_image_is_refused_from_its_first_bytes(self):
+        url = self.open_upload(1000)
+        response = self.send(url, b'%PDF-1.7 not a leaf', 0)
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertEqual(self.client.head(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_oversized_upload_is_refused(self):
+        response = self.client.post('/api/v1/uploads/', HTTP_UPLOAD_LENGTH=str(settings.UPLOAD_MAX_BYTES + 1))
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+
+class InputSpecTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        model = SimpleNamespace(input_shape=(None, 224, 256, 3))
+        self.bundle = inference.LoadedModel('disease', 'v7', model, inference.DEFAULT_DISEASE_LABELS)
+
+    def test_spec_follows_the_active_model(self):
+        with mock.patch('api.views.get_model', return_value=self.bundle):
+            response = self.client.get('/api/v1/ml/input_spec/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['width'], response.data['height']), (256, 224))
+        self.assertEqual(response.data['version'], 'v7')
+        self.assertIn('image/jpeg', response.data['formats'])
+
+    def test_presized_upload_is_not_resized(self):
+        upload = io.BytesIO()
+        Image.new('RGB', (256, 224), 'green').save(upload, 'JPEG')
+        with mock.patch.object(Image.Image, 'resize') as resize:
+            inputs = inference.preprocess_image(io.BytesIO(upload.getvalue()), inference.input_size(self.bundle))
+        resize.assert_not_called()
+        self.assertEqual(inputs.shape, (1, 224, 256, 3))
+
+        full_size = io.BytesIO()
+        Image.new('RGB', (1024, 768), 'green').save(full_size, 'PNG')
+        self.assertEqual(inference.preprocess_image(full_size, (256, 224)).shape, (1, 224, 256, 3))
+
+
+S3_TEST_STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.S3MediaStorage',
+        'OPTIONS': {'bucket_name': 'test-media', 'region_name': 'us-east-1', 'access_key': 'test', 'secret_key': 'test'},
+    },
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STORAGES=S3_TEST_STORAGES)
+class S3StorageTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='test-media')
+        self.user = User.objects.create_user(username='farmer', password='farmerpass123')
+        self.client.force_authenticate(user=self.user)
+        self.plant_type = PlantType.objects.create(name='Tomate')
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'green').save(buffer, 'JPEG')
+        self.image = buffer.getvalue()
+
+    def direct_upload(self, body, content_type='image/jpeg'):
+        response = self.client.post('/api/v1/diagnostics/direct_upload/', {
+            'plant_type_id': self.plant_type.id, 'filename': 'leaf.jpg', 'content_type': content_type,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The client posts the file to the bucket, not to the API
+        posted = requests.post(response.data['url'], data=response.data['fields'], files={'file': ('leaf.jpg', body)})
+        self.assertLess(posted.status_code, 300)
+        return response.data['token']
+
+    def test_direct_upload_creates_the_diagnostic(self):
+        token = self.direct_upload(self.image)
+        with mock.patch('api.views.submit_analysis') as submit:
+            response = self.client.post('/api/v1/diagnostics/confirm_upload/', {'token': token}, format='json')
+            retried = self.client.post('/api/v1/diagnostics/confirm_upload/', {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retried.data['id'], response.data['id'])
+        diagnostic = Diagnostic.objects.get(pk=response.data['id'])
+        submit.assert_called_once_with(diagnostic)
+        # Workers read the image through the storage, not from a local path
+        self.assertEqual(inference.preprocess_stored_image(diagnostic.image, (32, 32)).shape, (1, 32, 32, 3))
+
+        other = User.objects.create_user(username='other', password='otherpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.post('/api/v1/diagnostics/confirm_upload/', {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_non_image_is_removed_from_the_bucket(self):
+        token = self.direct_upload(b'%PDF-1.7 not a leaf')
+        response = self.client.post('/api/v1/diagnostics/confirm_upload/', {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertFalse(Diagnostic.objects.exists())
+        self.assertEqual(boto3.client('s3', region_name='us-east-1').list_objects_v2(Bucket='test-media')['KeyCount'], 0)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_filesystem_storage_has_no_direct_upload(self):
+        response = self.client.post('/api/v1/diagnostics/direct_upload/', {
+            'plant_type_id': self.plant_type.id, 'filename': 'leaf.jpg', 'content_type': 'image/jpeg',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
@@ -0,0 +1,146 @@
+"""
+Throttling for the routes that start TensorFlow or Gemini work.
+
+TokenBucketThrottle gives every (scope, user) pair a token bucket in Redis:
+a rate of "10/min" allows bursts of 10 requests, refilled at 10 per minute.
+Views map their actions to scopes with a `throttle_scopes` dict and the
+rates live in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']. Rejected requests
+get 429 with Retry-After set to when the next token arrives.
+
+QueueAdmissionThrottle turns away new work with 503 and Retry-After while
+the Celery queue it would go to (see api/scheduling.py) holds its
+ADMISSION_QUEUE_LIMITS tasks or more, so a backlog drains instead of
+growing. A full 'bulk' queue only turns away users with a campaign under
+way; single diagnoses go to 'interactive' and are admitted.
+
+Both fail open: if Redis cannot be reached, the error is printed and the
+request goes through.
+"""
+import time
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, ScopedRateThrottle
+from .metrics import THROTTLED_REQUESTS_TOTAL
+from .scheduling import next_queue, queue_keys
+
+
+# Refill, take one token if available, and store the bucket atomically. The
+# bucket expires once it would be full again anyway.
+TAKE_TOKEN_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+def take_token(key, capacity, rate):
+    """Take one token from bucket `key`; returns (allowed, tokens left)."""
+    try:
+        connection = get_redis_connection('default')
+    except NotImplementedError:
+        return _take_token_from_cache(key, capacity, rate)
+    try:
+        allowed, tokens = connection.eval(TAKE_TOKEN_SCRIPT, 1, key, capacity, rate)
+        return bool(allowed), float(tokens)
+    except redis.RedisError as e:
+        print(f"Could not update throttle bucket {key}: {e}")
+        return True, capacity
+
+
+def _take_token_from_cache(key, capacity, rate):
+    # Non-Redis caches (tests, local development): same bucket, not atomic
+    now = time.time()
+    tokens, ts = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + max(0, now - ts) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    cache.set(key, (tokens, now), timeout=int(capacity / rate) + 1)
+    return allowed, tokens
+
+
+class TokenBucketThrottle(ScopedRateThrottle):
+    """Token bucket per user (or client IP) and per scope of the current action."""
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    @property
+    def THROTTLE_RATES(self):
+        # Read at request time (DRF copies them at import), so settings overrides apply
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scopes', {}).get(getattr(view, 'action', None))
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        key = self.get_cache_key(request, view)
+        allowed, self.tokens = take_token(key, self.num_requests, self.num_requests / self.duration)
+        if not allowed:
+            THROTTLED_REQUESTS_TOTAL.labels(scope=self.scope, reason='rate').inc()
+        return allowed
+
+    def wait(self):
+        return (1 - self.tokens) * self.duration / self.num_requests
+
+
+class ServiceOverloaded(APIException):
+    status_code = 503
+    default_detail = 'The analysis queue is full, please retry later.'
+    default_code = 'service_overloaded'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait  # sent as Retry-After by DRF's exception handler
+
+
+_broker = None
+
+
+def queue_depth(queue):
+    """Tasks waiting in `queue` of the Redis broker, or None if unknown."""
+    global _broker
+    if _broker is None:
+        _broker = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    try:
+        pipeline = _broker.pipeline(transaction=False)
+        for key in queue_keys(queue):
+            pipeline.llen(key)
+        return sum(pipeline.execute())
+    except redis.RedisError as e:
+        print(f"Could not read the Celery queue depth: {e}")
+        return None
+
+
+class QueueAdmissionThrottle(BaseThrottle):
+    """Rejects the actions listed in the view's `admission_actions` while their queue is backed up."""
+
+    def allow_request(self, request, view):
+        if getattr(view, 'action', None) not in getattr(view, 'admission_actions', ()):
+            return True
+        queue = next_queue(request.user.id)
+        limit = settings.ADMISSION_QUEUE_LIMITS.get(queue)
+        if not limit:
+            return True
+        depth = queue_depth(queue)
+        if depth is not None and depth >= limit:
+            THROTTLED_REQUESTS_TOTAL.labels(scope=view.action, reason='queue').inc()
+            raise ServiceOverloaded(settings.ADMISSION_RETRY_AFTER_SECONDS)
+        return True
@@ -0,0 +1,112 @@
+"""
+OpenTelemetry tracing along a diagnostic's path: HTTP request -> Celery task ->
+image preprocessing and model inference -> LLM call -> database save.
+
+The W3C trace context (``traceparent``/``tracestate``) is copied into the
+Celery message headers when a task is published, so the worker's spans join
+the trace of the request that queued it.
+
+TRACING_EXPORTER selects where finished spans go: 'none' (default, spans are
+not recorded), 'file' (one JSON span per line at TRACING_FILE_PATH, a stand-in
+for a collector), 'console', or 'otlp' (needs opentelemetry-exporter-otlp-proto-http,
+configured through the standard OTEL_EXPORTER_OTLP_* variables).
+"""
+import threading
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun
+from django.conf import settings
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+
+tracer = trace.get_tracer('gardien_eveille')
+
+TRACE_HEADERS = ('traceparent', 'tracestate')
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = ''.join(span.to_json(indent=None) + '\n' for span in spans)
+        try:
+            with self._lock, open(self.path, 'a') as f:
+                f.write(lines)
+        except OSError as e:
+            print(f"Could not write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+
+def _exporter(kind):
+    if kind == 'file':
+        return JsonLinesSpanExporter(settings.TRACING_FILE_PATH)
+    if kind == 'console':
+        return ConsoleSpanExporter()
+    if kind == 'otlp':
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            raise ImportError("TRACING_EXPORTER=otlp requires the opentelemetry-exporter-otlp-proto-http package")
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER '{kind}'")
+
+
+def configure():
+    """Install the tracer provider; called once per process from ApiConfig.ready()."""
+    if settings.TRACING_EXPORTER == 'none':
+        return
+    provider = TracerProvider(resource=Resource.create({'service.name': settings.TRACING_SERVICE_NAME}))
+    # The batch processor restarts its export thread in forked gunicorn/Celery children
+    provider.add_span_processor(BatchSpanProcessor(_exporter(settings.TRACING_EXPORTER)))
+    trace.set_tracer_provider(provider)
+
+
+# --- Celery propagation ---
+_task_spans = {}  # task_id -> (span, context token), for the task running in this thread
+
+
+@before_task_publish.connect
+def inject_trace_context(headers=None, **kwargs):
+    if headers is not None:
+        propagate.inject(headers)
+
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    carrier = {name: getattr(task.request, name, None) for name in TRACE_HEADERS}
+    parent = propagate.extract({k: v for k, v in carrier.items() if v})
+    queue = (task.request.delivery_info or {}).get('routing_key') or 'unknown'
+    span = tracer.start_span(
+        task.name,
+        context=parent,
+        kind=SpanKind.CONSUMER,
+        attributes={'celery.task_id': task_id, 'messaging.destination.name': queue},
+    )
+    token = context.attach(trace.set_span_in_context(span, parent))
+    _task_spans[task_id] = (span, token)
+
+
+@task_failure.connect
+def record_task_exception(task_id=None, exception=None, **kwargs):
+    span, _ = _task_spans.get(task_id, (None, None))
+    if span is not None and exception is not None:
+        span.record_exception(exception)
+
+
+@task_postrun.connect
+def end_task_span(task_id=None, state=None, **kwargs):
+    span, token = _task_spans.pop(task_id, (None, None))
+    if span is None:
+        return
+    span.set_attribute('celery.state', state or '')
+    if state == 'FAILURE':
+        span.set_status(Status(StatusCode.ERROR))
+    context.detach(token)
+    span.end()
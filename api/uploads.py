@@ -0,0 +1,191 @@
+"""
+Resumable diagnostic image uploads, following the tus 1.0 core protocol.
+
+- POST /uploads/ with `Upload-Length` and `Upload-Metadata` (base64 values
+  for `plant_type_id` and `filename`) opens a session and answers with its
+  Location.
+- PATCH on the session with `Upload-Offset` and an
+  `application/offset+octet-stream` body appends a chunk. It is written to a
+  partial file under UPLOAD_SESSION_DIR in READ_SIZE pieces, so an upload
+  never sits in memory. If the connection drops, the bytes that arrived are
+  kept and HEAD gives the offset to resume from. If the partial file is
+  missing or shorter than the recorded offset, the session falls back to
+  the bytes on disk and the chunk gets 409 with that offset.
+- The first bytes must carry a JPEG, PNG or WebP signature; otherwise the
+  upload is refused with 415 as soon as they arrive. The last chunk is
+  checked with Pillow, saved to the media storage as a pending Diagnostic,
+  and answered with 201 and the diagnostic.
+
+Only one request at a time writes to a session (423 otherwise), and sessions
+left for UPLOAD_SESSION_TTL_HOURS are removed by a Celery beat task.
+"""
+import base64
+import binascii
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.http import UnreadablePostError
+from django.utils import timezone
+from rest_framework import status
+from .models import Diagnostic, PlantType, UploadSession
+
+
+TUS_VERSION = '1.0.0'
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+READ_SIZE = 64 * 1024
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n')
+HEADER_BYTES = 12  # enough for every signature, WebP's included
+
+
+class UploadError(Exception):
+    def __init__(self, detail, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+def is_image_header(head):
+    return head.startswith(IMAGE_SIGNATURES) or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')
+
+
+def partial_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, f'{session.pk}.part')
+
+
+def parse_metadata(value):
+    """Upload-Metadata: comma-separated `key base64(value)` pairs."""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in value.split(','))):
+        key, _, encoded = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(encoded, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(f'Upload-Metadata value of {key} is not valid base64.')
+    return metadata
+
+
+def create_session(user, headers):
+    try:
+        length = int(headers['Upload-Length'])
+    except (KeyError, ValueError):
+        raise UploadError('Upload-Length header is required.')
+    if not 0 < length <= settings.UPLOAD_MAX_BYTES:
+        raise UploadError(
+            f'Upload-Length must be between 1 and {settings.UPLOAD_MAX_BYTES} bytes.',
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    metadata = parse_metadata(headers.get('Upload-Metadata', ''))
+    plant_type_id = metadata.get('plant_type_id', '')
+    plant_type = PlantType.objects.filter(pk=plant_type_id).first() if plant_type_id.isdigit() else None
+    if plant_type is None:
+        raise UploadError('Upload-Metadata must name an existing plant_type_id.')
+    filename = os.path.basename(metadata.get('filename', '')) or 'image'
+    return UploadSession.objects.create(user=user, plant_type=plant_type, filename=filename[:255], length=length)
+
+
+@contextmanager
+def session_lock(session):
+    key = f'upload-lock:{session.pk}'
+    try:
+        locked = cache.add(key, 1, timeout=settings.UPLOAD_LOCK_SECONDS)
+    except Exception as e:
+        print(f"Could not lock upload {session.pk}: {e}")
+        locked = None
+    if locked is False:
+        raise UploadError('Another request is writing to this upload.', status.HTTP_423_LOCKED)
+    try:
+        yield
+    finally:
+        if locked:
+            cache.delete(key)
+
+
+def append_chunk(session, stream, offset, length):
+    """
+    Write up to `length` bytes of `stream` at `offset` of the session's partial
+    file and record the new offset. Raises UploadError on a wrong offset, an
+    oversized chunk or a body that is not an image.
+    """
+    if offset != session.offset:
+        raise UploadError(f'Upload-Offset must be {session.offset}.', status.HTTP_409_CONFLICT)
+    if offset + length > session.length:
+        raise UploadError('The chunk goes past Upload-Length.', status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    path = partial_path(session)
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    stored = os.path.getsize(path) if os.path.exists(path) else 0
+    if stored < offset:
+        # The partial file is missing or short (written on another web node, or removed):
+        # writing at `offset` would leave a zero-filled gap, so resume from what is here
+        UploadSession.objects.filter(pk=session.pk, offset=offset).update(offset=stored, updated_at=timezone.now())
+        session.offset = stored
+        raise UploadError(f'Upload-Offset must be {stored}.', status.HTTP_409_CONFLICT)
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+        head = f.read(HEADER_BYTES) if offset < HEADER_BYTES else None
+        f.seek(offset)
+        f.truncate()  # bytes past the offset belong to a chunk that was not recorded
+        remaining = length
+        rejected = False
+        try:
+            while remaining and not rejected:
+                data = stream.read(min(READ_SIZE, remaining)) if stream is not None else b''
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+                if head is not None and len(head) < HEADER_BYTES:
+                    head += data[:HEADER_BYTES - len(head)]
+                    # Checked as soon as the signature is in, not once the whole image is
+                    rejected = len(head) >= min(HEADER_BYTES, session.length) and not is_image_header(head)
+        except (OSError, UnreadablePostError) as e:
+            print(f"Upload {session.pk} interrupted at {f.tell()} bytes: {e}")
+        received = f.tell()
+
+    if rejected:
+        discard(session)
+        raise UploadError('Only JPEG, PNG and WebP images can be uploaded.', status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    UploadSession.objects.filter(pk=session.pk, offset=offset).update(offset=received, updated_at=timezone.now())
+    session.offset = received
+    return received
+
+
+def finish(session):
+    """Check the complete upload, store it and create its pending Diagnostic."""
+    path = partial_path(session)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        discard(session)
+        raise UploadError('The upload is not a valid image.', status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    diagnostic = Diagnostic(user_id=session.user_id, plant_type_id=session.plant_type_id, status='pending')
+    with open(path, 'rb') as f:
+        # The storage copies the file in chunks
+        diagnostic.image.save(session.filename, File(f), save=False)
+    diagnostic.save()
+    session.diagnostic = diagnostic
+    session.save(update_fields=['diagnostic', 'updated_at'])
+    os.remove(path)
+    return diagnostic
+
+
+def discard(session):
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def prune_sessions():
+    expired = list(UploadSession.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    ))
+    for session in expired:
+        discard(session)
+    return len(expired)
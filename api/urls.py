@@ -14,6 +14,8 @@ router.register(r'conversations', views.ConversationViewSet, basename='conversat
 #router.register(r'recommendations', views.RecommendationViewSet, basename='recommendation')
 router.register(r'crop-recommendations', views.CropRecommendationViewSet, basename='crop-recommendation')
 router.register(r'fertilizer-recommendations', views.FertilizerRecommendationViewSet, basename='fertilizer-recommendation')
+router.register(r'profiles', views.ProfileViewSet, basename='profile')
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 
 # Nested router for messages inside conversations
 conversations_router = NestedDefaultRouter(router, r'conversations', lookup='conversation')
@@ -23,4 +25,6 @@ urlpatterns = [
     path('', include(router.urls)),
     path('', include(conversations_router.urls)),
     path('login/', views.LoginViewSet.as_view({'post': 'create'}), name='login'),
+    path('status/', views.StatusViewSet.as_view({'get': 'list'}), name='status'),
+    path('sync/', views.SyncViewSet.as_view({'get': 'list'}), name='sync'),
 ]
@@ -1,40 +1,56 @@
 from rest_framework import viewsets, filters, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.exceptions import NotFound
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.contrib.auth import get_user_model
-from drf_spectacular.utils import extend_schema
-from tensorflow.keras.models import load_model
-from PIL import Image
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
-import numpy as np
-import tensorflow as tf
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import update_last_login
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 import joblib
+import hmac
 import os
+from datetime import timedelta
 from django.conf import settings
-from .tasks import analyze_plant_image, generate_crop_recommendation, generate_fertilizer_recommendation
-
-
-def preprocess_image(uploaded_image, target_size=(300, 300)):
-    img = Image.open(uploaded_image).convert('RGB')  # Convert to RGB (drops alpha channel)
-    img = img.resize(target_size)  # Resize to model input size
-    img_array = np.array(img)  # shape: (300, 300, 3)
-    # Optional normalization: img_array = img_array / 255.0
-    img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
-    return img_array
-
+from django.core import signing
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+from prometheus_client import CONTENT_TYPE_LATEST
+from .authentication import IdentityRefreshToken
+from .idempotency import idempotent
+from .inference import (
+    DISEASE_INPUT_FORMATS, get_model, input_size, input_spec as model_input_spec, preprocess_image, refresh_model,
+    route_model,
+)
+from . import model_registry
+from .metrics import render_metrics
+from .model_stats import model_stats
+from .mixins import CachedCatalogMixin, ConditionalResponseMixin
+from .permissions import IsAdminRole
+from .profiling import get_profile
+from .scheduling import submit_analysis
+from .status_mirror import MIRRORED, get_statuses, publish_status
+from . import storage, sync, uploads
+from .tasks import (
+    decode_prediction, generate_crop_recommendation, generate_fertilizer_recommendation, shadow_predict, timed_predict
+)
+from .throttling import QueueAdmissionThrottle, TokenBucketThrottle
 
 
 from .models import (
     PlantType, SoilType, Climate, Diagnostic,
-    Conversation, Message, Recommendation, CropRecommendation, FertilizerRecommendation
+    Conversation, Message, Recommendation, CropRecommendation, FertilizerRecommendation, UploadSession,
+    transition_status
 )
 from .serializers import (
     UserSerializer, PlantTypeSerializer, SoilTypeSerializer,
     ClimateSerializer, DiagnosticSerializer, ConversationSerializer,
-    MessageSerializer, CropRecommendationSerializer, FertilizerRecommendationSerializer, LoginSerializer, DetectDiseaseSerializer
+    MessageSerializer, CropRecommendationSerializer, FertilizerRecommendationSerializer, LoginSerializer, DetectDiseaseSerializer,
+    requested_fieldset
 )
 
 
@@ -55,7 +71,12 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     @action(detail=False, methods=['get'])
     def me(self, request):
-        serializer = self.get_serializer(request.user)
+        user = request.user
+        # A user built from token claims defers the profile fields; load them in one query
+        deferred = user.get_deferred_fields() - {'password'}
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
 
@@ -90,10 +111,17 @@ class LoginViewSet(viewsets.ViewSet):
         serializer = LoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user = get_user_model().objects.filter(username=serializer.validated_data['username']).first()
-        if user and user.check_password(serializer.validated_data['password']):
-            token_serializer = TokenObtainPairSerializer(data=request.data)
-            token_serializer.is_valid(raise_exception=True)
+        # One password check; the tokens are issued from the verified user instead of
+        # authenticating again through TokenObtainPairSerializer
+        user = authenticate(
+            request,
+            username=serializer.validated_data['username'],
+            password=serializer.validated_data['password'],
+        )
+        if user is not None:
+            refresh = IdentityRefreshToken.for_user(user)
+            if jwt_settings.UPDATE_LAST_LOGIN:
+                update_last_login(None, user)
 
             # You can customize these fields as needed
             user_data = {
@@ -107,8 +135,8 @@ class LoginViewSet(viewsets.ViewSet):
             }
 
             return Response({
-                "access": token_serializer.validated_data["access"],
-                "refresh": token_serializer.validated_data["refresh"],
+                "access": str(refresh.access_token),
+                "refresh": str(refresh),
                 "user": user_data
             }, status=status.HTTP_200_OK)
 
@@ -116,7 +144,7 @@ class LoginViewSet(viewsets.ViewSet):
 
 
 # --- PlantType ViewSet ---
-class PlantTypeViewSet(viewsets.ModelViewSet):
+class PlantTypeViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = PlantType.objects.all()
     serializer_class = PlantTypeSerializer
     permission_classes = [IsAuthenticated]
@@ -126,8 +154,8 @@ class PlantTypeViewSet(viewsets.ModelViewSet):
 
 
 # --- SoilType ViewSet ---
-class SoilTypeViewSet(viewsets.ModelViewSet):
-    queryset = SoilType.objects.all()
+class SoilTypeViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    queryset = SoilType.objects.prefetch_related('suitable_plants')
     serializer_class = SoilTypeSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter]
@@ -135,8 +163,8 @@ class SoilTypeViewSet(viewsets.ModelViewSet):
 
 
 # --- Climate ViewSet ---
-class ClimateViewSet(viewsets.ModelViewSet):
-    queryset = Climate.objects.all()
+class ClimateViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    queryset = Climate.objects.prefetch_related('suitable_plants')
     serializer_class = ClimateSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter]
@@ -144,12 +172,15 @@ class ClimateViewSet(viewsets.ModelViewSet):
 
 
 # --- Diagnostic ViewSet ---
-class DiagnosticViewSet(viewsets.ModelViewSet):
+class DiagnosticViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     serializer_class = DiagnosticSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at', 'status']
     parser_classes = [MultiPartParser, FormParser]  # to handle image upload
+    throttle_classes = [QueueAdmissionThrottle, TokenBucketThrottle]
+    throttle_scopes = {'create': 'diagnostics', 'direct_upload': 'diagnostics', 'analyze': 'diagnostics_analyze'}
+    admission_actions = ('create', 'confirm_upload', 'analyze')
 
     def get_queryset(self):
         return Diagnostic.objects.filter(user=self.request.user)
@@ -159,15 +190,16 @@ class DiagnosticViewSet(viewsets.ModelViewSet):
         request=DiagnosticSerializer,
         responses={201: DiagnosticSerializer}
     )
+    @idempotent
     def create(self, request, *args, **kwargs):
         # Expecting an image file in request.data['image'] and possibly other fields
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        # Save Diagnostic with status = processing
-        diagnostic = serializer.save(user=request.user, status='processing')
+        # Save Diagnostic with status = pending until a worker claims it
+        diagnostic = serializer.save(user=request.user, status='pending')
 
-        # Trigger Celery async task with diagnostic id
-        analyze_plant_image.delay(diagnostic.id)
+        # Queue the analysis as interactive or bulk work depending on the user's backlog
+        submit_analysis(diagnostic)
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -184,35 +216,277 @@ class DiagnosticViewSet(viewsets.ModelViewSet):
         responses={202: {'description': 'Re-analysis started'}}
     )
     @action(detail=True, methods=['post'])
+    @idempotent
     def analyze(self, request, pk=None):
         diagnostic = self.get_object()
 
-        if diagnostic.status == 'processing':
+        # Conditional UPDATE: of two concurrent requests only one re-queues the analysis.
+        # An analysis stuck for ANALYSIS_STALE_SECONDS lost its task and is re-queued too
+        stale = timezone.now() - timedelta(seconds=settings.ANALYSIS_STALE_SECONDS)
+        requeued = (
+            transition_status(Diagnostic, diagnostic.pk, ['completed', 'failed'], 'pending', result=None)
+            or transition_status(Diagnostic, diagnostic.pk, ['pending', 'processing'], 'pending', updated_before=stale, result=None)
+        )
+        if not requeued:
             return Response({'detail': 'Analysis is already in progress.'}, status=status.HTTP_409_CONFLICT)
 
-        diagnostic.status = 'processing'
-        diagnostic.result = None  # clear previous result if any
-        diagnostic.save()
-
-        analyze_plant_image.delay(diagnostic.id)
+        publish_status(Diagnostic, diagnostic.pk)
+        submit_analysis(diagnostic)
 
         return Response({'status': 'Re-analysis started'}, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        description=(
+            'Presigned POST to upload an image straight to the media bucket (S3 storage only). '
+            'POST the file to `url` with `fields`, then call confirm_upload with `token`.'
+        ),
+        request={
+            'type': 'object',
+            'properties': {
+                'plant_type_id': {'type': 'integer'},
+                'filename': {'type': 'string'},
+                'content_type': {'type': 'string', 'enum': list(DISEASE_INPUT_FORMATS)}
+            }
+        },
+        responses={200: {'description': 'url, fields, token'}, 501: {'description': 'Storage is not S3'}}
+    )
+    @action(detail=False, methods=['post'], parser_classes=api_settings.DEFAULT_PARSER_CLASSES)
+    def direct_upload(self, request):
+        if not storage.supports_direct_uploads():
+            return Response(
+                {'error': 'Direct uploads need S3 media storage; use uploads/ or a multipart POST.'},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        content_type = request.data.get('content_type')
+        if content_type not in DISEASE_INPUT_FORMATS:
+            return Response(
+                {'error': f"content_type must be one of {', '.join(DISEASE_INPUT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        plant_type_id = str(request.data.get('plant_type_id', ''))
+        plant_type = PlantType.objects.filter(pk=plant_type_id).first() if plant_type_id.isdigit() else None
+        if plant_type is None:
+            return Response({'error': 'plant_type_id must name an existing plant type.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        name = storage.direct_upload_name(request.user.id, request.data.get('filename', ''))
+        post = default_storage.presigned_post(
+            name, content_type, settings.UPLOAD_MAX_BYTES, settings.DIRECT_UPLOAD_EXPIRE_SECONDS,
+        )
+        return Response({
+            'url': post['url'],
+            'fields': post['fields'],
+            'token': storage.sign_direct_upload(request.user.id, name, plant_type.id),
+            'max_bytes': settings.UPLOAD_MAX_BYTES,
+            'expires_in': settings.DIRECT_UPLOAD_EXPIRE_SECONDS,
+        })
+
+    @extend_schema(
+        description='Create the diagnostic of an image uploaded with direct_upload and start its analysis.',
+        request={'type': 'object', 'properties': {'token': {'type': 'string'}}},
+        responses={201: DiagnosticSerializer}
+    )
+    @action(detail=False, methods=['post'], parser_classes=api_settings.DEFAULT_PARSER_CLASSES)
+    def confirm_upload(self, request):
+        try:
+            # The upload may finish up to the POST's expiry; allow as long again to confirm it
+            upload = storage.read_direct_upload(request.data.get('token', ''), settings.DIRECT_UPLOAD_EXPIRE_SECONDS * 2)
+        except signing.BadSignature:
+            return Response({'error': 'Invalid or expired upload token.'}, status=status.HTTP_400_BAD_REQUEST)
+        if upload['user'] != request.user.id:
+            return Response({'error': 'Invalid or expired upload token.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        diagnostic = Diagnostic.objects.filter(image=upload['name']).first()
+        if diagnostic is not None:
+            # Retry of a confirmation whose response was lost
+            return Response(self.get_serializer(diagnostic).data, status=status.HTTP_201_CREATED)
+        if not default_storage.exists(upload['name']):
+            return Response({'error': 'The image has not been uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
+        with default_storage.open(upload['name']) as f:
+            head = f.read(uploads.HEADER_BYTES)
+        if not uploads.is_image_header(head):
+            default_storage.delete(upload['name'])
+            return Response({'error': 'Only JPEG, PNG and WebP images can be uploaded.'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        diagnostic = Diagnostic.objects.create(
+            user=request.user, plant_type_id=upload['plant_type'], image=upload['name'], status='pending',
+        )
+        submit_analysis(diagnostic)
+        return Response(self.get_serializer(diagnostic).data, status=status.HTTP_201_CREATED)
+
+
+# --- Status ViewSet ---
+class StatusViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        description=(
+            'Status and short result of many diagnostics and recommendations in one request. '
+            'Pass comma-separated ids per kind, e.g. ?diagnostics=1,2&crop_recommendations=3.'
+        ),
+        parameters=[
+            OpenApiParameter(kind, str, description=f'Comma-separated {kind.replace("_", " ")} ids')
+            for kind in MIRRORED
+        ],
+        responses={200: {'description': 'Entries (id, status, result, updated_at) per kind'}}
+    )
+    def list(self, request):
+        requested = {}
+        try:
+            for kind in MIRRORED:
+                ids = request.query_params.get(kind)
+                if ids:
+                    requested[kind] = list(dict.fromkeys(int(pk) for pk in ids.split(',') if pk))
+        except ValueError:
+            return Response({'error': 'Ids must be comma-separated integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not requested:
+            return Response(
+                {'error': f"Pass ids in at least one of: {', '.join(MIRRORED)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if sum(len(ids) for ids in requested.values()) > settings.STATUS_BATCH_MAX_IDS:
+            return Response(
+                {'error': f'At most {settings.STATUS_BATCH_MAX_IDS} ids per request.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(get_statuses(request.user.id, requested))
+
+
+# --- Sync ViewSet ---
+class SyncViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        description=(
+            'Records changed and deleted since a watermark, for offline mobile clients. '
+            'Omit `since` for a full sync; repeat with the returned watermark while `has_more` is true.'
+        ),
+        parameters=[OpenApiParameter('since', str, description='Watermark returned by the previous sync')],
+        responses={200: {'description': 'Changed rows (fields + rows) and deleted ids per kind'}}
+    )
+    def list(self, request):
+        try:
+            since = sync.parse_watermark(request.query_params.get('since'))
+        except ValueError:
+            return Response({'error': 'since must be a watermark returned by a previous sync.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(sync.changes(request.user, since))
+# --- Upload ViewSet (resumable diagnostic images, see api/uploads.py) ---
+class UploadViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [QueueAdmissionThrottle, TokenBucketThrottle]
+    throttle_scopes = {'create': 'diagnostics'}
+    admission_actions = ('create',)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response['Tus-Resumable'] = uploads.TUS_VERSION
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_session(self, pk):
+        try:
+            session = UploadSession.objects.filter(pk=pk, user=self.request.user).first()
+        except DjangoValidationError:
+            session = None  # not a UUID
+        if session is None:
+            raise NotFound('Upload not found.')
+        return session
+
+    def offset_headers(self, session):
+        return {'Upload-Offset': str(session.offset), 'Upload-Length': str(session.length), 'Cache-Control': 'no-store'}
+
+    @extend_schema(
+        description=(
+            'Open a resumable upload (tus 1.0). Headers: Upload-Length, and Upload-Metadata with '
+            'base64 plant_type_id and filename.'
+        ),
+        request=None,
+        responses={201: {'description': 'Upload created, URL in Location'}}
+    )
+    def create(self, request):
+        try:
+            session = uploads.create_session(request.user, request.headers)
+        except uploads.UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        headers = {'Location': request.build_absolute_uri(f'{session.pk}/'), 'Upload-Offset': '0'}
+        return Response({'id': session.pk, 'offset': 0, 'length': session.length}, status=status.HTTP_201_CREATED, headers=headers)
+
+    @extend_schema(
+        description='Offset to resume an upload from (HEAD or GET), and its diagnostic once complete.',
+        responses={200: {'description': 'Upload progress'}}
+    )
+    def retrieve(self, request, pk=None):
+        session = self.get_session(pk)
+        data = {'id': session.pk, 'offset': session.offset, 'length': session.length, 'diagnostic': session.diagnostic_id}
+        return Response(data, headers=self.offset_headers(session))
+
+    @extend_schema(
+        description=(
+            'Append a chunk (Content-Type: application/offset+octet-stream) at Upload-Offset. '
+            'The last chunk creates the diagnostic and starts its analysis.'
+        ),
+        request={'application/offset+octet-stream': {'type': 'string', 'format': 'binary'}},
+        responses={204: {'description': 'Chunk stored'}, 201: DiagnosticSerializer}
+    )
+    def partial_update(self, request, pk=None):
+        session = self.get_session(pk)
+        if session.diagnostic_id is not None:
+            # Retry of a last chunk whose response was lost
+            serializer = DiagnosticSerializer(session.diagnostic, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=self.offset_headers(session))
+        if request.content_type.split(';')[0].strip() != uploads.CHUNK_CONTENT_TYPE:
+            return Response(
+                {'error': f'Chunks must be sent as {uploads.CHUNK_CONTENT_TYPE}.'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Upload-Offset and Content-Length are required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with uploads.session_lock(session):
+                # Read from the raw request stream, never buffered whole by a parser
+                uploads.append_chunk(session, request.stream, offset, length)
+                if session.offset < session.length:
+                    return Response(status=status.HTTP_204_NO_CONTENT, headers=self.offset_headers(session))
+                diagnostic = uploads.finish(session)
+        except uploads.UploadError as e:
+            # A 409 carries the offset to resume from
+            headers = self.offset_headers(session) if e.status_code == status.HTTP_409_CONFLICT else None
+            return Response({'error': str(e)}, status=e.status_code, headers=headers)
+
+        submit_analysis(diagnostic)
+        serializer = DiagnosticSerializer(diagnostic, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=self.offset_headers(session))
+
+    @extend_schema(description='Abandon an upload.', responses={204: None})
+    def destroy(self, request, pk=None):
+        uploads.discard(self.get_session(pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # --- Conversation ViewSet ---
-class ConversationViewSet(viewsets.ModelViewSet):
+class ConversationViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['updated_at']
 
     def get_queryset(self):
-        return Conversation.objects.filter(user=self.request.user)
+        # ConversationSerializer nests the user and every message; skip whichever ?fields= leaves out
+        queryset = Conversation.objects.filter(user=self.request.user)
+        fieldset = requested_fieldset(self.request)
+        if fieldset is None or 'user' in fieldset:
+            queryset = queryset.select_related('user')
+        if fieldset is None or 'messages' in fieldset:
+            queryset = queryset.prefetch_related('messages')
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
 # --- Message ViewSet (nested under conversation) ---
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
 
@@ -239,7 +513,7 @@ class MessageViewSet(viewsets.ModelViewSet):
 
 # --- Crop Recommendation ViewSet ---
 
-class CropRecommendationViewSet(viewsets.ModelViewSet):
+class CropRecommendationViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     serializer_class = CropRecommendationSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
@@ -264,7 +538,7 @@ class CropRecommendationViewSet(viewsets.ModelViewSet):
 
 # --- Fertilizer Recommendation ViewSet ---
 
-class FertilizerRecommendationViewSet(viewsets.ModelViewSet):
+class FertilizerRecommendationViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     serializer_class = FertilizerRecommendationSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
@@ -287,6 +561,28 @@ class FertilizerRecommendationViewSet(viewsets.ModelViewSet):
 
 class MLModelViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scopes = {
+        'predict_disease': 'ml_predict',
+        'recommend_crop': 'ml_recommend',
+        'recommend_fertilizer': 'ml_recommend',
+    }
+
+    @extend_schema(
+        description=(
+            'Input spec of the active disease model. Photos resized by the client to width x height '
+            'are much smaller to upload and skip the resize step on the workers.'
+        ),
+        responses={200: {'description': 'Image size, channels, accepted formats and maximum bytes'}}
+    )
+    @action(detail=False, methods=['get'])
+    def input_spec(self, request):
+        try:
+            disease = get_model('disease')
+        except RuntimeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        # Clients read it at start-up; an outdated spec only costs a resize on the workers
+        return Response(model_input_spec(disease), headers={'Cache-Control': 'private, max-age=3600'})
 
     @extend_schema(
     description='Predict plant disease from image',
@@ -296,9 +592,12 @@ class MLModelViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['post'])
     def predict_disease(self, request):
         try:
-            # Load the model
-            model_path = os.path.join(settings.ML_MODELS_PATH, 'best_model.keras')
-            model = load_model(model_path)
+            # Shared model loaded once per process (Keras or TFLite, see DISEASE_MODEL_RUNTIME),
+            # routed to the candidate like the Celery path
+            try:
+                disease, shadow_version = route_model('disease')
+            except RuntimeError as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
             # Get image from request
             image = request.FILES.get('image')
@@ -306,19 +605,21 @@ class MLModelViewSet(viewsets.ViewSet):
                 return Response({'error': 'Image file is required'}, status=status.HTTP_400_BAD_REQUEST)
 
             # Preprocess image and make prediction
-            preprocessed_image = preprocess_image(image)
-            prediction = model.predict(preprocessed_image)
+            preprocessed_image = preprocess_image(image, input_size(disease))
+            prediction = timed_predict(disease, preprocessed_image)
 
             # Interpret prediction
-            predicted_class = int(np.argmax(prediction))  # or use your label mapping if available
-            confidence = float(np.max(prediction))
+            predicted_class, confidence = decode_prediction(prediction)  # or use your label mapping if available
+            if shadow_version:
+                shadow_predict.delay('disease', shadow_version, predicted_class, features=preprocessed_image.tolist())
             #{'Potato___Early_blight': 0, 'Potato___Late_blight': 1, 'Potato___healthy': 2}
             print(f'Predicted class: {predicted_class}, Confidence: {confidence}')
 
             return Response({
                 'status': 'success',
                 'predicted_class': predicted_class,
-                'confidence': round(confidence, 4)
+                'confidence': round(confidence, 4),
+                'model_version': disease.version
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -367,3 +668,94 @@ class MLModelViewSet(viewsets.ViewSet):
             return Response({'status': 'success', 'recommendation': 'example'}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(
+        description='List the registered versions of every model and the active one (admin only).',
+        responses={200: {'description': 'Model versions'}}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminRole])
+    def model_versions(self, request):
+        return Response({
+            name: {
+                'active': model_registry.active_version(name),
+                'candidate': model_registry.candidate(name),
+                'versions': model_registry.list_versions(name),
+            }
+            for name in model_registry.ARTIFACTS
+        })
+
+    @extend_schema(
+        description='Latency percentiles and shadow agreement rate per model version (admin only).',
+        responses={200: {'description': 'Model statistics'}}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminRole])
+    def model_stats(self, request):
+        return Response({name: model_stats(name) for name in model_registry.ARTIFACTS})
+
+    @extend_schema(
+        description='Activate a registered model version without restarting workers (admin only).',
+        request={
+            'type': 'object',
+            'properties': {
+                'name': {'type': 'string'},
+                'version': {'type': 'string'}
+            }
+        },
+        responses={200: {'description': 'Version activated'}}
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminRole])
+    def activate_model(self, request):
+        name = request.data.get('name')
+        version = request.data.get('version')
+        if not isinstance(name, str) or not isinstance(version, str):
+            return Response({'error': 'name and version must be strings.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            model_registry.activate(name, version)
+        except model_registry.RegistryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # This process swaps immediately, the other workers on their next poll
+        refresh_model(name)
+        return Response({'name': name, 'active': version}, status=status.HTTP_200_OK)
+
+
+# --- Profile ViewSet (admin) ---
+class ProfileViewSet(viewsets.ViewSet):
+    permission_classes = [IsAdminRole]
+
+    def get_profile_or_404(self, pk):
+        profile = get_profile(pk)
+        if profile is None:
+            raise NotFound('Profile not found or expired.')
+        return profile
+
+    @extend_schema(
+        description='Summary, cumulative-time report and SQL query log of a profiled request (admin only).',
+        responses={200: {'description': 'Profile'}}
+    )
+    def retrieve(self, request, pk=None):
+        profile = self.get_profile_or_404(pk)
+        return Response({key: value for key, value in profile.items() if key != 'pstats'})
+
+    @extend_schema(
+        description='Download the raw cProfile statistics, e.g. for snakeviz (admin only).',
+        responses={200: {'description': 'pstats file'}}
+    )
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        profile = self.get_profile_or_404(pk)
+        response = HttpResponse(profile['pstats'], content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="profile-{pk}.prof"'
+        return response
+
+
+# --- Metrics ---
+def metrics_view(request):
+    # Plain Django view: scraped by Prometheus with METRICS_TOKEN, kept out of the API auth and schema.
+    # The web port may be reachable without nginx, so the token is checked here
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,5 @@
+# Load the Celery app with Django so shared tasks are published with its
+# configuration (broker, queues, routes) from the web process too.
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -1,5 +1,7 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_ready
+from kombu import Queue
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gardien_eveille.settings')
@@ -13,6 +15,52 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+# Interactive work (single diagnoses, chat, recommendations) and bulk work (large
+# uploads, shadow predictions) have separate queues; see api/scheduling.py. Workers
+# consuming both always poll 'interactive' first, and within a queue the Redis
+# transport serves priority 0 before 9. Reserve capacity for interactive work with
+# a worker started with `-Q interactive`.
+app.conf.task_queues = (Queue('interactive'), Queue('bulk'))
+app.conf.task_default_queue = 'interactive'
+app.conf.task_routes = {
+    'api.tasks.shadow_predict': {'queue': 'bulk'},
+    'api.tasks.prune_tombstones': {'queue': 'bulk'},
+    'api.tasks.prune_upload_sessions': {'queue': 'bulk'},
+}
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+app.conf.beat_schedule = {
+    'prune-sync-tombstones': {'task': 'api.tasks.prune_tombstones', 'schedule': 24 * 3600},
+    'prune-upload-sessions': {'task': 'api.tasks.prune_upload_sessions', 'schedule': 3600},
+}
+# Take one task at a time so a queued interactive task is not stuck behind prefetched bulk ones
+app.conf.worker_prefetch_multiplier = 1
+
+
+@worker_init.connect
+def preload_worker_models(**kwargs):
+    # Runs in the worker's parent process before the prefork pool is started
+    from django.conf import settings
+
+    if settings.PRELOAD_MODELS:
+        from api.inference import preload_models
+
+        preload_models()
+
+
+@worker_ready.connect
+def start_metrics_exporter(**kwargs):
+    from django.conf import settings
+
+    if settings.CELERY_METRICS_PORT:
+        from api.metrics import start_exporter
+
+        start_exporter(settings.CELERY_METRICS_PORT)
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
@@ -38,12 +38,15 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'api.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -102,19 +105,78 @@ CACHES = {
     }
 }
 
+# Catalog responses are invalidated by version on change; the TTL only bounds memory
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv('CATALOG_CACHE_TTL_SECONDS', 24 * 3600))
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 
+# Admission control: routes that enqueue analyses answer 503 while the broker queue the
+# user's analysis would go to (see api/scheduling.py) holds its limit of tasks or more
+# (0: no limit), so a campaign filling 'bulk' never turns away single diagnoses
+ADMISSION_QUEUE_LIMITS = {
+    'interactive': int(os.getenv('ADMISSION_MAX_INTERACTIVE_DEPTH', 200)),
+    'bulk': int(os.getenv('ADMISSION_MAX_BULK_DEPTH', 2000)),
+}
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', 30))
+
+# Responses to POSTs sent with an Idempotency-Key header are replayed for this long
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+# A diagnostic pending or processing for this long is taken for lost (broker restart,
+# killed worker) and can be re-analyzed
+ANALYSIS_STALE_SECONDS = int(os.getenv('ANALYSIS_STALE_SECONDS', 30 * 60))
+
+# Status mirror read by GET /api/v1/status/ (see api/status_mirror.py)
+STATUS_MIRROR_TTL_SECONDS = int(os.getenv('STATUS_MIRROR_TTL_SECONDS', 3600))
+STATUS_BATCH_MAX_IDS = int(os.getenv('STATUS_BATCH_MAX_IDS', 200))
+
+# Delta sync for mobile clients (see api/sync.py): rows per kind and page, re-sent
+# window before each watermark, and how long deletions are remembered
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+SYNC_WATERMARK_OVERLAP_SECONDS = int(os.getenv('SYNC_WATERMARK_OVERLAP_SECONDS', 2))
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv('SYNC_TOMBSTONE_RETENTION_DAYS', 90))
+
+# Resumable uploads (see api/uploads.py): partial files live outside MEDIA_ROOT until complete,
+# on the local disk even with S3 media: several web nodes need sticky routing or a shared directory
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', os.path.join(BASE_DIR, 'upload_sessions'))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24))
+UPLOAD_LOCK_SECONDS = int(os.getenv('UPLOAD_LOCK_SECONDS', 120))
+
+# Diagnostic scheduling (see api/scheduling.py): past SCHEDULING_BULK_THRESHOLD pending
+# analyses a user's new ones go to the bulk queue, and every SCHEDULING_FAIR_SHARE_STEP
+# more lowers their priority by one step
+SCHEDULING_BULK_THRESHOLD = int(os.getenv('SCHEDULING_BULK_THRESHOLD', 5))
+SCHEDULING_FAIR_SHARE_STEP = int(os.getenv('SCHEDULING_FAIR_SHARE_STEP', 5))
+SCHEDULING_PENDING_TTL_SECONDS = int(os.getenv('SCHEDULING_PENDING_TTL_SECONDS', 6 * 3600))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Token buckets per user (see api/throttling.py): "10/min" is a burst of 10 refilled at 10 per minute
+    'DEFAULT_THROTTLE_RATES': {
+        'diagnostics': os.getenv('THROTTLE_DIAGNOSTICS_RATE', '10/min'),
+        'diagnostics_analyze': os.getenv('THROTTLE_ANALYZE_RATE', '5/min'),
+        'ml_predict': os.getenv('THROTTLE_ML_PREDICT_RATE', '30/min'),
+        'ml_recommend': os.getenv('THROTTLE_ML_RECOMMEND_RATE', '30/min'),
+    },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
@@ -138,8 +200,16 @@ SIMPLE_JWT = {
     'VERIFYING_KEY': PUBLIC_KEY,
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.IdentityTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.IdentityTokenRefreshSerializer',
 }
 
+# JWT authentication (see api/authentication.py): authenticated users are cached for
+# AUTH_USER_CACHE_SECONDS (0 disables). With JWT_TRUST_CLAIMS, read-only requests take
+# the user from the access token's claims (at most ACCESS_TOKEN_LIFETIME old) instead.
+AUTH_USER_CACHE_SECONDS = int(os.getenv('AUTH_USER_CACHE_SECONDS', 60))
+JWT_TRUST_CLAIMS = os.getenv('JWT_TRUST_CLAIMS', 'false').lower() == 'true'
+
 
 # Spectacular API documentation settings
 SPECTACULAR_SETTINGS = {
@@ -161,6 +231,33 @@ CORS_ALLOWED_ORIGINS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media storage (see api/storage.py): 'filesystem' keeps images under MEDIA_ROOT, shared
+# by web and workers; 's3' stores them in an S3-compatible bucket (AWS, MinIO)
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'filesystem')
+MEDIA_S3_OPTIONS = {
+    'bucket_name': os.getenv('MEDIA_S3_BUCKET', 'gardien-eveille-media'),
+    'endpoint_url': os.getenv('S3_ENDPOINT_URL') or None,  # e.g. http://minio:9000
+    'public_endpoint_url': os.getenv('S3_PUBLIC_ENDPOINT_URL') or None,  # endpoint in URLs given to clients
+    'access_key': os.getenv('S3_ACCESS_KEY_ID') or None,
+    'secret_key': os.getenv('S3_SECRET_ACCESS_KEY') or None,
+    'region_name': os.getenv('S3_REGION', 'us-east-1'),
+    'addressing_style': 'path' if os.getenv('S3_ENDPOINT_URL') else None,
+    'signature_version': 's3v4',
+    'default_acl': None,
+    'file_overwrite': False,
+    'querystring_expire': int(os.getenv('S3_URL_EXPIRE_SECONDS', 3600)),
+}
+STORAGES = {
+    'default': (
+        {'BACKEND': 'api.storage.S3MediaStorage', 'OPTIONS': MEDIA_S3_OPTIONS}
+        if MEDIA_STORAGE == 's3' else
+        {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
+    ),
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Presigned direct uploads to the bucket expire after this long
+DIRECT_UPLOAD_EXPIRE_SECONDS = int(os.getenv('DIRECT_UPLOAD_EXPIRE_SECONDS', 900))
+
 # Static files configuration
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -168,6 +265,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Custom user model
 AUTH_USER_MODEL = 'api.User'
 
+# Password hashing: PBKDF2 rounds per hash (0 keeps Django's default). Each login
+# pays one hash; stored hashes are re-hashed at the new cost on their next login.
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 0))
+PASSWORD_HASHERS = [
+    'api.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -196,8 +304,55 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # AI Model settings
 ML_MODELS_PATH = os.path.join(BASE_DIR,'api', 'ml_models')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# 'stub' answers locally after LLM_STUB_LATENCY_MS instead of calling Gemini (benchmarks, offline work)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+LLM_STUB_LATENCY_MS = int(os.getenv('LLM_STUB_LATENCY_MS', 0))
+# A failed LLM explanation is retried on its own (predictions are kept) with exponential
+# backoff and full jitter, base LLM_RETRY_BACKOFF_SECONDS, capped per attempt
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 5))
+LLM_RETRY_BACKOFF_SECONDS = int(os.getenv('LLM_RETRY_BACKOFF_SECONDS', 5))
+LLM_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv('LLM_RETRY_BACKOFF_MAX_SECONDS', 300))
 FERTILIZER_LABELS_PATH = os.path.join(ML_MODELS_PATH, 'fertilizer_labels.json')
 CROP_LABELS_PATH = os.path.join(ML_MODELS_PATH, 'crop_labels.json')
 CROP_MODEL_PATH = os.path.join(ML_MODELS_PATH, 'crop_model.joblib')
 FERTILIZER_MODEL_PATH = os.path.join(ML_MODELS_PATH, 'fertilizer_recom.pkl')
 DISEASE_MODEL_PATH = os.path.join(ML_MODELS_PATH, 'best_model.keras')
+
+# Tabular model runtime: 'sklearn' unpickles the estimators above, 'numpy' uses the
+# flattened tree ensembles written by `python manage.py export_tabular_models`.
+TABULAR_MODEL_RUNTIME = os.getenv('TABULAR_MODEL_RUNTIME', 'sklearn')
+CROP_MODEL_FLAT_PATH = os.path.join(ML_MODELS_PATH, 'crop_model.flat')
+FERTILIZER_MODEL_FLAT_PATH = os.path.join(ML_MODELS_PATH, 'fertilizer_recom.flat')
+
+# Disease model runtime: 'keras' loads best_model.keras, 'tflite' uses the quantized
+# model written by `python manage.py export_disease_model`.
+DISEASE_MODEL_RUNTIME = os.getenv('DISEASE_MODEL_RUNTIME', 'keras')
+DISEASE_TFLITE_MODEL_PATH = os.path.join(ML_MODELS_PATH, 'best_model.tflite')
+# CPU threads used per inference call (0 keeps the TensorFlow default)
+INFERENCE_INTRA_OP_THREADS = int(os.getenv('INFERENCE_INTRA_OP_THREADS', 0))
+INFERENCE_INTER_OP_THREADS = int(os.getenv('INFERENCE_INTER_OP_THREADS', 0))
+
+# Load fork-safe models in the gunicorn master / Celery parent so workers share them
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'
+
+# Versioned model registry (see api/model_registry.py); workers re-check the
+# active version of each model at most every MODEL_REGISTRY_POLL_SECONDS.
+MODEL_REGISTRY_PATH = os.getenv('MODEL_REGISTRY_PATH', os.path.join(ML_MODELS_PATH, 'registry'))
+MODEL_REGISTRY_POLL_SECONDS = int(os.getenv('MODEL_REGISTRY_POLL_SECONDS', 10))
+
+# Prometheus: the web app serves /metrics; Celery workers expose theirs on this
+# port (0 disables). Set PROMETHEUS_MULTIPROC_DIR to aggregate prefork processes.
+CELERY_METRICS_PORT = int(os.getenv('CELERY_METRICS_PORT', 0))
+# Bearer token Prometheus must send to scrape /metrics (unset: the endpoint answers 404)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# OpenTelemetry tracing (see api/tracing.py): 'none', 'file', 'console' or 'otlp'
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none')
+TRACING_FILE_PATH = os.getenv('TRACING_FILE_PATH', os.path.join(BASE_DIR, 'traces.jsonl'))
+TRACING_SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'gardien-eveille')
+
+# Admins can profile a single request by sending this header (see api/middleware.py)
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+PROFILING_HEADER = os.getenv('PROFILING_HEADER', 'X-Profile')
+PROFILING_TTL_SECONDS = int(os.getenv('PROFILING_TTL_SECONDS', 3600))
+PROFILING_SUMMARY_LINES = 60
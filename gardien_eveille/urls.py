@@ -10,7 +10,7 @@ from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularSwaggerView,
 )
-from api.views import MLModelViewSet
+from api.views import MLModelViewSet, metrics_view
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
@@ -18,6 +18,7 @@ router.register(r'ml', MLModelViewSet, basename='ml')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
 
     # API routes
     path('api/v1/', include('api.urls')),
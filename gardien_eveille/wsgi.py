@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gardien_eveille.settings')
 
 application = get_wsgi_application()
+
+# With gunicorn's preload_app (see gunicorn.conf.py) this runs once in the
+# master, so workers inherit the models instead of loading their own copy.
+from django.conf import settings  # noqa: E402
+
+if settings.PRELOAD_MODELS:
+    from api.inference import preload_models
+
+    preload_models()
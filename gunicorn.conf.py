@@ -0,0 +1,17 @@
+import multiprocessing
+import os
+
+# Import the Django app (and preload the ML models, see gardien_eveille/wsgi.py)
+# in the master process so forked workers share those pages copy-on-write.
+preload_app = True
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from the shared Prometheus directory
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)